@@ -0,0 +1,182 @@
+"""Chave de acesso da NF-e/NFC-e (44 dígitos).
+
+Toda NF-e e NFC-e tem uma chave de acesso, impressa (em grupos de 4 dígitos)
+e codificada no QR Code:
+
+    cUF(2) AAMM(4) CNPJ(14) modelo(2) série(3) número(9) tpEmis(1) código(8) DV(1)
+
+O último dígito é o verificador em módulo 11 (pesos 2 a 9 da direita para a
+esquerda), então uma chave lida com erro pelo OCR é descartada. Da chave
+saem, sem chamada ao Gemini, o CNPJ do emissor, a série e o número da nota,
+além do modelo (55 NF-e, 65 NFC-e), da UF e do ano/mês de emissão.
+
+A chave é procurada no texto do OCR; sem ela, o QR Code é lido da imagem
+com pyzbar ou OpenCV, quando instalados (ACCESS_KEY_QR=0 desativa).
+"""
+import io
+import logging
+import os
+import re
+
+from invoice_rules import valid_cnpj
+
+ACCESS_KEY_QR = os.getenv('ACCESS_KEY_QR', '1') == '1'
+
+MODELOS = {"55": "NF-e", "65": "NFC-e"}
+UFS = {
+    "11": "RO", "12": "AC", "13": "AM", "14": "RR", "15": "PA", "16": "AP", "17": "TO",
+    "21": "MA", "22": "PI", "23": "CE", "24": "RN", "25": "PB", "26": "PE", "27": "AL",
+    "28": "SE", "29": "BA", "31": "MG", "32": "ES", "33": "RJ", "35": "SP", "41": "PR",
+    "42": "SC", "43": "RS", "50": "MS", "51": "MT", "52": "GO", "53": "DF",
+}
+
+# Sequências de dígitos separados por espaços ou pontos (a chave impressa em
+# grupos de 4 ou seguida); o QR Code traz a chave inteira na URL
+DIGIT_RUN = re.compile(r'\d(?:[ .]?\d){43,}')
+QR_KEY = re.compile(r'(?<!\d)\d{44}(?!\d)')
+
+_qr_reader = None
+
+
+def check_digit(digitos):
+    """Dígito verificador (módulo 11) dos 43 primeiros dígitos da chave."""
+    soma = sum(int(d) * (2 + i % 8) for i, d in enumerate(reversed(digitos)))
+    resto = soma % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def valid_access_key(chave):
+    if len(chave) != 44 or not chave.isdigit():
+        return False
+    if chave[:2] not in UFS or chave[20:22] not in MODELOS or not 1 <= int(chave[4:6]) <= 12:
+        return False
+    return check_digit(chave[:43]) == chave[43]
+
+
+def find_access_key(text):
+    """Primeira chave de acesso válida no texto, ou None.
+
+    Sequências maiores que 44 dígitos (a chave colada a outro número pelo
+    OCR) são testadas em cada posição.
+    """
+    for match in DIGIT_RUN.finditer(text or ''):
+        digitos = re.sub(r'\D', '', match.group())
+        for inicio in range(len(digitos) - 43):
+            if valid_access_key(digitos[inicio:inicio + 44]):
+                return digitos[inicio:inicio + 44]
+    return None
+
+
+def _load_qr_reader():
+    # pyzbar (libzbar) e OpenCV são opcionais; sem eles não há leitura do QR Code
+    try:
+        from pyzbar.pyzbar import decode, ZBarSymbol
+
+        def ler(imagem):
+            return [simbolo.data.decode('utf-8', 'ignore') for simbolo in decode(imagem, symbols=[ZBarSymbol.QRCODE])]
+        return ler
+    except ImportError:
+        pass
+    try:
+        import cv2
+        import numpy as np
+
+        detector = cv2.QRCodeDetector()
+
+        def ler(imagem):
+            dados, _, _ = detector.detectAndDecode(np.asarray(imagem.convert('L')))
+            return [dados] if dados else []
+        return ler
+    except ImportError:
+        logging.warning(
+            "ACCESS_KEY_QR=1, mas a leitura do QR Code está desativada: "
+            "instale requirements-qr.txt (pyzbar ou opencv-python-headless)"
+        )
+        return None
+
+
+def read_qr_access_key(conteudo):
+    """Chave de acesso do QR Code da imagem, ou None."""
+    global _qr_reader
+    if not ACCESS_KEY_QR:
+        return None
+    if _qr_reader is None:
+        _qr_reader = _load_qr_reader() or False
+    if not _qr_reader:
+        return None
+    try:
+        from PIL import Image, ImageOps
+        imagem = ImageOps.exif_transpose(Image.open(io.BytesIO(conteudo)))
+        conteudos = _qr_reader(imagem)
+    except Exception as e:
+        logging.warning(f"Falha ao ler o QR Code: {e}")
+        return None
+    for dados in conteudos:
+        for match in QR_KEY.finditer(dados):
+            if valid_access_key(match.group()):
+                return match.group()
+    return None
+
+
+def format_cnpj(digitos):
+    return f"{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}"
+
+
+def decode_access_key(chave):
+    """Partes da chave de acesso já validada."""
+    return {
+        "chave": chave,
+        "uf": UFS[chave[:2]],
+        "ano_mes": f"20{chave[2:4]}-{chave[4:6]}",
+        "cnpj": chave[6:20],
+        "modelo": MODELOS[chave[20:22]],
+        "serie": str(int(chave[22:25])),
+        "numero": str(int(chave[25:34])),
+        "tipo_emissao": chave[34],
+    }
+
+
+def access_key_fields(dados):
+    """Campos da nota preenchidos pela chave decodificada.
+
+    Emitentes pessoa física têm o CPF no lugar do CNPJ (com zeros à
+    esquerda); nesse caso o CNPJ fica para as outras etapas.
+    """
+    campos = {"serie_nota_fiscal": dados["serie"], "numero_nota_fiscal": dados["numero"]}
+    if valid_cnpj(dados["cnpj"]):
+        campos["CNPJ_emissor"] = format_cnpj(dados["cnpj"])
+    return campos
+
+
+# Datas numéricas: D/M/AA(AA) com / - ou . e AAAA-MM-DD
+DATA_DMA = re.compile(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})')
+DATA_ISO = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+
+
+def parse_year_month(data_emissao):
+    """(ano com 2 dígitos, mês) da data, ou None quando ela não é reconhecida."""
+    texto = (data_emissao or '').strip()
+    match = DATA_DMA.fullmatch(texto)
+    if match:
+        dia, mes, ano = match.groups()
+    else:
+        match = DATA_ISO.fullmatch(texto)
+        if not match:
+            return None
+        ano, mes, dia = match.groups()
+    if not (1 <= int(dia) <= 31 and 1 <= int(mes) <= 12):
+        return None
+    return int(ano) % 100, int(mes)
+
+
+def date_outside_key(data_emissao, dados):
+    """Se a data é reconhecida e está fora do ano/mês da chave.
+
+    A chave só tem os dois últimos dígitos do ano. Datas em outro formato
+    (por extenso, por exemplo) não são descartadas.
+    """
+    ano_mes = parse_year_month(data_emissao)
+    if ano_mes is None:
+        return False
+    ano, mes = dados["ano_mes"][2:].split('-')
+    return ano_mes != (int(ano), int(mes))
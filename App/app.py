@@ -1,26 +1,149 @@
-from flask import Flask, request, jsonify, render_template
-import boto3
+from flask import Flask, Response, request, jsonify, render_template
 import logging
 import os
+import importlib
 import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 import google.generativeai as genai
+from cache import cache_from_env, content_key
+from jobs import JobManager
+from batching import MicroBatcher
+from invoice_rules import extract_rule_fields, validate_rule_fields, validate_field
+from uploads import prepare_document, release_document, upload_key
+from preprocess import PREPROCESS_IMAGES, preprocess_image, settings_key
+from prompt_compaction import PROMPT_COMPACTION, compact_text
+from access_key import access_key_fields, date_outside_key, decode_access_key, find_access_key, read_qr_access_key
+from invoice_store import LIMITE_PAGINA, cents, iso_date, store_from_env
+from dedup import PHASH_DEDUP, PHASH_INDEX_FILE, PersistentHammingIndex, image_hashes
+from textract_blocks import parse_response, parse_expense_response
+from metrics import registry, CONTENT_TYPE
+from backends import BackendRegistry
+from aws_clients import create_client, is_throttle_error
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 app = Flask(__name__)
 
-# Configurações do AWS
-s3_client = boto3.client('s3')
-textract_client = boto3.client('textract')
+# Clientes da AWS e modelo do Gemini: criados no primeiro uso, e não na
+# importação, para o servidor subir sem esperar por eles
+s3_client = None
+textract_client = None
+gemini_model = None
+_clients_lock = threading.Lock()
+
+def get_s3_client():
+    global s3_client
+    with _clients_lock:
+        if s3_client is None:
+            s3_client = create_client('s3')
+    return s3_client
+
+def get_textract_client():
+    global textract_client
+    with _clients_lock:
+        if textract_client is None:
+            textract_client = create_client('textract')
+    return textract_client
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 
+# Métricas do pipeline, expostas em /metrics no formato texto do Prometheus
+REQUEST_SECONDS = registry.histogram('invoice_request_seconds', 'Duração das requisições a /api/v1/invoice', ('modo',))
+FIRST_RESULT_SECONDS = registry.histogram('invoice_stream_first_result_seconds', 'Tempo até o primeiro resultado enviado no modo streaming')
+REQUESTS = registry.counter('invoice_requests_total', 'Requisições a /api/v1/invoice por código de status', ('status',))
+RECEIVED_BYTES = registry.counter('invoice_received_bytes_total', 'Bytes recebidos nos arquivos enviados')
+UPLOAD_BYTES = registry.counter('invoice_upload_bytes_total', 'Bytes enviados à AWS, direto ao Textract ou pelo S3', ('envio',))
+QUEUE_SECONDS = registry.histogram('invoice_queue_seconds', 'Espera de cada arquivo na fila antes do processamento')
+FILE_SECONDS = registry.histogram('invoice_file_seconds', 'Duração do processamento de cada arquivo')
+FILES = registry.counter('invoice_files_total', 'Arquivos processados por resultado (sucesso, nulo ou erro)', ('resultado',))
+CACHE_LOOKUPS = registry.counter('invoice_cache_total', 'Consultas ao cache de resultados', ('resultado',))
+TEXTRACT_SECONDS = registry.histogram('invoice_textract_seconds', 'Duração das chamadas ao Textract')
+TEXTRACT_REQUESTS = registry.counter('invoice_textract_requests_total', 'Chamadas ao Textract por resultado (sucesso, falha ou cota)', ('resultado',))
+OCR_CHARACTERS = registry.counter('invoice_ocr_characters_total', 'Caracteres de texto devolvidos pelo Textract')
+GEMINI_SECONDS = registry.histogram('invoice_gemini_seconds', 'Duração das chamadas ao Gemini', ('tipo',))
+GEMINI_REQUESTS = registry.counter('invoice_gemini_requests_total', 'Chamadas ao Gemini por tipo e resultado', ('tipo', 'resultado'))
+GEMINI_JSON_SECONDS = registry.histogram(
+    'invoice_gemini_json_seconds', 'Duração da limpeza e leitura do JSON devolvido pelo Gemini',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05),
+)
+GEMINI_JSON_ERRORS = registry.counter('invoice_gemini_json_errors_total', 'Respostas do Gemini que não são JSON válido')
+PROMPT_TOKENS = registry.histogram(
+    'invoice_prompt_tokens', 'Tokens estimados do texto da nota no prompt, antes e depois da compactação', ('etapa',),
+    buckets=(50, 100, 200, 300, 500, 750, 1000, 1500, 2500, 5000),
+)
+NULL_FALLBACKS = registry.counter('invoice_null_fallback_total', 'Extrações que terminaram com os campos nulos após falha no Gemini')
+GEMINI_REASKS = registry.counter(
+    'invoice_gemini_reask_fields_total', 'Campos do Gemini reprovados na validação local e pedidos de novo, por resultado',
+    ('campo', 'resultado'),
+)
+ACCESS_KEYS = registry.counter(
+    'invoice_access_keys_total', 'Chaves de acesso das notas por origem (texto do OCR, QR Code ou ausente)', ('origem',),
+)
+# Chamadas ao Gemini por nota = invoice_gemini_requests_total / invoice_llm_invoices_total
+LLM_INVOICES = registry.counter('invoice_llm_invoices_total', 'Notas extraídas pelos backends que usam o Gemini', ('backend',))
+PREPROCESS_SECONDS = registry.histogram('invoice_preprocess_seconds', 'Duração do pré-processamento das imagens')
+PREPROCESS_SAVED_BYTES = registry.counter('invoice_preprocess_saved_bytes_total', 'Bytes economizados pelo pré-processamento das imagens')
+PHASH_SECONDS = registry.histogram('invoice_phash_seconds', 'Duração do cálculo dos hashes perceptuais')
+PHASH_MATCHES = registry.counter('invoice_phash_matches_total', 'Notas respondidas com o resultado de uma foto quase igual')
+EXPENSE_FIELDS = registry.counter(
+    'invoice_expense_fields_total',
+    'Campos do AnalyzeExpense por resultado (aceito, baixa_confianca, invalido, ausente)',
+    ('campo', 'resultado'),
+)
+
 # Configurar Gemini
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-gemini_model = genai.GenerativeModel('gemini-1.5-pro-latest')
+GEMINI_MODEL_NAME = 'gemini-1.5-pro-latest'
+
+def get_gemini_model():
+    global gemini_model
+    with _clients_lock:
+        if gemini_model is None:
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+            gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return gemini_model
+
+# Processamento paralelo dos arquivos (Textract -> Gemini)
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', 8))
+FILE_TIMEOUT = float(os.getenv('FILE_TIMEOUT', 60))
+# Tempo limite de cada chamada ao Gemini; o Textract e o S3 usam
+# AWS_CONNECT_TIMEOUT/AWS_READ_TIMEOUT (aws_clients.py)
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', 30))
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='nota')
+
+BUCKET_NAME = "testandocriarbuckernomeusss"
+
+# EXTRACTION_MODE: backend de extração usado quando a requisição não escolhe
+# outro (veja backend_registry abaixo). "gemini" envia todos os campos ao
+# Gemini; "tiered" aplica as regras locais primeiro e só pede ao Gemini os
+# campos pendentes
+EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', 'gemini')
+
+DESCRICAO_CAMPOS = {
+    "nome_emissor": "Nome completo do emissor com razão social",
+    "CNPJ_emissor": "CNPJ com 14 dígitos (formatado ou não)",
+    "endereco_emissor": "Endereço completo com tipo de logradouro",
+    "CNPJ_CPF_consumidor": "São os números do CPF de um consumidor se mencionado",
+    "data_emissao": "Data em DD/MM/AAAA ou DD-MM-AAAA",
+    "numero_nota_fiscal": "Número geralmente com 6-9 dígitos",
+    "serie_nota_fiscal": "Série (1, 101, etc)",
+    "valor_total": "Maior valor em R$ ",
+    "forma_pgto": "Forma de pagamento (Dinheiro, Cartão, etc)",
+}
+CAMPOS_NOTA = tuple(DESCRICAO_CAMPOS)
+
+def format_campos(campos):
+    return "".join(f"\n    - {campo}: {DESCRICAO_CAMPOS[campo]}" for campo in campos)
+
+CAMPOS_REQUERIDOS = format_campos(CAMPOS_NOTA)
 
 def format_gemini_prompt(context):
     return f"""
@@ -30,98 +153,937 @@ def format_gemini_prompt(context):
     Texto:
     {context}
 
-    Campos requeridos:
-    - nome_emissor: Nome completo do emissor com razão social
-    - CNPJ_emissor: CNPJ com 14 dígitos (formatado ou não)
-    - endereco_emissor: Endereço completo com tipo de logradouro
-    - CNPJ_CPF_consumidor: São os números do CPF de um consumidor se mencionado
-    - data_emissao: Data em DD/MM/AAAA ou DD-MM-AAAA
-    - numero_nota_fiscal: Número geralmente com 6-9 dígitos
-    - serie_nota_fiscal: Série (1, 101, etc)
-    - valor_total: Maior valor em R$ 
-    - forma_pgto: Forma de pagamento (Dinheiro, Cartão, etc)
+    Campos requeridos:{CAMPOS_REQUERIDOS}
+    """
+
+# Prompt reduzido, usado quando as regras locais já resolveram parte dos campos
+def format_gemini_fields_prompt(context, campos):
+    return f"""
+    Analise este texto extraído de uma nota fiscal e extraia apenas os campos abaixo em formato JSON.
+    Retorne APENAS o JSON sem comentários ou formatação adicional. Use null para campos não encontrados.
+
+    Texto:
+    {context}
+
+    Campos requeridos:{format_campos(campos)}
+    """
+
+# Campos pedidos em um lote: os de todas as notas, na ordem de CAMPOS_NOTA
+def batch_fields(itens):
+    return tuple(campo for campo in CAMPOS_NOTA if any(campo in campos for _, campos in itens))
+
+# Prompt com várias notas: as instruções vão uma única vez e cada texto é
+# delimitado por "### NOTA <n> ###". Cada item é (texto, campos); uma nota que
+# precisa só de parte dos campos do lote traz a lista após o delimitador
+def format_gemini_batch_prompt(itens):
+    campos_lote = batch_fields(itens)
+    linhas = []
+    for i, (context, campos) in enumerate(itens, start=1):
+        linhas.append(f"    ### NOTA {i} ###")
+        if set(campos) != set(campos_lote):
+            linhas.append(f"    (extraia desta nota apenas: {', '.join(campos)}; use null nos demais campos)")
+        linhas.append(f"    {context}")
+    textos = "\n".join(linhas)
+    return f"""
+    Analise os textos abaixo, cada um extraído de uma nota fiscal diferente e delimitado por "### NOTA <n> ###".
+    Para cada nota, extraia as seguintes informações em formato JSON.
+    Retorne APENAS um array JSON com um objeto por nota, sem comentários ou formatação adicional.
+    Cada objeto deve ter o campo "nota" com o número <n> do delimitador e os campos requeridos. Use null para campos não encontrados.
+
+    Textos:
+{textos}
+    ### FIM DAS NOTAS ###
+
+    Campos requeridos:{format_campos(campos_lote)}
     """
 
+# Versão do prompt/modelo: muda sempre que o texto do prompt ou o modelo mudam,
+# invalidando os resultados do Gemini guardados em cache
+PROMPT_VERSION = content_key(
+    GEMINI_MODEL_NAME,
+    format_gemini_prompt('{context}'),
+    'json-validado',
+    'chave-acesso',
+    *(['compactado'] if PROMPT_COMPACTION else []),
+)[:16]
+
+# Cache de resultados (memória + disco) indexado pelo hash dos bytes enviados
+result_cache = cache_from_env()
+
+# Com o pré-processamento ligado, o OCR (e o que vem dele) depende da
+# configuração das etapas, que entra nas chaves de cache
+PREPROCESS_KEY = f":{settings_key()}" if PREPROCESS_IMAGES else ''
+
+# Fotos quase iguais de notas já extraídas (PHASH_DEDUP=1; veja dedup.py)
+phash_index = PersistentHammingIndex(PHASH_INDEX_FILE) if PHASH_DEDUP else None
+
+# Notas extraídas guardadas em SQLite para consulta (INVOICE_DB; veja invoice_store.py)
+invoice_store = store_from_env()
+
+def result_key(digest, backend):
+    return f"nota:{digest}:{backend}:{PROMPT_VERSION}{PREPROCESS_KEY}"
+
+# Resultado guardado da foto mais parecida já extraída com o mesmo backend
+def find_similar_result(hashes, backend):
+    for distancia, entrada in phash_index.search(hashes):
+        cached = result_cache.get(result_key(entrada["digest"], backend))
+        if cached is not None:
+            return cached, {"arquivo": entrada["arquivo"], "enviado_em": entrada["enviado_em"], "distancia": distancia}
+    return None, None
+
+# Reduz a imagem antes do envio (PREPROCESS_IMAGES=1; veja preprocess.py)
+def prepare_image(filename, conteudo):
+    if not PREPROCESS_IMAGES:
+        return conteudo
+    with PREPROCESS_SECONDS.time():
+        enviado, resumo = preprocess_image(conteudo)
+    economia = resumo["bytes_original"] - resumo["bytes_enviados"]
+    PREPROCESS_SAVED_BYTES.inc(economia)
+    if resumo["processada"]:
+        logging.info(
+            f"{filename}: {resumo['bytes_original']} -> {resumo['bytes_enviados']} bytes "
+            f"({economia / resumo['bytes_original']:.0%} a menos) após o pré-processamento"
+        )
+    return enviado
+
 # Função para extrair o texto da imagem com Textract
-def extract_text_from_image(bucket_name, object_name):
+def extract_text_from_image(document):
     try:
-        response = textract_client.detect_document_text(
-            Document={'S3Object': {'Bucket': bucket_name, 'Name': object_name}}
-        )
-        text = ""
-        for item in response.get('Blocks', []):
-            if item.get('BlockType') == "LINE":
-                text += item.get('Text', '') + "\n"
+        with TEXTRACT_SECONDS.time():
+            response = get_textract_client().detect_document_text(Document=document)
+        text = parse_response(response).text()
+        TEXTRACT_REQUESTS.labels("sucesso").inc()
+        OCR_CHARACTERS.inc(len(text))
         return text
     except Exception as e:
+        TEXTRACT_REQUESTS.labels("cota" if is_throttle_error(e) else "falha").inc()
         logging.error(f"Erro ao extrair texto com Textract: {e}")
         return None
 
+# AnalyzeExpense: além do texto, devolve os campos resumidos (emissor, total,
+# data...) com a confiança de cada um
+def analyze_expense(document):
+    try:
+        with TEXTRACT_SECONDS.time():
+            response = get_textract_client().analyze_expense(Document=document)
+        expense = parse_expense_response(response)
+        text = expense.text()
+        TEXTRACT_REQUESTS.labels("sucesso").inc()
+        OCR_CHARACTERS.inc(len(text))
+        if not text and not expense.summary_fields:
+            return None
+        return {"texto": text, "campos": expense.summary_fields}
+    except Exception as e:
+        TEXTRACT_REQUESTS.labels("cota" if is_throttle_error(e) else "falha").inc()
+        logging.error(f"Erro ao analisar despesa com Textract: {e}")
+        return None
+
+def empty_invoice_info():
+    return dict.fromkeys(CAMPOS_NOTA)
+
+def clean_json_response(response_text):
+    return response_text.strip().replace('```json', '').replace('```', '')
+
+# Saída estruturada: o Gemini responde JSON no esquema dos campos pedidos
+# (strings ou null), sem texto ou blocos de código em volta
+def field_schema(campos):
+    return {
+        "type": "object",
+        "properties": {
+            campo: {"type": "string", "nullable": True, "description": DESCRICAO_CAMPOS[campo]}
+            for campo in campos
+        },
+        "required": list(campos),
+    }
+
+@lru_cache(maxsize=None)
+def json_config(campos=CAMPOS_NOTA, lote=False):
+    schema = field_schema(campos)
+    if lote:
+        schema["properties"] = {"nota": {"type": "integer"}, **schema["properties"]}
+        schema["required"] = ["nota", *schema["required"]]
+        schema = {"type": "array", "items": schema}
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+
+# Chamada ao Gemini com tempo e resultado registrados por tipo de prompt
+# ("nota", "lote", "campos" ou "correcao")
+def generate_content(prompt, tipo, generation_config=None):
+    try:
+        with GEMINI_SECONDS.labels(tipo).time():
+            response = get_gemini_model().generate_content(
+                prompt, generation_config=generation_config, request_options={"timeout": GEMINI_TIMEOUT},
+            )
+    except Exception:
+        GEMINI_REQUESTS.labels(tipo, "falha").inc()
+        raise
+    GEMINI_REQUESTS.labels(tipo, "sucesso").inc()
+    return response
+
+def parse_gemini_json(response_text):
+    try:
+        with GEMINI_JSON_SECONDS.time():
+            return json.loads(clean_json_response(response_text))
+    except ValueError:
+        GEMINI_JSON_ERRORS.inc()
+        raise
+
+def normalize_field_value(campo, valor):
+    valor = str(valor).strip()
+    if campo == "valor_total":
+        valor = valor.replace('R$', '').strip()
+    elif campo == "nome_emissor":
+        valor = valor.rstrip('.').strip()
+    elif campo == "data_emissao":
+        iso = re.fullmatch(r'(\d{4})-(\d{2})-(\d{2})', valor)
+        if iso:
+            valor = f"{iso.group(3)}/{iso.group(2)}/{iso.group(1)}"
+    return valor
+
+# Campos do Gemini conferidos localmente (dígitos verificadores, data, valor).
+# Um valor reprovado é pedido de novo sozinho, com um prompt curto, em vez de
+# repetir a nota inteira; o que continuar inválido vira null
+CAMPOS_VALIDADOS_LLM = ("CNPJ_emissor", "CNPJ_CPF_consumidor", "data_emissao", "valor_total")
+GEMINI_REASK_ATTEMPTS = int(os.getenv('GEMINI_REASK_ATTEMPTS', 1))
+
+def format_gemini_reask_prompt(context, invalidos):
+    campos = "".join(
+        f"\n    - {campo}: {DESCRICAO_CAMPOS[campo]} (valor lido antes, inválido: {json.dumps(valor, ensure_ascii=False)})"
+        for campo, valor in invalidos.items()
+    )
+    return f"""
+    Os campos abaixo foram lidos incorretamente deste texto de nota fiscal. Extraia de novo apenas esses campos, no formato indicado.
+    Use null se o campo não estiver no texto.
+
+    Texto:
+    {context}
+
+    Campos:{campos}
+    """
+
+def invalid_llm_fields(dados):
+    invalidos = {}
+    for campo in CAMPOS_VALIDADOS_LLM:
+        if dados.get(campo) is None:
+            continue
+        valor = normalize_field_value(campo, dados[campo])
+        if validate_field(campo, valor):
+            dados[campo] = valor
+        else:
+            invalidos[campo] = dados[campo]
+    return invalidos
+
+# Confere os campos devolvidos pelo Gemini e pede de novo os reprovados
+def validate_llm_fields(text, dados):
+    invalidos = invalid_llm_fields(dados)
+    reprovados = list(invalidos)
+    for _ in range(GEMINI_REASK_ATTEMPTS):
+        if not invalidos:
+            break
+        campos = tuple(invalidos)
+        try:
+            prompt = format_gemini_reask_prompt(prompt_context(text, campos), invalidos)
+            resposta = parse_gemini_json(generate_content(prompt, "correcao", json_config(campos)).text)
+        except Exception as e:
+            logging.warning(f"Falha ao pedir de novo {', '.join(campos)} ao Gemini: {e}")
+            break
+        for campo in campos:
+            dados[campo] = resposta.get(campo)
+        invalidos = invalid_llm_fields(dados)
+
+    for campo in reprovados:
+        if campo in invalidos:
+            dados[campo] = None
+            GEMINI_REASKS.labels(campo, "descartado").inc()
+        else:
+            GEMINI_REASKS.labels(campo, "corrigido" if dados[campo] is not None else "nulo").inc()
+    return dados
+
 def extract_invoice_info(text):
     try:
         prompt = format_gemini_prompt(text)
-        response = gemini_model.generate_content(prompt)
-        
-        # Extrair conteúdo JSON da resposta
-        json_str = response.text.strip().replace('```json', '').replace('```', '')
-        return json.loads(json_str)
-        
+        response = generate_content(prompt, "nota", json_config())
+        dados = parse_gemini_json(response.text)
+        return {campo: dados.get(campo) for campo in CAMPOS_NOTA}
+
     except Exception as e:
         logging.error(f"Erro no Gemini: {e}")
-        return {
-            "nome_emissor": None,
-            "CNPJ_emissor": None,
-            "endereco_emissor": None,
-            "CNPJ_CPF_consumidor": None,
-            "data_emissao": None,
-            "numero_nota_fiscal": None,
-            "serie_nota_fiscal": None,
-            "valor_total": None,
-            "forma_pgto": None
+        NULL_FALLBACKS.inc()
+        return empty_invoice_info()
+
+# Extrai apenas os campos pedidos, com um prompt que lista somente esses campos
+def extract_fields_info(context, campos):
+    try:
+        prompt = format_gemini_fields_prompt(context, campos)
+        dados = parse_gemini_json(generate_content(prompt, "campos", json_config(tuple(campos))).text)
+        return {campo: dados.get(campo) for campo in campos}
+    except Exception as e:
+        logging.error(f"Erro no Gemini: {e}")
+        NULL_FALLBACKS.inc()
+        return dict.fromkeys(campos)
+
+# Uma nota sozinha: prompt completo ou só com os campos pedidos
+def extract_item(context, campos):
+    if set(campos) == set(CAMPOS_NOTA):
+        return extract_invoice_info(context)
+    return extract_fields_info(context, campos)
+
+# Lê o array JSON devolvido para um lote; notas ausentes ou inválidas ficam como None
+def parse_gemini_batch(response_text, quantidade):
+    dados = parse_gemini_json(response_text)
+    if not isinstance(dados, list):
+        raise ValueError("A resposta do lote não é um array JSON")
+
+    resultados = [None] * quantidade
+    for posicao, item in enumerate(dados):
+        if not isinstance(item, dict):
+            continue
+        nota = item.pop("nota", posicao + 1)
+        try:
+            indice = int(nota) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= indice < quantidade and resultados[indice] is None:
+            resultados[indice] = {campo: item.get(campo) for campo in CAMPOS_NOTA}
+    return resultados
+
+# Extrai várias notas com uma única chamada ao Gemini; cada item é (texto, campos)
+# e recebe só os seus campos. Se a resposta do lote não puder ser interpretada,
+# as notas que faltarem são processadas individualmente.
+def extract_invoice_info_batch(itens):
+    if len(itens) == 1:
+        return [extract_item(*itens[0])]
+
+    try:
+        response = generate_content(format_gemini_batch_prompt(itens), "lote", json_config(batch_fields(itens), lote=True))
+        resultados = parse_gemini_batch(response.text, len(itens))
+    except Exception as e:
+        logging.warning(f"Resposta do lote inválida, processando {len(itens)} notas individualmente: {e}")
+        resultados = [None] * len(itens)
+
+    return [
+        {campo: resultado[campo] for campo in campos} if resultado is not None else extract_item(context, campos)
+        for (context, campos), resultado in zip(itens, resultados)
+    ]
+
+# Estimativa grosseira de tokens (~4 caracteres por token) usada no limite do lote
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+# Modo em lote: GEMINI_BATCH_SIZE > 1 agrupa as notas que chegam ao mesmo tempo
+# (inclusive de requisições diferentes) em uma única chamada ao Gemini
+GEMINI_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', 1))
+gemini_batcher = None
+if GEMINI_BATCH_SIZE > 1:
+    gemini_batcher = MicroBatcher(
+        extract_invoice_info_batch,
+        max_batch_size=GEMINI_BATCH_SIZE,
+        max_wait=float(os.getenv('GEMINI_BATCH_WAIT', 0.2)),
+        max_batch_cost=int(os.getenv('GEMINI_BATCH_TOKENS', 24000)),
+        cost=lambda item: estimate_tokens(item[0]),
+        executor=ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='gemini-lote'),
+        name='gemini-batcher',
+    )
+
+# Pedido de uma nota ao Gemini, pelo lote quando ele está ativo
+def request_fields(context, campos=CAMPOS_NOTA):
+    item = (context, tuple(campos))
+    if gemini_batcher is not None:
+        return gemini_batcher.submit(item).result()
+    return extract_item(*item)
+
+# Texto da nota que vai ao prompt: com PROMPT_COMPACTION=1, só as partes
+# relevantes para os campos pedidos (veja prompt_compaction.py)
+def prompt_context(text, campos=CAMPOS_NOTA):
+    if not PROMPT_COMPACTION:
+        return text
+    compactado = compact_text(text, campos)
+    antes, depois = estimate_tokens(text), estimate_tokens(compactado)
+    PROMPT_TOKENS.labels("original").observe(antes)
+    PROMPT_TOKENS.labels("compactado").observe(depois)
+    logging.info(f"Prompt compactado: ~{antes} -> ~{depois} tokens ({len(campos)} campos)")
+    return compactado
+
+# Extrai os campos pedidos (todos ou só os pendentes) e confere o que o Gemini devolveu
+def extract_missing_fields(text, campos):
+    dados = request_fields(prompt_context(text, campos), campos)
+    return validate_llm_fields(text, dados)
+
+# Chave de acesso da nota no texto (veja access_key.py), já decodificada
+def access_key_info(text):
+    chave = find_access_key(text)
+    return decode_access_key(chave) if chave else None
+
+# CNPJ do emissor, série e número tirados da chave de acesso: não vão ao Gemini
+def access_key_known_fields(text):
+    dados = access_key_info(text)
+    return access_key_fields(dados) if dados else {}
+
+# Extração em camadas: as regras locais resolvem o que conseguem (com validação
+# de dígitos verificadores, datas e valores) e o Gemini só é chamado para os
+# campos que faltarem ou não passarem na validação
+def extract_invoice_info_tiered(text):
+    LLM_INVOICES.labels("tiered").inc()
+    conhecidos = access_key_known_fields(text)
+    regras = {campo: valor for campo, valor in extract_rule_fields(text).items() if campo not in conhecidos}
+    validos, pendentes = validate_rule_fields(text, regras)
+    invoice_info = empty_invoice_info()
+    invoice_info.update(conhecidos)
+    invoice_info.update(validos)
+    origem_campos = {campo: "chave" for campo in conhecidos}
+    origem_campos.update({campo: "regras" for campo in validos})
+
+    if pendentes:
+        for campo, valor in extract_missing_fields(text, pendentes).items():
+            invoice_info[campo] = valor
+            origem_campos[campo] = "llm" if valor is not None else None
+    else:
+        logging.info("Nota resolvida apenas com as regras locais, sem chamada ao Gemini")
+    return invoice_info, origem_campos
+
+# Campos resumidos do AnalyzeExpense aproveitados diretamente; os tipos estão
+# em ordem de preferência para cada campo da nota
+EXPENSE_TIPOS = {
+    "nome_emissor": ("VENDOR_NAME", "NAME"),
+    "CNPJ_emissor": ("TAX_PAYER_ID", "VENDOR_VAT_NUMBER"),
+    "endereco_emissor": ("VENDOR_ADDRESS", "ADDRESS", "ADDRESS_BLOCK"),
+    "data_emissao": ("INVOICE_RECEIPT_DATE",),
+    "numero_nota_fiscal": ("INVOICE_RECEIPT_ID",),
+    "valor_total": ("TOTAL", "AMOUNT_PAID"),
+}
+
+# Confiança mínima (0-100) para aceitar cada campo do AnalyzeExpense sem
+# consultar as regras ou o Gemini. O número da nota costuma vir com confiança
+# baixa; o CNPJ tem os dígitos verificadores como segunda checagem.
+# EXPENSE_MIN_CONFIDENCE ajusta os limites: "90" para todos os campos ou
+# "valor_total=95,numero_nota_fiscal=80" para campos específicos
+EXPENSE_CONFIDENCE_PADRAO = {
+    "nome_emissor": 90.0,
+    "CNPJ_emissor": 80.0,
+    "endereco_emissor": 85.0,
+    "data_emissao": 90.0,
+    "numero_nota_fiscal": 90.0,
+    "valor_total": 90.0,
+}
+
+def parse_confidence_thresholds(valor, padrao):
+    limites = dict(padrao)
+    for parte in (valor or '').split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        campo, igual, limite = parte.rpartition('=')
+        if not igual:
+            limites = dict.fromkeys(limites, float(limite))
+        elif campo.strip() in limites:
+            limites[campo.strip()] = float(limite)
+        else:
+            raise ValueError(f"EXPENSE_MIN_CONFIDENCE: campo desconhecido {campo.strip()}")
+    return limites
+
+EXPENSE_MIN_CONFIDENCE = parse_confidence_thresholds(os.getenv('EXPENSE_MIN_CONFIDENCE'), EXPENSE_CONFIDENCE_PADRAO)
+
+# Escolhe, para cada campo, o primeiro valor do AnalyzeExpense que passe pelo
+# limite de confiança e pelos mesmos validadores das regras locais. Dentro de
+# um tipo vale a ordem do documento: o CNPJ do emissor vem antes do CNPJ/CPF do
+# consumidor, que o Textract também classifica como TAX_PAYER_ID
+def expense_summary_fields(campos_resumo):
+    aceitos = {}
+    for campo, tipos in EXPENSE_TIPOS.items():
+        candidatos = sorted(
+            (item for item in campos_resumo if item["tipo"] in tipos),
+            key=lambda item: tipos.index(item["tipo"]),
+        )
+        resultado = "ausente"
+        for item in candidatos:
+            valor = normalize_field_value(campo, item["valor"])
+            if item["confianca"] < EXPENSE_MIN_CONFIDENCE[campo]:
+                resultado = "baixa_confianca"
+            elif not validate_field(campo, valor):
+                resultado = "invalido"
+            else:
+                aceitos[campo] = valor
+                resultado = "aceito"
+                break
+        EXPENSE_FIELDS.labels(campo, resultado).inc()
+    return aceitos
+
+# Extração pelos campos resumidos do AnalyzeExpense: o que o Textract já
+# entregou com confiança suficiente é usado direto, as regras locais tentam o
+# restante (série, CPF, pagamento) e o Gemini só recebe os campos que ainda
+# faltarem
+def extract_invoice_info_expense(text, campos_resumo):
+    LLM_INVOICES.labels("expense").inc()
+    invoice_info = empty_invoice_info()
+    conhecidos = access_key_known_fields(text)
+    aceitos = {
+        campo: valor for campo, valor in expense_summary_fields(campos_resumo).items()
+        if campo not in conhecidos
+    }
+    invoice_info.update(conhecidos)
+    invoice_info.update(aceitos)
+    origem_campos = {campo: "chave" for campo in conhecidos}
+    origem_campos.update({campo: "expense" for campo in aceitos})
+
+    restantes = {
+        campo: valor for campo, valor in extract_rule_fields(text).items()
+        if campo not in aceitos and campo not in conhecidos
+    }
+    validos, pendentes = validate_rule_fields(text, restantes)
+    invoice_info.update(validos)
+    origem_campos.update({campo: "regras" for campo in validos})
+
+    if pendentes:
+        for campo, valor in extract_missing_fields(text, pendentes).items():
+            invoice_info[campo] = valor
+            origem_campos[campo] = "llm" if valor is not None else None
+    else:
+        logging.info("Nota resolvida com o AnalyzeExpense e as regras locais, sem chamada ao Gemini")
+    return invoice_info, origem_campos
+
+def extract_invoice_llm(text):
+    LLM_INVOICES.labels("gemini").inc()
+    # Com a chave de acesso, o Gemini recebe só os campos que ela não cobre
+    conhecidos = access_key_known_fields(text)
+    pendentes = [campo for campo in CAMPOS_NOTA if campo not in conhecidos]
+    invoice_info = empty_invoice_info()
+    invoice_info.update(conhecidos)
+    invoice_info.update(extract_missing_fields(text, pendentes))
+    origem_campos = {
+        campo: "chave" if campo in conhecidos else "llm" if valor is not None else None
+        for campo, valor in invoice_info.items()
+    }
+    return invoice_info, origem_campos
+
+# Extratores locais (sem LLM): a origem de cada campo encontrado é o próprio backend
+def local_extractor(extrair, origem):
+    def extract(text):
+        dados = extrair(text) or {}
+        invoice_info = {campo: dados.get(campo) for campo in CAMPOS_NOTA}
+        origem_campos = {
+            campo: origem if valor is not None else None
+            for campo, valor in invoice_info.items()
         }
+        return invoice_info, origem_campos
+    return extract
+
+# Extratores alternativos de others/, importados apenas quando o backend é usado
+OTHERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'others')
+
+def import_other(nome):
+    if OTHERS_DIR not in sys.path:
+        sys.path.append(OTHERS_DIR)
+    return importlib.import_module(nome)
+
+def load_gemini_backend():
+    get_gemini_model()
+    return extract_invoice_llm
+
+def load_tiered_backend():
+    get_gemini_model()
+    return extract_invoice_info_tiered
+
+def load_expense_backend():
+    get_gemini_model()
+    return extract_invoice_info_expense
+
+def load_regex_backend():
+    from invoice_rules import extract_invoice_info_regex
+    return local_extractor(extract_invoice_info_regex, "regras")
+
+def load_nltk_backend():
+    extract_nltk = import_other('extract_nltk')
+    extract_nltk.nltk_data.load()
+    return local_extractor(extract_nltk.process_nota_fiscal, "nltk")
+
+def load_spacy_backend():
+    extract_spacy = import_other('extract_spacy')
+    extract_spacy.nlp_backend.load()
+    return local_extractor(extract_spacy.extract_invoice_info_spacy, "spacy")
+
+def load_bert_backend():
+    extract_bert = import_other('extract_transformers_bert')
+    extract_bert.qa_backend.load()
+    return local_extractor(extract_bert.extract_invoice_info_transf, "bert")
+
+# Backends de extração, carregados no primeiro uso ou aquecidos em segundo plano
+# (BACKEND_WARMUP). A requisição pode escolher o backend com ?backend=<nome>
+backend_registry = BackendRegistry(default=EXTRACTION_MODE)
+backend_registry.register('gemini', load_gemini_backend, "Todos os campos pelo Gemini")
+backend_registry.register('tiered', load_tiered_backend, "Regras locais e Gemini para os campos pendentes")
+backend_registry.register('expense', load_expense_backend, "Campos resumidos do Textract AnalyzeExpense, regras locais e Gemini para os pendentes")
+backend_registry.register('regex', load_regex_backend, "Regras locais (regex)")
+backend_registry.register('nltk', load_nltk_backend, "NLTK (others/extract_nltk.py)")
+backend_registry.register('spacy', load_spacy_backend, "spaCy (others/extract_spacy.py)")
+backend_registry.register('bert', load_bert_backend, "BERT question-answering (others/extract_transformers_bert.py)")
+if EXTRACTION_MODE not in backend_registry:
+    raise ValueError(f"EXTRACTION_MODE inválido: {EXTRACTION_MODE} (opções: {', '.join(backend_registry.names())})")
+
+# Backends que recebem o resultado do AnalyzeExpense (texto e campos resumidos)
+# em vez do texto do DetectDocumentText
+EXPENSE_BACKENDS = ('expense',)
+
+def ocr_cache_prefix(backend):
+    return "expense" if backend in EXPENSE_BACKENDS else "ocr"
+
+# OCR do documento na API do Textract que o backend usa
+def run_ocr(document, backend):
+    if backend in EXPENSE_BACKENDS:
+        return analyze_expense(document)
+    return extract_text_from_image(document)
+
+# Pré-processamento: substitui quebras de linha por espaços para facilitar a análise
+def ocr_text(ocr, backend):
+    texto = ocr["texto"] if backend in EXPENSE_BACKENDS else ocr
+    return texto.replace('\n', ' ').strip()
+
+def run_extraction(extract, backend, ocr):
+    texto = ocr_text(ocr, backend)
+    if backend in EXPENSE_BACKENDS:
+        invoice_info, origem_campos = extract(texto, ocr["campos"])
+    else:
+        invoice_info, origem_campos = extract(texto)
+    return apply_access_key(texto, invoice_info, origem_campos)
+
+# Os campos da chave de acesso valem para todos os backends (os locais não a
+# conhecem), e uma data fora do ano/mês da chave foi lida errado
+def apply_access_key(text, invoice_info, origem_campos):
+    dados = access_key_info(text)
+    if dados is None:
+        return invoice_info, origem_campos
+    for campo, valor in access_key_fields(dados).items():
+        invoice_info[campo] = valor
+        origem_campos[campo] = "chave"
+    data = invoice_info.get("data_emissao")
+    if data is not None and date_outside_key(data, dados):
+        logging.warning(f"Data de emissão {data} fora do mês da chave de acesso ({dados['ano_mes']}); descartada")
+        invoice_info["data_emissao"] = None
+        origem_campos["data_emissao"] = None
+    return invoice_info, origem_campos
+
+# Sem a chave no texto do OCR, tenta o QR Code da imagem e acrescenta a chave
+# lida ao texto (que vai para o cache junto com o OCR)
+def with_qr_access_key(ocr, backend, conteudo):
+    if find_access_key(ocr_text(ocr, backend)):
+        ACCESS_KEYS.labels("texto").inc()
+        return ocr
+    chave = read_qr_access_key(conteudo)
+    if chave is None:
+        ACCESS_KEYS.labels("ausente").inc()
+        return ocr
+    ACCESS_KEYS.labels("qrcode").inc()
+    if backend in EXPENSE_BACKENDS:
+        return {**ocr, "texto": f"{ocr['texto']}\nCHAVE DE ACESSO {chave}"}
+    return f"{ocr}\nCHAVE DE ACESSO {chave}"
+
+BACKEND_WARMUP = [nome.strip() for nome in os.getenv('BACKEND_WARMUP', EXTRACTION_MODE).split(',') if nome.strip()]
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def process_file(filename, conteudo, backend=None):
+    if filename == '':
+        logging.warning("Nome do arquivo inválido")
+        return {"arquivo": filename, "erro": "Nome do arquivo inválido"}
+
+    backend = backend or backend_registry.default
+    digest = content_key(conteudo)
+    chave_nota = result_key(digest, backend)
+    chave_ocr = f"{ocr_cache_prefix(backend)}:{digest}{PREPROCESS_KEY}"
+
+    # Reenvio de uma nota já processada: devolve o resultado guardado
+    cached = result_cache.get(chave_nota)
+    if cached is not None:
+        CACHE_LOOKUPS.labels("hit").inc()
+        return {"arquivo": filename, **cached, "backend": backend, "cache": "hit"}
+    CACHE_LOOKUPS.labels("miss").inc()
+
+    # Carrega o backend antes do OCR para não gastar uma chamada ao Textract à toa
+    try:
+        extract = backend_registry.get(backend)
+    except Exception:
+        return {"arquivo": filename, "erro": f"Backend de extração indisponível: {backend}"}
+
+    # Outra foto da mesma nota (recorte ou exposição diferentes): devolve o
+    # resultado dela sem passar pelo Textract
+    hashes = None
+    if phash_index is not None:
+        with PHASH_SECONDS.time():
+            hashes = image_hashes(conteudo)
+        if hashes is not None:
+            cached, duplicata_de = find_similar_result(hashes, backend)
+            if cached is not None:
+                PHASH_MATCHES.inc()
+                return {"arquivo": filename, **cached, "backend": backend, "cache": "similar", "duplicata_de": duplicata_de}
+
+    # Extração do texto com Textract
+    ocr = result_cache.get(chave_ocr)
+    if ocr is None:
+        enviado = prepare_image(filename, conteudo)
+        # Imagens pequenas vão direto ao Textract; as maiores são enviadas ao S3
+        # com o hash do conteúdo no nome e apagadas depois do OCR
+        objeto = upload_key(digest if enviado is conteudo else content_key(enviado), filename)
+        try:
+            document = prepare_document(get_s3_client(), enviado, BUCKET_NAME, objeto)
+        except Exception as e:
+            logging.error(f"Erro ao enviar arquivo para o S3: {e}")
+            return {"arquivo": filename, "erro": "Falha ao enviar o arquivo para o S3"}
+        UPLOAD_BYTES.labels("s3" if "S3Object" in document else "bytes").inc(len(enviado))
+
+        try:
+            ocr = run_ocr(document, backend)
+        finally:
+            release_document(get_s3_client(), document)
+        if not ocr:
+            logging.error(f"Falha ao extrair texto do arquivo {filename}")
+            return {"arquivo": filename, "erro": "Falha ao extrair texto com Textract"}
+        ocr = with_qr_access_key(ocr, backend, conteudo)
+        result_cache.set(chave_ocr, ocr)
+
+    # Extração das informações da nota fiscal
+    invoice_info, origem_campos = run_extraction(extract, backend, ocr)
+    resultado = {
+        "informacoes_nota": invoice_info,
+        "origem_campos": origem_campos,
+        "chave_acesso": access_key_info(ocr_text(ocr, backend)),
+    }
+    # Respostas totalmente nulas indicam falha no Gemini e não são guardadas
+    if any(valor is not None for valor in invoice_info.values()):
+        result_cache.set(chave_nota, resultado)
+        if invoice_store is not None:
+            invoice_store.add(digest, backend, filename, resultado)
+        if hashes is not None:
+            phash_index.add(hashes, {
+                "arquivo": filename,
+                "digest": digest,
+                "enviado_em": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            })
+    return {"arquivo": filename, **resultado, "backend": backend, "cache": "miss"}
+
+# Executa process_file para cada arquivo no pool compartilhado e devolve
+# (indice, resultado) na ordem em que terminam. Arquivos que não terminam em
+# FILE_TIMEOUT segundos desde o envio (incluindo a espera na fila) são
+# reportados como erro.
+def iter_results(arquivos, backend=None):
+    filenames = [filename for filename, _ in arquivos]
+    enviado_em = time.monotonic()
+    prazo = enviado_em + FILE_TIMEOUT
+
+    def tarefa(indice, filename, conteudo):
+        QUEUE_SECONDS.observe(time.monotonic() - enviado_em)
+        with FILE_SECONDS.time():
+            return process_file(filename, conteudo, backend)
+
+    futuros = {
+        executor.submit(tarefa, i, filename, conteudo): i
+        for i, (filename, conteudo) in enumerate(arquivos)
+    }
+    pendentes = set(futuros)
+    while pendentes:
+        restante = max(0.0, prazo - time.monotonic())
+        prontos, pendentes = wait(pendentes, timeout=restante, return_when=FIRST_COMPLETED)
+        for futuro in prontos:
+            indice = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logging.error(f"Erro ao processar o arquivo {filenames[indice]}: {e}")
+                resultado = {"arquivo": filenames[indice], "erro": str(e)}
+            FILES.labels(file_outcome(resultado)).inc()
+            yield indice, resultado
+
+        if pendentes and time.monotonic() >= prazo:
+            for futuro in pendentes:
+                # cancel() só tira da fila quem ainda não começou; uma chamada em
+                # andamento termina pelo tempo limite do cliente (GEMINI_TIMEOUT,
+                # AWS_READ_TIMEOUT) e libera o worker
+                futuro.cancel()
+                indice = futuros[futuro]
+                logging.error(f"Tempo esgotado ao processar o arquivo {filenames[indice]}")
+                FILES.labels("erro").inc()
+                yield indice, {"arquivo": filenames[indice], "erro": "Tempo limite de processamento excedido"}
+            pendentes = set()
+
+# "nulo": a nota foi processada, mas nenhum campo foi extraído (falha no Gemini)
+def file_outcome(resultado):
+    if "erro" in resultado:
+        return "erro"
+    if all(valor is None for valor in resultado["informacoes_nota"].values()):
+        return "nulo"
+    return "sucesso"
+
+# Jobs assíncronos: o POST devolve um job_id e o processamento segue em segundo plano
+job_manager = JobManager(
+    iter_results,
+    max_workers=int(os.getenv('JOB_WORKERS', 4)),
+    ttl=float(os.getenv('JOB_TTL', 3600)),
+)
+
+# Formatos do modo streaming: ?stream=ndjson|sse ou o cabeçalho Accept
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def stream_format():
+    formato = request.args.get('stream', '').lower()
+    if formato in STREAM_FORMATS:
+        return formato
+    for nome, tipo in STREAM_FORMATS.items():
+        if request.accept_mimetypes.best == tipo:
+            return nome
+    return None
+
 @app.route('/api/v1/invoice', methods=['POST'])
 def process_invoice():
+    formato = stream_format()
+    if formato:
+        modo = "stream"
+    else:
+        modo = "async" if request.args.get('async', '').lower() in ('1', 'true') else "sync"
+    status = 500
+    inicio = time.perf_counter()
+    streaming = False
+    try:
+        resposta, status = invoice_response(modo, formato, inicio)
+        streaming = modo == "stream" and status == 200
+        return resposta, status
+    finally:
+        # No streaming a duração é registrada quando o último resultado sai
+        if not streaming:
+            REQUEST_SECONDS.labels(modo).observe(time.perf_counter() - inicio)
+        REQUESTS.labels(str(status)).inc()
+
+def invoice_response(modo, formato=None, inicio=None):
     files = request.files.getlist('file')
     if not files:
         return jsonify({"error": "Nenhum arquivo enviado"}), 400
 
-    bucket_name = "testandocriarbuckernomeusss"
-    final_results = []
+    backend = request.args.get('backend') or request.form.get('backend') or backend_registry.default
+    if backend not in backend_registry:
+        return jsonify({"error": f"Backend desconhecido: {backend}", "backends": backend_registry.names()}), 400
 
-    # Processamento de cada arquivo enviado
-    for file in files:
-        if file.filename == '':
-            logging.warning("Nome do arquivo inválido")
-            continue
+    arquivos = [(file.filename, file.read()) for file in files]
+    RECEIVED_BYTES.inc(sum(len(conteudo) for _, conteudo in arquivos))
 
-        # Se o arquivo não estiver no bucket, você pode considerar fazer upload aqui.
-        object_name = file.filename
+    # Modo assíncrono: enfileira os arquivos e responde imediatamente
+    if modo == "async":
+        job = job_manager.submit(arquivos, backend=backend)
+        return jsonify({
+            **job.to_dict(),
+            "status_url": f"/api/v1/jobs/{job.id}",
+            "results_url": f"/api/v1/jobs/{job.id}/results"
+        }), 202
 
-        # Extração do texto com Textract
-        extracted_text = extract_text_from_image(bucket_name, object_name)
-        if not extracted_text:
-            logging.error(f"Falha ao extrair texto do arquivo {file.filename}")
-            continue
+    # Modo streaming: cada resultado sai assim que o arquivo termina
+    if modo == "stream":
+        return Response(
+            stream_results(arquivos, backend, formato, inicio or time.perf_counter()),
+            mimetype=STREAM_FORMATS[formato],
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        ), 200
+
+    final_results = [None] * len(arquivos)
 
-        # Pré-processamento: substitui quebras de linha por espaços para facilitar a análise
-        texto_tratado = extracted_text.replace('\n', ' ').strip()
+    # Processamento paralelo dos arquivos enviados, mantendo a ordem original
+    for indice, resultado in iter_results(arquivos, backend):
+        final_results[indice] = resultado
 
-        # Extração das informações da nota fiscal
-        invoice_info = extract_invoice_info(texto_tratado)
-        final_results.append({
-            "arquivo": file.filename,
-            "informacoes_nota": invoice_info
+    return results_response(final_results)
+
+# Um registro por arquivo, na ordem em que terminam ("tipo": "resultado", com o
+# índice do arquivo no envio), e um resumo no final ("tipo": "resumo")
+def stream_results(arquivos, backend, formato, inicio):
+    def registro(tipo, dados):
+        if formato == "sse":
+            return f"event: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+        return json.dumps({"tipo": tipo, **dados}, ensure_ascii=False) + "\n"
+
+    resultados = {"sucesso": 0, "nulo": 0, "erro": 0}
+    try:
+        for indice, resultado in iter_results(arquivos, backend):
+            if not any(resultados.values()):
+                FIRST_RESULT_SECONDS.observe(time.perf_counter() - inicio)
+            resultados[file_outcome(resultado)] += 1
+            yield registro("resultado", {"indice": indice, **resultado})
+        yield registro("resumo", {
+            "total": len(arquivos),
+            **resultados,
+            "segundos": round(time.perf_counter() - inicio, 3),
         })
+    finally:
+        REQUEST_SECONDS.labels("stream").observe(time.perf_counter() - inicio)
 
-    if not final_results:
-        return jsonify({"error": "Nenhum arquivo processado com sucesso"}), 400
+def results_response(final_results):
+    if all("erro" in resultado for resultado in final_results):
+        return jsonify({"error": "Nenhum arquivo processado com sucesso", "arquivos": final_results}), 400
 
     return jsonify(final_results), 200
 
+@app.route('/api/v1/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/v1/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job não encontrado"}), 404
+    if job.status == "falhou":
+        return jsonify({"error": "Falha no processamento do job", **job.to_dict()}), 500
+    if job.status != "concluido":
+        return jsonify(job.to_dict()), 202
+    return results_response(job.resultados)
+
+# Filtros das consultas às notas armazenadas: datas em AAAA-MM-DD ou
+# DD/MM/AAAA e valores em reais ("12,30", "12.30" ou "12")
+def invoice_filters(args):
+    filtros = {"cnpj": args.get('cnpj'), "forma_pgto": args.get('forma_pgto')}
+    for parametro, chave in (('from', 'inicio'), ('to', 'fim')):
+        if args.get(parametro):
+            filtros[chave] = iso_date(args[parametro])
+            if filtros[chave] is None:
+                raise ValueError(f"Data inválida em '{parametro}': {args[parametro]}")
+    for parametro, chave in (('min', 'valor_min'), ('max', 'valor_max')):
+        if args.get(parametro):
+            valor = args[parametro].strip()
+            filtros[chave] = int(valor) * 100 if valor.isdigit() else cents(valor)
+            if filtros[chave] is None:
+                raise ValueError(f"Valor inválido em '{parametro}': {args[parametro]}")
+    return filtros
+
+@app.route('/api/v1/invoices', methods=['GET'])
+def list_invoices():
+    if invoice_store is None:
+        return jsonify({"error": "Armazenamento de notas desativado (INVOICE_DB)"}), 503
+    try:
+        filtros = invoice_filters(request.args)
+        limit = int(request.args.get('limit', LIMITE_PAGINA))
+        pagina = invoice_store.search(cursor=request.args.get('cursor'), limit=limit, **filtros)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(pagina), 200
+
+@app.route('/api/v1/invoices/summary', methods=['GET'])
+def invoices_summary():
+    if invoice_store is None:
+        return jsonify({"error": "Armazenamento de notas desativado (INVOICE_DB)"}), 503
+    try:
+        resumo = invoice_store.summary(agrupar=request.args.get('group'), **invoice_filters(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(resumo), 200
+
+@app.route('/api/v1/backends', methods=['GET'])
+def backends_status():
+    return jsonify(backend_registry.status()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return registry.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+# Aquece os backends em segundo plano; o servidor já atende enquanto isso
+backend_registry.warm(BACKEND_WARMUP)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
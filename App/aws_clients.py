@@ -0,0 +1,150 @@
+"""Clientes da AWS com pool, retentativas e limite de taxa por operação.
+
+Os clientes padrão do boto3 têm pool de 10 conexões e o modo de retentativa
+legado, e não sabem da cota de transações por segundo do Textract: com mais
+arquivos em paralelo, as chamadas começam a voltar com ThrottlingException.
+`create_client` aplica:
+- AWS_MAX_POOL_CONNECTIONS (50) conexões no pool;
+- AWS_RETRY_MODE (`adaptive`) com até AWS_MAX_ATTEMPTS (10) tentativas;
+- AWS_CONNECT_TIMEOUT (5) e AWS_READ_TIMEOUT (60) segundos;
+- um TokenBucket por operação, compartilhado entre todos os clientes do
+  processo, consumido antes de cada tentativa (inclusive as retentativas):
+  quem passa da cota espera a vez em vez de receber o erro.
+
+AWS_RATE_LIMITS define as taxas, em chamadas por segundo: `textract=10`
+vale para cada operação do serviço e `textract.AnalyzeExpense=5` para uma
+operação específica. Operações sem limite não esperam.
+
+Esperas, retentativas e erros de limite (throttling) por operação ficam em
+/metrics (invoice_aws_*).
+"""
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from metrics import registry
+from ratelimit import TokenBucket
+
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_MAX_POOL_CONNECTIONS', 50))
+AWS_RETRY_MODE = os.getenv('AWS_RETRY_MODE', 'adaptive')
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS', 10))
+AWS_CONNECT_TIMEOUT = float(os.getenv('AWS_CONNECT_TIMEOUT', 5))
+AWS_READ_TIMEOUT = float(os.getenv('AWS_READ_TIMEOUT', 60))
+# Cotas padrão do Textract para as APIs síncronas em us-east-1
+AWS_RATE_LIMITS = os.getenv('AWS_RATE_LIMITS', 'textract.DetectDocumentText=10,textract.AnalyzeExpense=5')
+
+# Códigos de erro que indicam cota excedida, e não falha da requisição
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+    'TransactionInProgressException', 'RequestLimitExceeded', 'BandwidthLimitExceeded',
+    'LimitExceededException', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+    'EC2ThrottledException',
+}
+
+AWS_REQUESTS = registry.counter('invoice_aws_requests_total', 'Chamadas às APIs da AWS por serviço e operação', ('servico', 'operacao'))
+AWS_ATTEMPTS = registry.counter('invoice_aws_attempts_total', 'Tentativas enviadas às APIs da AWS, incluindo retentativas', ('servico', 'operacao'))
+AWS_RETRIES = registry.counter('invoice_aws_retries_total', 'Retentativas feitas pelo botocore', ('servico', 'operacao'))
+AWS_THROTTLES = registry.counter('invoice_aws_throttles_total', 'Respostas de cota excedida (throttling) da AWS', ('servico', 'operacao'))
+AWS_RATE_LIMIT_SECONDS = registry.histogram(
+    'invoice_aws_rate_limit_wait_seconds', 'Espera no limite de taxa local antes de cada tentativa',
+    ('servico', 'operacao'),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def parse_rate_limits(valor):
+    """"textract=10,textract.AnalyzeExpense=5" -> {("textract", None): 10.0, ("textract", "AnalyzeExpense"): 5.0}"""
+    limites = {}
+    for parte in (valor or '').split(','):
+        parte = parte.strip()
+        if not parte:
+            continue
+        nome, _, taxa = parte.partition('=')
+        servico, _, operacao = nome.strip().partition('.')
+        limites[(servico.lower(), operacao or None)] = float(taxa)
+    return limites
+
+
+class RateLimiters:
+    """Um TokenBucket por (serviço, operação), criado no primeiro uso."""
+
+    def __init__(self, limites):
+        self.limites = limites
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, servico, operacao):
+        chave = (servico, operacao)
+        with self._lock:
+            if chave not in self._buckets:
+                taxa = self.limites.get(chave, self.limites.get((servico, None)))
+                self._buckets[chave] = TokenBucket(taxa) if taxa else None
+            return self._buckets[chave]
+
+
+rate_limiters = RateLimiters(parse_rate_limits(AWS_RATE_LIMITS))
+
+
+def client_config(**kwargs):
+    opcoes = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'retries': {'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS},
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+    }
+    opcoes.update(kwargs)
+    return Config(**opcoes)
+
+
+def _error_code(parsed):
+    return (parsed or {}).get('Error', {}).get('Code')
+
+
+def is_throttle_error(erro):
+    """Se a exceção do boto3 é de cota excedida (mesmo após as retentativas)."""
+    return _error_code(getattr(erro, 'response', None)) in THROTTLE_CODES
+
+
+def _instrument(client, servico, limiters):
+    eventos = client.meta.events
+    sufixo = client.meta.service_model.service_id.hyphenize()
+
+    def antes_da_chamada(model, **kwargs):
+        AWS_REQUESTS.labels(servico, model.name).inc()
+
+    # before-send acontece a cada tentativa: as retentativas também consomem a cota
+    def antes_do_envio(event_name, **kwargs):
+        operacao = event_name.rsplit('.', 1)[-1]
+        AWS_ATTEMPTS.labels(servico, operacao).inc()
+        limiter = limiters.get(servico, operacao)
+        if limiter is not None:
+            espera = limiter.acquire()
+            AWS_RATE_LIMIT_SECONDS.labels(servico, operacao).observe(espera)
+
+    def apos_tentativa(response, operation, attempts, **kwargs):
+        if response is not None and _error_code(response[1]) in THROTTLE_CODES:
+            AWS_THROTTLES.labels(servico, operation.name).inc()
+            logging.warning(f"Cota excedida em {servico}.{operation.name} (tentativa {attempts})")
+
+    def apos_chamada(parsed, model, **kwargs):
+        tentativas = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if tentativas:
+            AWS_RETRIES.labels(servico, model.name).inc(tentativas)
+
+    eventos.register(f'before-call.{sufixo}', antes_da_chamada)
+    eventos.register(f'before-send.{sufixo}', antes_do_envio)
+    eventos.register_first(f'needs-retry.{sufixo}', apos_tentativa)
+    eventos.register(f'after-call.{sufixo}', apos_chamada)
+
+
+def create_client(servico, limiters=None, **kwargs):
+    """boto3.client(servico) com a configuração acima; `config` em kwargs
+    substitui as opções padrão."""
+    config = kwargs.pop('config', None) or client_config()
+    client = boto3.client(servico, config=config, **kwargs)
+    _instrument(client, servico, limiters or rate_limiters)
+    return client
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+
+
+class Backend:
+    """Recurso pesado (modelo, cliente, extrator) carregado no primeiro uso.
+
+    `loader` é chamado uma única vez, mesmo com várias threads pedindo o
+    recurso ao mesmo tempo; o tempo de carga fica registrado em
+    `load_seconds`. Se a carga falhar, o erro é guardado e a próxima chamada
+    a `load()` tenta de novo.
+    """
+
+    def __init__(self, name, loader, description=''):
+        self.name = name
+        self.description = description
+        self._loader = loader
+        self._valor = None
+        self._lock = threading.Lock()
+        self.status = "nao_carregado"
+        self.load_seconds = None
+        self.error = None
+
+    @property
+    def loaded(self):
+        return self.status == "pronto"
+
+    def load(self):
+        if self.status == "pronto":
+            return self._valor
+        with self._lock:
+            if self.status != "pronto":
+                self.status = "carregando"
+                inicio = time.perf_counter()
+                try:
+                    self._valor = self._loader()
+                except Exception as e:
+                    self.status = "falhou"
+                    self.error = f"{type(e).__name__}: {e}"
+                    logging.error(f"Falha ao carregar o backend {self.name}: {self.error}")
+                    raise
+                self.load_seconds = time.perf_counter() - inicio
+                self.error = None
+                self.status = "pronto"
+                logging.info(f"Backend {self.name} carregado em {self.load_seconds:.2f}s")
+        return self._valor
+
+    def to_dict(self):
+        return {
+            "nome": self.name,
+            "descricao": self.description,
+            "status": self.status,
+            "tempo_carga": self.load_seconds,
+            "erro": self.error,
+        }
+
+
+class BackendRegistry:
+    """Backends de extração disponíveis, carregados sob demanda."""
+
+    def __init__(self, default=None):
+        self.default = default
+        self._backends = {}
+
+    def register(self, name, loader, description=''):
+        self._backends[name] = Backend(name, loader, description)
+        return self._backends[name]
+
+    def __contains__(self, name):
+        return name in self._backends
+
+    def names(self):
+        return list(self._backends)
+
+    def get(self, name=None):
+        """O extrator carregado do backend `name` (ou do padrão)."""
+        return self._backends[name or self.default].load()
+
+    def warm(self, names=None):
+        """Carrega os backends em uma thread em segundo plano, sem bloquear."""
+        nomes = [self.default] if names is None else [nome for nome in names if nome in self._backends]
+
+        def aquecer():
+            for nome in nomes:
+                try:
+                    self._backends[nome].load()
+                except Exception:
+                    pass  # já registrado em load(); o primeiro uso tenta novamente
+
+        thread = threading.Thread(target=aquecer, name='backend-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        return [
+            {**backend.to_dict(), "padrao": nome == self.default}
+            for nome, backend in self._backends.items()
+        ]
@@ -0,0 +1,111 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Agrupa itens enviados por várias threads em lotes processados de uma vez.
+
+    Um lote é fechado quando atinge `max_batch_size` itens, quando o custo
+    somado (`cost(item)`) passaria de `max_batch_cost` ou quando o primeiro
+    item já esperou `max_wait` segundos. `process_batch` recebe a lista de
+    itens e deve devolver uma lista de resultados na mesma ordem. Com um
+    `executor`, vários lotes podem ser processados ao mesmo tempo; sem ele,
+    os lotes rodam um de cada vez na thread do batcher.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait=0.05,
+                 max_batch_cost=None, cost=None, executor=None, name='batcher'):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_batch_cost = max_batch_cost
+        self.cost = cost or (lambda item: 1)
+        self.executor = executor
+        self._fila = queue.Queue()
+        self._pendente = None
+        self._stats_lock = threading.Lock()
+        self.lotes = 0
+        self.itens = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        futuro = Future()
+        self._fila.put((item, futuro, time.monotonic()))
+        return futuro
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "lotes": self.lotes,
+                "itens": self.itens,
+                "tamanho_medio_lote": self.itens / self.lotes if self.lotes else 0.0,
+                "espera_media": self.espera_total / self.itens if self.itens else 0.0,
+                "espera_maxima": self.espera_maxima,
+            }
+
+    def _next(self, timeout=None, block=True):
+        # Item que não coube no lote anterior tem prioridade
+        if self._pendente is not None:
+            entrada, self._pendente = self._pendente, None
+            return entrada
+        return self._fila.get(block=block, timeout=timeout)
+
+    def _collect(self):
+        primeiro = self._next()
+        lote = [primeiro]
+        custo = self.cost(primeiro[0])
+        prazo = primeiro[2] + self.max_wait
+        while len(lote) < self.max_batch_size:
+            restante = prazo - time.monotonic()
+            try:
+                # Com o prazo vencido (fila acumulada enquanto o lote anterior
+                # rodava), ainda junta o que já está na fila, sem esperar
+                if restante > 0:
+                    entrada = self._next(timeout=restante)
+                else:
+                    entrada = self._next(block=False)
+            except queue.Empty:
+                break
+            custo_item = self.cost(entrada[0])
+            if self.max_batch_cost is not None and custo + custo_item > self.max_batch_cost:
+                self._pendente = entrada
+                break
+            lote.append(entrada)
+            custo += custo_item
+        return lote
+
+    def _loop(self):
+        while True:
+            lote = self._collect()
+            agora = time.monotonic()
+            with self._stats_lock:
+                self.lotes += 1
+                self.itens += len(lote)
+                for _, _, enviado_em in lote:
+                    espera = agora - enviado_em
+                    self.espera_total += espera
+                    self.espera_maxima = max(self.espera_maxima, espera)
+            if self.executor is not None:
+                self.executor.submit(self._run, lote)
+            else:
+                self._run(lote)
+
+    def _run(self, lote):
+        futuros = [futuro for _, futuro, _ in lote]
+        try:
+            resultados = self.process_batch([item for item, _, _ in lote])
+            if len(resultados) != len(lote):
+                raise ValueError(f"Lote com {len(lote)} itens devolveu {len(resultados)} resultados")
+            for futuro, resultado in zip(futuros, resultados):
+                futuro.set_result(resultado)
+        except Exception as e:
+            logging.error(f"Erro ao processar lote: {e}")
+            for futuro in futuros:
+                if not futuro.done():
+                    futuro.set_exception(e)
@@ -0,0 +1,243 @@
+"""Benchmark do pipeline de notas fiscais, sem acesso à rede.
+
+O Textract, o S3 e o Gemini são substituídos pelos dublês de `fakes.py`, que
+repetem respostas gravadas em `recorded/` com latência configurável. São
+medidos o endpoint `/api/v1/invoice` (via cliente de testes do Flask) e cada
+etapa isolada: leitura dos blocos do Textract, montagem do prompt, leitura do
+JSON do Gemini, motor de regras e os extratores de `others/` (os que não
+tiverem as dependências instaladas são ignorados).
+
+Uso (a partir de App/):
+    python benchmarks/bench_pipeline.py --requests 40 --concurrency 4 --json atual.json
+    python benchmarks/bench_pipeline.py --baseline base.json --tolerance 0.25
+
+Com `--baseline`, termina com código 1 se o p95 de alguma etapa piorar, ou a
+vazão cair, mais que a tolerância — o que permite usá-lo como gate no CI.
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+OTHERS_DIR = os.path.join(APP_DIR, 'others')
+sys.path[:0] = [BENCH_DIR, APP_DIR, OTHERS_DIR]
+
+# Os clientes são criados na importação dos módulos; nenhum deles chega a ser chamado
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+os.environ['CACHE_DIR'] = ''
+# As notas dos dublês não vão para o banco de notas nem para o índice de fotos de verdade
+os.environ['INVOICE_DB'] = ''
+os.environ['PHASH_INDEX_FILE'] = ''
+# Sem aquecimento em segundo plano: os clientes são trocados pelos dublês logo após a importação
+os.environ['BACKEND_WARMUP'] = ''
+
+from fakes import FakeGemini, FakeS3, FakeTextract, Latency, as_upload, load_recordings, sample_images
+
+
+def percentile(amostras, p):
+    """Percentil pelo método nearest-rank."""
+    ordenadas = sorted(amostras)
+    if not ordenadas:
+        return 0.0
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+
+def peak_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def summarize(nome, amostras, duracao):
+    return {
+        "etapa": nome,
+        "n": len(amostras),
+        "p50_ms": percentile(amostras, 50) * 1000,
+        "p95_ms": percentile(amostras, 95) * 1000,
+        "p99_ms": percentile(amostras, 99) * 1000,
+        "por_segundo": len(amostras) / duracao if duracao else 0.0,
+        "pico_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure(nome, funcao, entradas, iterations):
+    """Executa `funcao` sobre as entradas, em rodízio, `iterations` vezes."""
+    amostras = []
+    inicio = time.perf_counter()
+    for i in range(iterations):
+        entrada = entradas[i % len(entradas)]
+        t0 = time.perf_counter()
+        funcao(entrada)
+        amostras.append(time.perf_counter() - t0)
+    return summarize(nome, amostras, time.perf_counter() - inicio)
+
+
+def load_app(args):
+    import app
+    from cache import MemoryCache, ResultCache
+
+    app.textract_client = FakeTextract(Latency(args.textract_latency, args.jitter, args.seed))
+    app.s3_client = FakeS3(Latency(args.s3_latency, args.jitter, args.seed))
+    app.gemini_model = FakeGemini(Latency(args.gemini_latency, args.jitter, args.seed))
+    if not args.cache:
+        app.result_cache = ResultCache(MemoryCache(max_items=0))
+    return app
+
+
+def bench_endpoint(app, imagens, args):
+    cliente = app.app.test_client()
+    consulta = {'backend': args.backend} if args.backend else {}
+
+    def enviar(i):
+        arquivos = [as_upload(*imagens[(i + j) % len(imagens)]) for j in range(args.files)]
+        t0 = time.perf_counter()
+        resposta = cliente.post('/api/v1/invoice', query_string=consulta, data={'file': arquivos}, content_type='multipart/form-data')
+        duracao = time.perf_counter() - t0
+        if resposta.status_code != 200:
+            raise RuntimeError(f"Resposta {resposta.status_code}: {resposta.get_data(as_text=True)}")
+        return duracao
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(enviar, range(min(args.warmup, args.requests))))
+        inicio = time.perf_counter()
+        amostras = list(pool.map(enviar, range(args.requests)))
+        duracao = time.perf_counter() - inicio
+    return summarize('endpoint', amostras, duracao)
+
+
+def bench_stages(app, args):
+    from invoice_rules import extract_invoice_info_regex, extract_rule_fields
+    from textract_blocks import parse_response
+
+    deteccoes = list(load_recordings('detect').values())
+    textos = [parse_response(resposta).text() for resposta in deteccoes]
+    respostas_gemini = [gravacao['text'] for gravacao in load_recordings('gemini').values()]
+    n = args.iterations
+
+    resultados = [
+        measure('textract_blocks', parse_response, deteccoes, n),
+        measure('prompt', app.format_gemini_prompt, textos, n),
+        measure('gemini_json', lambda texto: json.loads(app.clean_json_response(texto)), respostas_gemini, n),
+        measure('regras', extract_invoice_info_regex, textos, n),
+        measure('regras_campos', extract_rule_fields, textos, n),
+    ]
+    return resultados + bench_others(textos, args)
+
+
+# Extratores alternativos de others/: (módulo, função, usa o documento do Textract)
+OTHERS = (
+    ('extract_regex', 'extract_invoice_info_spacy', False),
+    ('extract_spacy', 'extract_invoice_info_spacy', False),
+    ('extract_nltk', 'process_nota_fiscal', False),
+    ('extract_transformers2', 'extract_invoice_info', False),
+    ('extract_transformers_bert', 'extract_invoice_info_transf', False),
+    ('extract_analyse', 'analyze_expense', True),
+)
+
+
+def bench_others(textos, args):
+    resultados = []
+    documentos = [{'Bytes': conteudo} for _, conteudo in sample_images()]
+    for modulo, nome_funcao, usa_documento in OTHERS:
+        if args.others is not None and modulo not in args.others:
+            continue
+        entradas = documentos if usa_documento else textos
+        # A primeira chamada carrega modelos e dados (stopwords do NLTK, spaCy,
+        # Transformers); sem eles instalados o extrator fica de fora da medição
+        try:
+            extrator = importlib.import_module(modulo)
+            if usa_documento:
+                extrator.textract_client = FakeTextract()
+            funcao = getattr(extrator, nome_funcao)
+            funcao(entradas[0])
+        except Exception as e:
+            print(f"[ignorado] {modulo}: {type(e).__name__}: {e}", file=sys.stderr)
+            continue
+        # Modelos de linguagem são ordens de grandeza mais lentos que as regras
+        iteracoes = args.iterations if modulo in ('extract_regex', 'extract_nltk', 'extract_analyse') else args.model_iterations
+        resultados.append(measure(modulo, funcao, entradas, iteracoes))
+    return resultados
+
+
+def compare(resultados, baseline, tolerancia):
+    """Lista as regressões em relação a um resultado anterior."""
+    anteriores = {r["etapa"]: r for r in baseline["etapas"]}
+    regressoes = []
+    for atual in resultados:
+        anterior = anteriores.get(atual["etapa"])
+        if anterior is None:
+            continue
+        if atual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regressoes.append(f"{atual['etapa']}: p95 {anterior['p95_ms']:.3f} -> {atual['p95_ms']:.3f} ms")
+        if atual["por_segundo"] < anterior["por_segundo"] * (1 - tolerancia):
+            regressoes.append(f"{atual['etapa']}: {anterior['por_segundo']:.1f} -> {atual['por_segundo']:.1f} por segundo")
+    return regressoes
+
+
+def print_table(resultados):
+    print(f"{'etapa':<28}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'por seg':>12}{'RSS MB':>9}")
+    for r in resultados:
+        print(f"{r['etapa']:<28}{r['n']:>7}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}{r['p99_ms']:>11.3f}"
+              f"{r['por_segundo']:>12.1f}{r['pico_rss_mb']:>9.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de notas fiscais")
+    parser.add_argument('--requests', type=int, default=40, help="requisições ao endpoint")
+    parser.add_argument('--files', type=int, default=2, help="arquivos por requisição")
+    parser.add_argument('--concurrency', type=int, default=4, help="requisições simultâneas")
+    parser.add_argument('--warmup', type=int, default=4, help="requisições de aquecimento (não medidas)")
+    parser.add_argument('--iterations', type=int, default=2000, help="repetições de cada etapa isolada")
+    parser.add_argument('--model-iterations', type=int, default=5, help="repetições dos extratores com modelos (spaCy, transformers)")
+    parser.add_argument('--textract-latency', type=float, default=0.0, help="latência simulada do Textract, em segundos")
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help="latência simulada do Gemini, em segundos")
+    parser.add_argument('--s3-latency', type=float, default=0.0, help="latência simulada do envio ao S3, em segundos")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variação máxima (±) das latências simuladas")
+    parser.add_argument('--seed', type=int, default=0, help="semente da variação de latência")
+    parser.add_argument('--backend', help="backend de extração usado no endpoint (padrão: o do app)")
+    parser.add_argument('--cache', action='store_true', help="mantém o cache de resultados ligado")
+    parser.add_argument('--only', choices=('endpoint', 'etapas'), help="executa apenas uma das partes")
+    parser.add_argument('--others', nargs='*', help="extratores de others/ a medir (padrão: todos)")
+    parser.add_argument('--json', dest='saida', help="grava os resultados neste arquivo")
+    parser.add_argument('--baseline', help="resultado anterior (--json) para comparar")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="piora relativa tolerada na comparação")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = load_app(args)
+    imagens = sample_images()
+
+    resultados = []
+    if args.only in (None, 'endpoint'):
+        resultados.append(bench_endpoint(app, imagens, args))
+    if args.only in (None, 'etapas'):
+        resultados.extend(bench_stages(app, args))
+
+    print_table(resultados)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({"parametros": vars(args), "etapas": resultados}, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressoes = compare(resultados, json.load(f), args.tolerance)
+        for regressao in regressoes:
+            print(f"REGRESSÃO {regressao}", file=sys.stderr)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
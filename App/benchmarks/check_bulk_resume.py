@@ -0,0 +1,148 @@
+"""Confere a retomada do reprocessamento em massa (bulk.py) sem acessar a AWS.
+
+Monta um bucket FakeS3 com as imagens de exemplo em `dinheiro/` e `outros/`
+(mais uma "pasta" vazia e um objeto acima do limite do envio inline),
+interrompe o job no meio de um prefixo e roda de novo no mesmo diretório.
+Confere que:
+
+- a listagem paginada passa por todos os objetos, uma página por arquivo;
+- a segunda execução continua da página seguinte à do checkpoint, sem
+  repetir nem perder objetos;
+- o objeto grande vem marcado com erro em vez de ir ao Textract;
+- um checkpoint de outro backend é recusado.
+
+Uso (a partir de App/):
+    python benchmarks/check_bulk_resume.py
+    python benchmarks/check_bulk_resume.py --objects 40 --page-size 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, APP_DIR]
+
+# Sem cache em disco, aquecimento nem banco de notas: só o job é exercitado
+os.environ.setdefault('CACHE_DIR', '')
+os.environ.setdefault('BACKEND_WARMUP', '')
+os.environ.setdefault('INVOICE_DB', '')
+
+import app
+import bulk
+from fakes import FakeGemini, FakeS3, FakeTextract, sample_images
+from uploads import TEXTRACT_INLINE_LIMIT
+
+BUCKET = 'notas'
+
+
+class Interrupcao(Exception):
+    pass
+
+
+def fill_bucket(s3, quantidade):
+    imagens = sample_images()
+    chaves = []
+    for i in range(quantidade):
+        nome, conteudo = imagens[i % len(imagens)]
+        chave = f"{bulk.PREFIXES[i % 2]}{i:04d}-{nome}"
+        s3.put_object(Bucket=BUCKET, Key=chave, Body=conteudo)
+        chaves.append(chave)
+    s3.put_object(Bucket=BUCKET, Key=bulk.PREFIXES[0], Body=b'')
+    grande = f"{bulk.PREFIXES[1]}grande.jpg"
+    s3.put_object(Bucket=BUCKET, Key=grande, Body=b'\0' * (TEXTRACT_INLINE_LIMIT + 1))
+    return sorted(chaves + [grande]), grande
+
+
+def read_parts(output_dir):
+    import pyarrow.parquet as pq
+
+    partes = sorted(nome for nome in os.listdir(output_dir) if nome.endswith('.parquet'))
+    linhas = []
+    for nome in partes:
+        linhas.extend(pq.read_table(os.path.join(output_dir, nome)).to_pylist())
+    return partes, linhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confere a retomada do reprocessamento em massa")
+    parser.add_argument('--objects', type=int, default=25, help="objetos no bucket (além do grande)")
+    parser.add_argument('--page-size', type=int, default=4)
+    parser.add_argument('--stop-after', type=int, default=3, help="páginas gravadas antes da interrupção")
+    parser.add_argument('--backend', default='regex')
+    args = parser.parse_args(argv)
+
+    s3 = FakeS3()
+    app.s3_client = s3
+    app.textract_client = FakeTextract()
+    app.gemini_model = FakeGemini()
+    chaves, grande = fill_bucket(s3, args.objects)
+    falhas = []
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        def job(backend=args.backend):
+            return bulk.BulkJob(s3, BUCKET, output_dir, backend, workers=4, page_size=args.page_size, inline=True)
+
+        # Primeira execução, interrompida depois de algumas páginas gravadas
+        gravar = bulk.BulkJob.write_part
+        gravadas = 0
+
+        def write_part(self, caminho, linhas):
+            nonlocal gravadas
+            if gravadas == args.stop_after:
+                raise Interrupcao()
+            gravar(self, caminho, linhas)
+            gravadas += 1
+
+        bulk.BulkJob.write_part = write_part
+        try:
+            job().run()
+            falhas.append("a primeira execução não foi interrompida")
+        except Interrupcao:
+            pass
+        finally:
+            bulk.BulkJob.write_part = gravar
+        checkpoint = job().read_checkpoint()
+        print(f"interrompido após {checkpoint['partes']} partes ({checkpoint['processados']} objetos)")
+        if checkpoint['partes'] != args.stop_after:
+            falhas.append(f"checkpoint com {checkpoint['partes']} partes, esperado {args.stop_after}")
+
+        # Retomada no mesmo diretório
+        checkpoint = job().run()
+        partes, linhas = read_parts(output_dir)
+        processadas = [linha["chave"] for linha in linhas]
+        print(f"retomado: {len(partes)} partes, {len(processadas)} objetos, {checkpoint['erros']} com erro")
+
+        esperadas = sum(-(-sum(chave.startswith(prefixo) for chave in chaves) // args.page_size) for prefixo in bulk.PREFIXES)
+        if len(partes) != esperadas or checkpoint['partes'] != esperadas:
+            falhas.append(f"{len(partes)} partes, esperadas {esperadas}")
+        repetidas = sorted({chave for chave in processadas if processadas.count(chave) > 1})
+        if repetidas:
+            falhas.append(f"objetos processados duas vezes: {repetidas}")
+        if sorted(processadas) != chaves:
+            falhas.append(f"objetos faltando: {sorted(set(chaves) - set(processadas))}")
+        if not all(estado["concluido"] for estado in checkpoint["prefixos"].values()):
+            falhas.append("prefixo não concluído no checkpoint")
+
+        erros = {linha["chave"]: linha["erro"] for linha in linhas if linha["erro"]}
+        if set(erros) != {grande}:
+            falhas.append(f"erros inesperados: {erros}")
+        else:
+            print(f"{grande}: {erros[grande]}")
+
+        # Outro backend no mesmo diretório é recusado
+        outro = next(nome for nome in app.backend_registry.names() if nome != args.backend)
+        try:
+            job(outro).run()
+            falhas.append(f"checkpoint do backend {args.backend} aceito pelo backend {outro}")
+        except ValueError as e:
+            print(f"recusado: {e}")
+
+    for falha in falhas:
+        print(f"FALHA: {falha}", file=sys.stderr)
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
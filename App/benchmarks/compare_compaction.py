@@ -0,0 +1,115 @@
+"""Mede a compactação do prompt (prompt_compaction.py): tokens e acerto.
+
+Para cada nota — por padrão as gravadas em `recorded/`, com as respostas do
+Gemini como gabarito; `--cases` aceita o mesmo JSON de compare_qa.py —
+relata os tokens estimados do texto antes e depois da compactação e quantos
+valores do gabarito continuam presentes no texto compactado (uma perda aqui
+é um campo que o Gemini não tem mais como achar).
+
+Com `--gemini` (e GEMINI_API_KEY), cada nota também é enviada ao Gemini com
+e sem compactação, e o acerto por campo dos dois prompts é comparado.
+
+Uso (a partir de App/):
+    python benchmarks/compare_compaction.py
+    python benchmarks/compare_compaction.py --gemini --tolerance 0.05
+"""
+import argparse
+import json
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, APP_DIR]
+
+from compare_qa import agreement, field_accuracy, load_cases, normalize
+from prompt_compaction import compact_text
+
+
+def estimate_tokens(text):
+    # Mesma estimativa do app (~4 caracteres por token)
+    return len(text) // 4 + 1
+
+
+def presence(texto, esperado):
+    """Valores do gabarito que aparecem no texto (comparação sem formatação)."""
+    normalizado = normalize(texto)
+    return {
+        campo: normalize(valor) in normalizado
+        for campo, valor in esperado.items()
+        if valor is not None and normalize(valor)
+    }
+
+
+def run_gemini(textos):
+    os.environ['CACHE_DIR'] = ''
+    os.environ['BACKEND_WARMUP'] = ''
+    import app
+    return [app.extract_invoice_info(texto) for texto in textos]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede tokens e acerto do prompt compactado")
+    parser.add_argument('--cases', help="JSON com os textos e valores esperados")
+    parser.add_argument('--min-chars', type=int, help="textos limpos até esse tamanho vão sem janelas")
+    parser.add_argument('--gemini', action='store_true', help="compara as respostas do Gemini com e sem compactação")
+    parser.add_argument('--tolerance', type=float, default=0.05, help="queda máxima de acerto por campo")
+    parser.add_argument('--show', action='store_true', help="mostra os textos compactados")
+    parser.add_argument('--json', dest='saida', help="grava o relatório neste arquivo")
+    args = parser.parse_args(argv)
+
+    casos = load_cases(args.cases)
+    opcoes = {'min_chars': args.min_chars} if args.min_chars is not None else {}
+    compactados = [compact_text(caso["texto"], **opcoes) for caso in casos]
+
+    relatorio = {"notas": []}
+    perdas = []
+    print(f"{'nota':<6}{'tokens':>8}{'compact.':>10}{'redução':>9}{'presentes':>11}")
+    for numero, (caso, compactado) in enumerate(zip(casos, compactados), 1):
+        antes, depois = estimate_tokens(caso["texto"]), estimate_tokens(compactado)
+        no_original = presence(caso["texto"], caso["esperado"])
+        no_compactado = presence(compactado, caso["esperado"])
+        perdidos = [campo for campo, presente in no_original.items() if presente and not no_compactado[campo]]
+        perdas.extend(f"nota {numero}: {campo}" for campo in perdidos)
+        relatorio["notas"].append({"tokens": antes, "tokens_compactado": depois, "campos_perdidos": perdidos})
+        print(f"{numero:<6}{antes:>8}{depois:>10}{1 - depois / antes:>9.0%}"
+              f"{sum(no_compactado.values()):>6}/{sum(no_original.values())}")
+        if args.show:
+            print(f"    {compactado}")
+
+    total_antes = sum(nota["tokens"] for nota in relatorio["notas"])
+    total_depois = sum(nota["tokens_compactado"] for nota in relatorio["notas"])
+    if total_antes:
+        print(f"Total: ~{total_antes} -> ~{total_depois} tokens ({1 - total_depois / total_antes:.0%} a menos)")
+    relatorio.update({"tokens": total_antes, "tokens_compactado": total_depois, "campos_perdidos": perdas})
+
+    regressoes = []
+    if args.gemini:
+        completas = run_gemini([caso["texto"] for caso in casos])
+        reduzidas = run_gemini(compactados)
+        acerto_completo = field_accuracy(completas, casos)
+        acerto_compactado = field_accuracy(reduzidas, casos)
+        relatorio.update({
+            "acerto": acerto_completo,
+            "acerto_compactado": acerto_compactado,
+            "concordancia": agreement(reduzidas, completas),
+        })
+        print(f"{'campo':<22}{'completo':>10}{'compactado':>12}")
+        for campo, valor in acerto_completo.items():
+            print(f"{campo:<22}{valor:>10.2f}{acerto_compactado.get(campo, 0.0):>12.2f}")
+            if acerto_compactado.get(campo, 0.0) < valor - args.tolerance:
+                regressoes.append(f"{campo} {valor:.2f} -> {acerto_compactado.get(campo, 0.0):.2f}")
+        print(f"Concordância entre os prompts: {relatorio['concordancia']:.2f}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    for perda in perdas:
+        print(f"VALOR ESPERADO REMOVIDO PELA COMPACTAÇÃO {perda}", file=sys.stderr)
+    for regressao in regressoes:
+        print(f"ACERTO ABAIXO DA TOLERÂNCIA {regressao}", file=sys.stderr)
+    return 1 if perdas or regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Compara o OCR da imagem original com o da imagem pré-processada.
+
+Para cada imagem (por padrão as de `images/`), mede os bytes e as dimensões
+antes e depois do pré-processamento (preprocess.py) e, com o Textract real,
+quanto do texto original é reconhecido na imagem processada:
+- `palavras`: fração das palavras do OCR original encontradas no OCR da
+  imagem processada (mesma contagem, sem acentos e pontuação);
+- `campos`: fração dos campos das regras locais (CNPJ, data, total, ...)
+  com o mesmo valor nos dois OCRs.
+
+Uso (a partir de App/, com credenciais da AWS):
+    python benchmarks/compare_preprocess.py --dpi 300 --max-bytes 1048576 --save /tmp/processadas
+    python benchmarks/compare_preprocess.py --no-ocr   # apenas bytes e dimensões, sem chamar o Textract
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [BENCH_DIR, APP_DIR]
+
+import preprocess
+from compare_qa import normalize
+from fakes import IMAGES_DIR
+from invoice_rules import extract_rule_fields
+from textract_blocks import parse_response
+
+EXTENSOES = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.bmp')
+
+
+def ocr(textract_client, conteudo):
+    resposta = textract_client.detect_document_text(Document={'Bytes': conteudo})
+    return parse_response(resposta).text().replace('\n', ' ').strip()
+
+
+def word_recall(original, processado):
+    esperadas = Counter(filter(None, map(normalize, original.split())))
+    obtidas = Counter(filter(None, map(normalize, processado.split())))
+    total = sum(esperadas.values())
+    return sum((esperadas & obtidas).values()) / total if total else 1.0
+
+
+def field_agreement(original, processado):
+    campos_original = extract_rule_fields(original)
+    campos_processado = extract_rule_fields(processado)
+    encontrados = [campo for campo, valor in campos_original.items() if valor is not None]
+    iguais = [campo for campo in encontrados if normalize(campos_processado.get(campo)) == normalize(campos_original[campo])]
+    return len(iguais) / len(encontrados) if encontrados else 1.0, sorted(set(encontrados) - set(iguais))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara o OCR das imagens originais e pré-processadas")
+    parser.add_argument('images', nargs='*', help=f"imagens (padrão: as de {IMAGES_DIR})")
+    parser.add_argument('--dpi', type=int, default=preprocess.PREPROCESS_DPI)
+    parser.add_argument('--paper-mm', type=float, default=preprocess.PREPROCESS_PAPER_MM)
+    parser.add_argument('--max-bytes', type=int, default=preprocess.PREPROCESS_MAX_BYTES)
+    parser.add_argument('--quality', type=int, default=preprocess.PREPROCESS_QUALITY)
+    parser.add_argument('--no-crop', action='store_true')
+    parser.add_argument('--color', action='store_true', help="mantém as cores")
+    parser.add_argument('--no-ocr', action='store_true', help="não chama o Textract")
+    parser.add_argument('--save', help="grava as imagens processadas neste diretório")
+    parser.add_argument('--json', dest='saida', help="grava o relatório neste arquivo")
+    args = parser.parse_args(argv)
+
+    caminhos = args.images or [
+        os.path.join(IMAGES_DIR, nome) for nome in sorted(os.listdir(IMAGES_DIR))
+        if nome.lower().endswith(EXTENSOES)
+    ]
+    textract_client = None
+    if not args.no_ocr:
+        from aws_clients import create_client
+        textract_client = create_client('textract')
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+
+    resultados = []
+    print(f"{'imagem':<40}{'KB orig':>9}{'KB env':>8}{'ms':>7}{'palavras':>10}{'campos':>8}")
+    for caminho in caminhos:
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        inicio = time.perf_counter()
+        enviado, resumo = preprocess.preprocess_image(
+            conteudo, crop=not args.no_crop, grayscale=not args.color, dpi=args.dpi,
+            paper_mm=args.paper_mm, max_bytes=args.max_bytes, quality=args.quality,
+        )
+        resultado = {"imagem": os.path.basename(caminho), "ms": (time.perf_counter() - inicio) * 1000, **resumo}
+        if args.save and resumo["processada"]:
+            nome = os.path.splitext(os.path.basename(caminho))[0] + '.jpg'
+            with open(os.path.join(args.save, nome), 'wb') as f:
+                f.write(enviado)
+
+        if textract_client is not None:
+            texto_original = ocr(textract_client, conteudo)
+            texto_processado = ocr(textract_client, enviado) if resumo["processada"] else texto_original
+            resultado["palavras"] = word_recall(texto_original, texto_processado)
+            resultado["campos"], resultado["campos_diferentes"] = field_agreement(texto_original, texto_processado)
+        resultados.append(resultado)
+
+        palavras = f"{resultado['palavras']:.2f}" if "palavras" in resultado else '-'
+        campos = f"{resultado['campos']:.2f}" if "campos" in resultado else '-'
+        print(f"{resultado['imagem'][:39]:<40}{resumo['bytes_original'] / 1024:>9.0f}"
+              f"{resumo['bytes_enviados'] / 1024:>8.0f}{resultado['ms']:>7.0f}{palavras:>10}{campos:>8}")
+
+    total_original = sum(resultado["bytes_original"] for resultado in resultados)
+    total_enviado = sum(resultado["bytes_enviados"] for resultado in resultados)
+    if total_original:
+        print(f"Total: {total_original / 1024:.0f} KB -> {total_enviado / 1024:.0f} KB "
+              f"({1 - total_enviado / total_original:.0%} a menos)")
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Compara os modos de inferência (fp32, int8) dos extratores de question-answering.
+
+Cada modo roda em um processo separado, para que o pico de memória (RSS) de
+um não contamine o outro. Para cada modo são medidos o tempo de carga, a
+latência por nota (p50/p95), o pico de RSS e o acerto de cada campo em
+relação aos valores esperados — por padrão, as notas gravadas em
+`recorded/` com as respostas do Gemini como gabarito; `--cases` aceita um
+JSON com [{"texto": ..., "esperado": {campo: valor}}, ...].
+
+Uso (a partir de App/):
+    python benchmarks/compare_qa.py --extractor bert --modes fp32 int8 --tolerance 0.1
+
+Termina com código 1 se, em algum campo, o acerto de um modo ficar mais de
+`--tolerance` abaixo do primeiro modo da lista (a referência).
+"""
+import argparse
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import unicodedata
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+OTHERS_DIR = os.path.join(APP_DIR, 'others')
+sys.path[:0] = [BENCH_DIR, APP_DIR, OTHERS_DIR]
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from bench_pipeline import peak_rss_mb, percentile
+from fakes import load_recordings
+from textract_blocks import parse_response
+
+# Extratores comparáveis: nome -> (módulo em others/, função de extração)
+EXTRACTORS = {
+    'bert': ('extract_transformers_bert', 'extract_invoice_info_transf'),
+    'bert_large': ('extract_transformers2', 'extract_invoice_info'),
+}
+
+
+def recorded_cases():
+    gabaritos = load_recordings('gemini')
+    casos = []
+    for nome, resposta in load_recordings('detect').items():
+        if nome not in gabaritos:
+            continue
+        texto = gabaritos[nome]['text'].strip().replace('```json', '').replace('```', '')
+        casos.append({
+            "texto": parse_response(resposta).text().replace('\n', ' ').strip(),
+            "esperado": json.loads(texto),
+        })
+    return casos
+
+
+def normalize(valor):
+    if valor is None:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(valor).lower())
+    return re.sub(r'[^0-9a-z]', '', texto.encode('ascii', 'ignore').decode('ascii'))
+
+
+def matches(resposta, esperado):
+    """Acerto tolerante a formatação: um valor normalizado contém o outro."""
+    resposta, esperado = normalize(resposta), normalize(esperado)
+    return bool(resposta and esperado) and (esperado in resposta or resposta in esperado)
+
+
+def run_worker(args):
+    from backends import Backend
+    from qa_encoding import build_qa_engine
+    from qa_models import load_qa_pipeline
+
+    nome_modulo, nome_funcao = EXTRACTORS[args.extractor]
+    modulo = importlib.import_module(nome_modulo)
+    casos = load_cases(args.cases)
+
+    inicio = time.perf_counter()
+    pipe = load_qa_pipeline(args.model or modulo.QA_MODEL, 'cpu', args.worker, cache_dir=args.cache_dir)
+    tempo_carga = time.perf_counter() - inicio
+
+    modulo.qa_backend = Backend(modulo.qa_backend.name, lambda: pipe)
+    modulo.qa_batcher = Backend(modulo.qa_batcher.name, lambda: build_qa_engine(pipe, modulo.QUESTIONS))
+    extrair = getattr(modulo, nome_funcao)
+
+    respostas = [extrair(caso["texto"]) for caso in casos]  # também aquece o modelo
+    latencias = []
+    for _ in range(args.repeat):
+        for caso in casos:
+            t0 = time.perf_counter()
+            extrair(caso["texto"])
+            latencias.append(time.perf_counter() - t0)
+
+    json.dump({
+        "modo": args.worker,
+        "tempo_carga": tempo_carga,
+        "p50_ms": percentile(latencias, 50) * 1000,
+        "p95_ms": percentile(latencias, 95) * 1000,
+        "pico_rss_mb": peak_rss_mb(),
+        "respostas": respostas,
+    }, sys.stdout, ensure_ascii=False)
+
+
+def load_cases(caminho):
+    if not caminho:
+        return recorded_cases()
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def field_accuracy(respostas, casos):
+    acertos, totais = {}, {}
+    for resposta, caso in zip(respostas, casos):
+        for campo, esperado in caso["esperado"].items():
+            if esperado is None:
+                continue
+            totais[campo] = totais.get(campo, 0) + 1
+            acertos[campo] = acertos.get(campo, 0) + matches(resposta.get(campo), esperado)
+    return {campo: acertos[campo] / totais[campo] for campo in totais}
+
+
+def agreement(respostas, referencia):
+    campos = [
+        normalize(resposta.get(campo)) == normalize(valor)
+        for resposta, base in zip(respostas, referencia)
+        for campo, valor in base.items()
+    ]
+    return sum(campos) / len(campos) if campos else 1.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara os modos de inferência dos extratores de question-answering")
+    parser.add_argument('--extractor', choices=sorted(EXTRACTORS), default='bert')
+    parser.add_argument('--modes', nargs='+', default=['fp32', 'int8'], help="o primeiro é a referência")
+    parser.add_argument('--model', help="modelo ou diretório local (padrão: o do extrator)")
+    parser.add_argument('--cases', help="JSON com os textos e valores esperados")
+    parser.add_argument('--repeat', type=int, default=5, help="repetições de cada nota na medição de latência")
+    parser.add_argument('--cache-dir', default=os.path.join('.cache', 'qa'), help="onde guardar os modelos convertidos")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="queda máxima de acerto por campo")
+    parser.add_argument('--json', dest='saida', help="grava o relatório neste arquivo")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    casos = load_cases(args.cases)
+    resultados = []
+    for modo in args.modes:
+        comando = [sys.executable, os.path.abspath(__file__), '--worker', modo] + [
+            arg for arg in (argv if argv is not None else sys.argv[1:])
+        ]
+        processo = subprocess.run(comando, capture_output=True, text=True)
+        if processo.returncode != 0:
+            print(processo.stderr, file=sys.stderr)
+            raise SystemExit(f"Falha ao medir o modo {modo}")
+        # A última linha da saída é o relatório do processo (prints dos extratores vêm antes)
+        resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+        resultado["acerto"] = field_accuracy(resultado["respostas"], casos)
+        resultados.append(resultado)
+
+    referencia = resultados[0]
+    regressoes = []
+    print(f"{'modo':<8}{'carga s':>9}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>9}{'acerto':>8}{'concord.':>10}")
+    for resultado in resultados:
+        acerto = resultado["acerto"]
+        media = sum(acerto.values()) / len(acerto) if acerto else 0.0
+        resultado["concordancia"] = agreement(resultado["respostas"], referencia["respostas"])
+        print(f"{resultado['modo']:<8}{resultado['tempo_carga']:>9.2f}{resultado['p50_ms']:>10.1f}"
+              f"{resultado['p95_ms']:>10.1f}{resultado['pico_rss_mb']:>9.1f}{media:>8.2f}{resultado['concordancia']:>10.2f}")
+        for campo, valor in acerto.items():
+            if valor < referencia["acerto"].get(campo, 0.0) - args.tolerance:
+                regressoes.append(f"{resultado['modo']}: {campo} {referencia['acerto'][campo]:.2f} -> {valor:.2f}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    for regressao in regressoes:
+        print(f"ACERTO ABAIXO DA TOLERÂNCIA {regressao}", file=sys.stderr)
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+RECORDED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recorded')
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'images')
+
+
+class Latency:
+    """Atraso simulado: `mean` segundos, variando uniformemente em ±`jitter`."""
+
+    def __init__(self, mean=0.0, jitter=0.0, seed=None):
+        self.mean = mean
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        if self.mean <= 0 and self.jitter <= 0:
+            return
+        with self._lock:
+            atraso = self._random.uniform(self.mean - self.jitter, self.mean + self.jitter)
+        time.sleep(max(0.0, atraso))
+
+
+def load_recordings(kind, directory=RECORDED_DIR):
+    """Carrega as respostas gravadas `<nome>.<kind>.json`, indexadas pelo nome."""
+    gravacoes = {}
+    for nome_arquivo in sorted(os.listdir(directory)):
+        sufixo = f'.{kind}.json'
+        if nome_arquivo.endswith(sufixo):
+            with open(os.path.join(directory, nome_arquivo), 'r', encoding='utf-8') as f:
+                gravacoes[nome_arquivo[:-len(sufixo)]] = json.load(f)
+    return gravacoes
+
+
+def sample_images(directory=IMAGES_DIR, names=None):
+    """Imagens de exemplo (nome, bytes) que têm respostas gravadas."""
+    names = set(names or load_recordings('detect'))
+    imagens = []
+    for nome_arquivo in sorted(os.listdir(directory)):
+        nome = os.path.splitext(nome_arquivo)[0]
+        if nome in names:
+            with open(os.path.join(directory, nome_arquivo), 'rb') as f:
+                imagens.append((nome_arquivo, f.read()))
+    return imagens
+
+
+class _Replay:
+    # Escolhe a gravação pelo conteúdo da imagem ou pelo nome do objeto no S3;
+    # documentos desconhecidos recebem as gravações em rodízio
+    def __init__(self, gravacoes):
+        self.gravacoes = gravacoes
+        self.nomes = sorted(gravacoes)
+        self.por_hash = {}
+        for nome_arquivo, conteudo in sample_images(names=self.nomes):
+            nome = os.path.splitext(nome_arquivo)[0]
+            self.por_hash[hashlib.sha256(conteudo).hexdigest()] = nome
+            # Hash de content_key (cache.py), usado no nome dos objetos enviados pelo app
+            self.por_hash[hashlib.sha256(conteudo + b'\0').hexdigest()] = nome
+        self._proximo = 0
+        self._lock = threading.Lock()
+
+    def pick(self, document):
+        nome = None
+        if 'Bytes' in document:
+            nome = self.por_hash.get(hashlib.sha256(document['Bytes']).hexdigest())
+        elif 'S3Object' in document:
+            nome = os.path.splitext(os.path.basename(document['S3Object']['Name']))[0]
+            digest = re.match(r'[0-9a-f]{64}', nome)
+            if digest:
+                nome = self.por_hash.get(digest.group(), nome)
+        if nome not in self.gravacoes:
+            with self._lock:
+                nome = self.nomes[self._proximo % len(self.nomes)]
+                self._proximo += 1
+        return self.gravacoes[nome]
+
+
+class FakeTextract:
+    """Substituto local do cliente boto3 do Textract."""
+
+    def __init__(self, latency=None, directory=RECORDED_DIR):
+        self.latency = latency or Latency()
+        self._detect = _Replay(load_recordings('detect', directory))
+        self._expense = _Replay(load_recordings('expense', directory))
+        self.calls = 0
+
+    def detect_document_text(self, Document, **kwargs):
+        self.calls += 1
+        self.latency.sleep()
+        return self._detect.pick(Document)
+
+    def analyze_expense(self, Document, **kwargs):
+        self.calls += 1
+        self.latency.sleep()
+        return self._expense.pick(Document)
+
+
+class FakeS3:
+    """Substituto local do cliente boto3 do S3: um bucket em memória com
+    envio, leitura e listagem paginada (list_objects_v2) de objetos."""
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.bytes_uploaded = 0
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        conteudo = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.objects[(Bucket, Key)] = (conteudo, datetime.now(timezone.utc))
+            self.bytes_uploaded += len(conteudo)
+        self.latency.sleep()
+        return {'ETag': f'"{hashlib.md5(conteudo).hexdigest()}"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket, Key, Fileobj.read())
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.upload_fileobj(f, Bucket, Key)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.latency.sleep()
+        conteudo, modificado_em = self.objects[(Bucket, Key)]
+        return {'Body': io.BytesIO(conteudo), 'ContentLength': len(conteudo), 'LastModified': modificado_em}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, StartAfter='', ContinuationToken=None, **kwargs):
+        self.latency.sleep()
+        inicio = ContinuationToken or StartAfter
+        with self._lock:
+            chaves = sorted(
+                chave for bucket, chave in self.objects
+                if bucket == Bucket and chave.startswith(Prefix) and chave > inicio
+            )
+            pagina = chaves[:MaxKeys]
+            conteudos = [
+                {
+                    'Key': chave,
+                    'Size': len(self.objects[(Bucket, chave)][0]),
+                    'ETag': f'"{hashlib.md5(self.objects[(Bucket, chave)][0]).hexdigest()}"',
+                    'LastModified': self.objects[(Bucket, chave)][1],
+                }
+                for chave in pagina
+            ]
+        resposta = {'KeyCount': len(pagina), 'IsTruncated': len(chaves) > MaxKeys}
+        if conteudos:
+            resposta['Contents'] = conteudos
+        if resposta['IsTruncated']:
+            resposta['NextContinuationToken'] = pagina[-1]
+        return resposta
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """Substituto local do GenerativeModel do Gemini.
+
+    Responde com a gravação cuja nota aparece no prompt (pelo CNPJ ou nome do
+    emissor). Prompts em lote ("### NOTA <n> ###") recebem um array JSON.
+    """
+
+    def __init__(self, latency=None, directory=RECORDED_DIR):
+        self.latency = latency or Latency()
+        self.respostas = {}
+        for nome, gravacao in load_recordings('gemini', directory).items():
+            texto = gravacao['text']
+            dados = json.loads(texto.strip().replace('```json', '').replace('```', ''))
+            self.respostas[nome] = (texto, dados)
+        self.calls = 0
+
+    def _match(self, trecho):
+        for texto, dados in self.respostas.values():
+            chaves = (dados.get('CNPJ_emissor'), dados.get('nome_emissor'))
+            if any(chave and chave in trecho for chave in chaves):
+                return texto, dados
+        return None, None
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        self.latency.sleep()
+        partes = re.split(r'### NOTA (\d+) ###', prompt)
+        if len(partes) > 1:
+            itens = []
+            for numero, trecho in zip(partes[1::2], partes[2::2]):
+                _, dados = self._match(trecho)
+                itens.append({"nota": int(numero), **(dados or {})})
+            return FakeGeminiResponse(json.dumps(itens, ensure_ascii=False))
+
+        texto, _ = self._match(prompt)
+        return FakeGeminiResponse(texto if texto is not None else '{}')
+
+
+def as_upload(nome_arquivo, conteudo):
+    """Par (stream, nome) no formato aceito pelo cliente de testes do Flask."""
+    return io.BytesIO(conteudo), nome_arquivo
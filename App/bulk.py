@@ -0,0 +1,215 @@
+"""Reprocessamento em massa das notas já guardadas no bucket.
+
+Percorre os prefixos (por padrão `dinheiro/` e `outros/`) com
+`list_objects_v2`, página por página, e passa cada objeto pelo Textract e
+pelo backend de extração escolhido em um pool limitado, respeitando a taxa
+máxima de chamadas ao Textract e ao extrator. Cada página vira um arquivo
+Parquet em `--output` (part-00000.parquet, ...) e o progresso por prefixo
+fica em `--output/checkpoint.json`: rodar o mesmo comando depois de uma
+interrupção continua da página seguinte à última gravada.
+
+O texto do Textract fica no cache de resultados, indexado por chave e ETag
+do objeto: ao reprocessar por mudança de prompt ou de extrator, só a
+extração roda de novo.
+
+Uso (a partir de App/):
+    python bulk.py --output reprocessamento --backend tiered --workers 8 --textract-tps 5
+    python bulk.py --endpoint-url http://localhost:9000 --output teste   # S3 local (MinIO, LocalStack)
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import app
+from aws_clients import create_client
+from ratelimit import TokenBucket
+from uploads import TEXTRACT_INLINE_LIMIT
+
+PREFIXES = ('dinheiro/', 'outros/')
+
+COLUNAS = (
+    "bucket", "chave", "etag", "tamanho", "modificado_em", "backend",
+    *app.CAMPOS_NOTA, "origem_campos", "erro", "processado_em",
+)
+
+
+def iter_pages(s3_client, bucket, prefix, start_after=None, page_size=1000):
+    """Páginas de objetos do prefixo, em ordem de chave, após `start_after`."""
+    parametros = {'Bucket': bucket, 'Prefix': prefix, 'MaxKeys': page_size}
+    if start_after:
+        parametros['StartAfter'] = start_after
+    while True:
+        resposta = s3_client.list_objects_v2(**parametros)
+        # "Pastas" criadas pelo console aparecem como objetos vazios terminados em /
+        objetos = [objeto for objeto in resposta.get('Contents', []) if not objeto['Key'].endswith('/')]
+        if objetos:
+            yield objetos
+        if not resposta.get('IsTruncated'):
+            return
+        parametros['ContinuationToken'] = resposta['NextContinuationToken']
+
+
+class BulkJob:
+    def __init__(self, s3_client, bucket, output_dir, backend=None, workers=8, page_size=200,
+                 textract_tps=None, extract_rps=None, inline=False):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.output_dir = output_dir
+        self.backend = backend or app.backend_registry.default
+        self.workers = workers
+        self.page_size = page_size
+        # O cliente do Textract já respeita AWS_RATE_LIMITS; --textract-tps limita ainda mais este job
+        self.textract_limiter = TokenBucket(textract_tps) if textract_tps else None
+        self.extract_limiter = TokenBucket(extract_rps) if extract_rps else None
+        # inline: baixa o objeto e envia os bytes ao Textract (S3 local, que o Textract não alcança)
+        self.inline = inline
+        self.checkpoint_file = os.path.join(output_dir, 'checkpoint.json')
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {"backend": self.backend, "partes": 0, "processados": 0, "erros": 0, "prefixos": {}}
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("backend") != self.backend:
+            raise ValueError(
+                f"{self.output_dir} foi gerado com o backend {checkpoint.get('backend')}; "
+                f"use outro diretório para o backend {self.backend}"
+            )
+        return checkpoint
+
+    def write_checkpoint(self, checkpoint):
+        tmp = f"{self.checkpoint_file}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp, self.checkpoint_file)
+
+    def document_for(self, objeto):
+        if self.inline:
+            # O S3 local não é alcançável pelo Textract: sem os bytes não há como processar
+            if objeto.get('Size', 0) > TEXTRACT_INLINE_LIMIT:
+                return None
+            resposta = self.s3_client.get_object(Bucket=self.bucket, Key=objeto['Key'])
+            return {'Bytes': resposta['Body'].read()}
+        return {'S3Object': {'Bucket': self.bucket, 'Name': objeto['Key']}}
+
+    def process_object(self, objeto, extract):
+        etag = objeto.get('ETag', '').strip('"')
+        linha = dict.fromkeys(COLUNAS)
+        linha.update({
+            "bucket": self.bucket,
+            "chave": objeto['Key'],
+            "etag": etag,
+            "tamanho": objeto.get('Size'),
+            "modificado_em": str(objeto.get('LastModified')),
+            "backend": self.backend,
+        })
+        try:
+            chave_ocr = f"{app.ocr_cache_prefix(self.backend)}:s3:{self.bucket}/{objeto['Key']}:{etag}"
+            ocr = app.result_cache.get(chave_ocr)
+            if ocr is None:
+                document = self.document_for(objeto)
+                if document is None:
+                    linha["erro"] = (
+                        f"Objeto de {objeto.get('Size')} bytes acima do limite de "
+                        f"{TEXTRACT_INLINE_LIMIT} bytes do envio inline ao Textract; ignorado"
+                    )
+                    return linha
+                if self.textract_limiter is not None:
+                    self.textract_limiter.acquire()
+                ocr = app.run_ocr(document, self.backend)
+                if not ocr:
+                    linha["erro"] = "Falha ao extrair texto com Textract"
+                    return linha
+                app.result_cache.set(chave_ocr, ocr)
+
+            if self.extract_limiter is not None:
+                self.extract_limiter.acquire()
+            invoice_info, origem_campos = app.run_extraction(extract, self.backend, ocr)
+            # Colunas de texto: o Gemini pode devolver números em alguns campos
+            linha.update({
+                campo: str(valor) if valor is not None else None
+                for campo, valor in invoice_info.items() if campo in app.CAMPOS_NOTA
+            })
+            linha["origem_campos"] = json.dumps(origem_campos, ensure_ascii=False)
+        except Exception as e:
+            logging.error(f"Erro ao processar {objeto['Key']}: {e}")
+            linha["erro"] = str(e)
+        finally:
+            linha["processado_em"] = datetime.now(timezone.utc).isoformat()
+        return linha
+
+    def write_part(self, caminho, linhas):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        esquema = pa.schema([
+            (coluna, pa.int64() if coluna == "tamanho" else pa.string()) for coluna in COLUNAS
+        ])
+        tmp = f"{caminho}.tmp"
+        pq.write_table(pa.Table.from_pylist(linhas, schema=esquema), tmp)
+        os.replace(tmp, caminho)
+
+    def run(self, prefixes=PREFIXES):
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint = self.read_checkpoint()
+        extract = app.backend_registry.get(self.backend)
+        inicio = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk') as pool:
+            for prefix in prefixes:
+                estado = checkpoint["prefixos"].setdefault(prefix, {"start_after": None, "concluido": False})
+                if estado["concluido"]:
+                    continue
+                if estado["start_after"]:
+                    logging.info(f"Retomando {prefix} após {estado['start_after']}")
+
+                for pagina in iter_pages(self.s3_client, self.bucket, prefix, estado["start_after"], self.page_size):
+                    linhas = list(pool.map(lambda objeto: self.process_object(objeto, extract), pagina))
+                    self.write_part(os.path.join(self.output_dir, f"part-{checkpoint['partes']:05d}.parquet"), linhas)
+
+                    checkpoint["partes"] += 1
+                    checkpoint["processados"] += len(linhas)
+                    checkpoint["erros"] += sum(linha["erro"] is not None for linha in linhas)
+                    estado["start_after"] = pagina[-1]['Key']
+                    self.write_checkpoint(checkpoint)
+                    logging.info(
+                        f"{checkpoint['processados']} notas ({checkpoint['erros']} com erro), "
+                        f"{checkpoint['processados'] / (time.perf_counter() - inicio):.1f}/s"
+                    )
+
+                estado["concluido"] = True
+                self.write_checkpoint(checkpoint)
+        return checkpoint
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocessa as notas guardadas no bucket")
+    parser.add_argument('--bucket', default=app.BUCKET_NAME)
+    parser.add_argument('--prefix', action='append', dest='prefixes', help="prefixo a percorrer (repetível; padrão: dinheiro/ e outros/)")
+    parser.add_argument('--output', required=True, help="diretório dos arquivos Parquet e do checkpoint")
+    parser.add_argument('--backend', choices=app.backend_registry.names(), help="backend de extração (padrão: EXTRACTION_MODE)")
+    parser.add_argument('--workers', type=int, default=8, help="objetos processados ao mesmo tempo")
+    parser.add_argument('--page-size', type=int, default=200, help="objetos por página (e por arquivo Parquet)")
+    parser.add_argument('--textract-tps', type=float, help="chamadas por segundo ao Textract neste job (padrão: só AWS_RATE_LIMITS)")
+    parser.add_argument('--extract-rps', type=float, help="chamadas por segundo ao extrator (ex.: limite do Gemini)")
+    parser.add_argument('--endpoint-url', help="endpoint de um S3 local; implica --inline")
+    parser.add_argument('--inline', action='store_true', help="baixa cada objeto e envia os bytes ao Textract")
+    args = parser.parse_args(argv)
+
+    s3_client = create_client('s3', endpoint_url=args.endpoint_url) if args.endpoint_url else app.get_s3_client()
+    job = BulkJob(
+        s3_client, args.bucket, args.output, args.backend, args.workers, args.page_size,
+        args.textract_tps, args.extract_rps, inline=args.inline or bool(args.endpoint_url),
+    )
+    checkpoint = job.run(args.prefixes or PREFIXES)
+    print(f"Concluído: {checkpoint['processados']} notas, {checkpoint['erros']} com erro, em {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Caminhos relativos (CACHE_DIR, INVOICE_DB...) partem do diretório App, e não
+# do diretório de onde o processo foi iniciado
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_path(caminho):
+    return os.path.join(APP_DIR, caminho) if caminho else caminho
+
+
+def content_key(*partes):
+    """Gera uma chave de cache a partir do conteúdo (bytes ou texto)."""
+    sha = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        sha.update(parte)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+# Nível em memória: LRU limitado por número de itens e com expiração por TTL
+class MemoryCache:
+    def __init__(self, max_items=1024, ttl=3600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._itens.get(key)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.time():
+                del self._itens[key]
+                return None
+            self._itens.move_to_end(key)
+            return valor
+
+    def set(self, key, valor):
+        with self._lock:
+            self._itens[key] = (time.time() + self.ttl, valor)
+            self._itens.move_to_end(key)
+            while len(self._itens) > self.max_items:
+                self._itens.popitem(last=False)
+
+
+# Nível em disco: um arquivo JSON por chave, limitado pelo tamanho total em
+# bytes (remove os mais antigos primeiro) e com expiração por TTL. Ao passar
+# do limite, remove até `low_water` dele, para que a varredura do diretório
+# não se repita a cada gravação com o cache cheio
+class DiskCache:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, ttl=7 * 86400, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._evicting = False
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(tamanho for _, tamanho, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _entries(self):
+        for raiz, _, arquivos in os.walk(self.directory):
+            for nome in arquivos:
+                if not nome.endswith('.json'):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    stat = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                yield caminho, stat.st_size, stat.st_mtime
+
+    def _remove(self, caminho, tamanho):
+        try:
+            os.remove(caminho)
+            self._total_bytes -= tamanho
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        caminho = self._path(key)
+        try:
+            stat = os.stat(caminho)
+            if stat.st_mtime + self.ttl < time.time():
+                with self._lock:
+                    self._remove(caminho, stat.st_size)
+                return None
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Entrada de cache inválida em {caminho}: {e}")
+            return None
+
+    def set(self, key, valor):
+        caminho = self._path(key)
+        dados = json.dumps(valor, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            try:
+                self._total_bytes -= os.path.getsize(caminho)
+            except FileNotFoundError:
+                pass
+            temporario = f"{caminho}.{threading.get_ident()}.tmp"
+            with open(temporario, 'wb') as f:
+                f.write(dados)
+            os.replace(temporario, caminho)
+            self._total_bytes += len(dados)
+            # Uma thread faz a limpeza; as outras seguem gravando
+            limpar = self._total_bytes > self.max_bytes and not self._evicting
+            if limpar:
+                self._evicting = True
+        if limpar:
+            try:
+                self._evict()
+            finally:
+                self._evicting = False
+
+    def _evict(self):
+        # Remove expirados e, se ainda necessário, os mais antigos até
+        # `low_water` do limite. A varredura do diretório é feita fora do lock
+        agora = time.time()
+        entradas = sorted(self._entries(), key=lambda entrada: entrada[2])
+        alvo = self.max_bytes * self.low_water
+        with self._lock:
+            self._total_bytes = sum(tamanho for _, tamanho, _ in entradas)
+        for caminho, tamanho, mtime in entradas:
+            if self._total_bytes <= alvo and mtime + self.ttl >= agora:
+                break
+            with self._lock:
+                self._remove(caminho, tamanho)
+
+
+class ResultCache:
+    """Cache em dois níveis: consulta a memória primeiro e depois o disco."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        valor = self.memory.get(key)
+        if valor is not None:
+            return valor
+        if self.disk is not None:
+            valor = self.disk.get(key)
+            if valor is not None:
+                self.memory.set(key, valor)
+        return valor
+
+    def set(self, key, valor):
+        self.memory.set(key, valor)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, valor)
+            except OSError as e:
+                logging.warning(f"Falha ao gravar cache em disco: {e}")
+
+
+def cache_from_env():
+    memory = MemoryCache(
+        max_items=int(os.getenv('CACHE_MEMORY_ITEMS', 1024)),
+        ttl=float(os.getenv('CACHE_MEMORY_TTL', 3600)),
+    )
+    # CACHE_DIR vazio desativa o nível em disco
+    diretorio = app_path(os.getenv('CACHE_DIR', '.cache'))
+    disk = None
+    if diretorio:
+        disk = DiskCache(
+            diretorio,
+            max_bytes=int(float(os.getenv('CACHE_DISK_MAX_MB', 512)) * 1024 * 1024),
+            ttl=float(os.getenv('CACHE_DISK_TTL', 7 * 86400)),
+        )
+    return ResultCache(memory, disk)
@@ -0,0 +1,188 @@
+"""Detecção de fotos quase iguais da mesma nota (hash perceptual).
+
+A mesma nota costuma ser fotografada mais de uma vez, com recorte e
+exposição um pouco diferentes; o hash dos bytes não pega esses casos. Cada
+imagem recebe dois hashes de 64 bits calculados com NumPy sobre a região do
+papel em tons de cinza:
+- pHash: sinais dos coeficientes de baixa frequência da DCT 32x32;
+- dHash: gradiente horizontal de uma miniatura 9x8.
+
+Duas fotos são a mesma nota quando os dois hashes ficam a até
+PHASH_MAX_DISTANCE bits de distância (Hamming). O índice usa multi-index
+hashing: o pHash é dividido em blocos e, pelo princípio da casa dos pombos,
+uma imagem a até `r` bits de distância tem algum bloco a até `r // blocos`
+bits do bloco correspondente — só esses candidatos são comparados, o que
+mantém a busca rápida com milhões de entradas.
+"""
+import io
+import json
+import logging
+import os
+import threading
+from itertools import combinations
+
+from cache import app_path
+
+PHASH_DEDUP = os.getenv('PHASH_DEDUP', '0') == '1'
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', 8))
+# Caminhos relativos partem de App/, qualquer que seja o diretório de trabalho
+PHASH_INDEX_FILE = app_path(os.getenv('PHASH_INDEX_FILE', os.path.join('.cache', 'phash.jsonl')))
+
+BITS = 64
+
+_dct_cache = {}
+
+
+def _dct_matrix(n):
+    import numpy as np
+
+    if n not in _dct_cache:
+        k = np.arange(n)[:, None]
+        x = np.arange(n)[None, :]
+        _dct_cache[n] = np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    return _dct_cache[n]
+
+
+def _to_int(bits):
+    import numpy as np
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), 'big')
+
+
+def phash(cinza, tamanho=32, baixas=8):
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(cinza.resize((tamanho, tamanho), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(tamanho)
+    coeficientes = (dct @ pixels @ dct.T)[:baixas, :baixas].ravel()
+    # O primeiro coeficiente (média) fica fora da mediana: só mede o brilho
+    return _to_int(coeficientes > np.median(coeficientes[1:]))
+
+
+def dhash(cinza, tamanho=8):
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(cinza.resize((tamanho + 1, tamanho), Image.LANCZOS), dtype=np.int16)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hashes(conteudo):
+    """(pHash, dHash) da imagem, ou None se o Pillow não conseguir abri-la."""
+    from PIL import Image, ImageOps
+    from preprocess import find_paper_box
+
+    try:
+        imagem = ImageOps.exif_transpose(Image.open(io.BytesIO(conteudo)))
+        cinza = imagem.convert('L')
+    except Exception:
+        return None
+    # O fundo muda de uma foto para outra; o hash é calculado só sobre o papel
+    caixa = find_paper_box(cinza)
+    if caixa is not None:
+        cinza = cinza.crop(caixa)
+    return phash(cinza), dhash(cinza)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """Índice de hashes de 64 bits para busca por distância de Hamming.
+
+    `blocks` divide o pHash em partes iguais; cada parte tem uma tabela
+    bloco -> posições. A busca com raio `r` testa, em cada tabela, os blocos
+    a até `r // blocks` bits do bloco consultado.
+    """
+
+    def __init__(self, max_distance=PHASH_MAX_DISTANCE, blocks=4):
+        self.max_distance = max_distance
+        self.blocks = blocks
+        self._largura = BITS // blocks
+        self._mascara = (1 << self._largura) - 1
+        self._tabelas = [{} for _ in range(blocks)]
+        self._phashes = []
+        self._dhashes = []
+        self._valores = []
+        self._vizinhancas = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._valores)
+
+    def _partes(self, valor):
+        return [(valor >> (i * self._largura)) & self._mascara for i in range(self.blocks)]
+
+    def _vizinhanca(self, raio):
+        # Máscaras de todos os blocos a até `raio` bits de distância
+        if raio not in self._vizinhancas:
+            mascaras = [0]
+            for distancia in range(1, raio + 1):
+                for posicoes in combinations(range(self._largura), distancia):
+                    mascaras.append(sum(1 << posicao for posicao in posicoes))
+            self._vizinhancas[raio] = mascaras
+        return self._vizinhancas[raio]
+
+    def add(self, hashes, valor):
+        p, d = hashes
+        with self._lock:
+            posicao = len(self._valores)
+            self._phashes.append(p)
+            self._dhashes.append(d)
+            self._valores.append(valor)
+            for tabela, parte in zip(self._tabelas, self._partes(p)):
+                tabela.setdefault(parte, []).append(posicao)
+
+    def search(self, hashes, max_distance=None):
+        """Entradas com pHash e dHash a até `max_distance` bits, da mais próxima
+        para a mais distante: lista de (distância, valor)."""
+        p, d = hashes
+        raio = self.max_distance if max_distance is None else max_distance
+        mascaras = self._vizinhanca(raio // self.blocks)
+        encontrados = {}
+        with self._lock:
+            for tabela, parte in zip(self._tabelas, self._partes(p)):
+                for mascara in mascaras:
+                    for posicao in tabela.get(parte ^ mascara, ()):
+                        if posicao in encontrados:
+                            continue
+                        distancia = max(hamming(p, self._phashes[posicao]), hamming(d, self._dhashes[posicao]))
+                        if distancia <= raio:
+                            encontrados[posicao] = distancia
+            return [
+                (distancia, self._valores[posicao])
+                for posicao, distancia in sorted(encontrados.items(), key=lambda item: (item[1], -item[0]))
+            ]
+
+
+class PersistentHammingIndex(HammingIndex):
+    """HammingIndex gravado em JSONL (uma entrada por linha, só acréscimos)."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for numero, linha in enumerate(f, 1):
+                try:
+                    entrada = json.loads(linha)
+                    super().add((int(entrada.pop("phash"), 16), int(entrada.pop("dhash"), 16)), entrada)
+                except (ValueError, KeyError) as e:
+                    # Linha incompleta de uma gravação interrompida
+                    logging.warning(f"Entrada inválida em {self.path}:{numero}: {e}")
+        logging.info(f"Índice de hashes perceptuais carregado: {len(self)} imagens")
+
+    def add(self, hashes, valor):
+        super().add(hashes, valor)
+        if not self.path:
+            return
+        linha = json.dumps({"phash": f"{hashes[0]:016x}", "dhash": f"{hashes[1]:016x}", **valor}, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(linha + "\n")
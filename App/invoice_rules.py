@@ -0,0 +1,398 @@
+import re
+from datetime import date
+
+# Regras compiladas uma única vez na importação, a partir dos padrões de
+# others/extract_regex.py
+
+nome_pattern = re.compile(r'(.+?)\s+(LTDA|LIDA|Ltds|Ltda|S\.A\.|EIRELI|- ME)\b', re.IGNORECASE)
+
+# Padrão para CNPJ (ex.: 12.345.678/0001-12)
+cnpj_pattern = re.compile(r'''
+    (\d{2}[\.\s_]?\d{3}[\.\s_]?\d{3}[\.\s_/]?\d{4}[\.\s_-]?\d{2})  # XX.XXX.XXX/XXXX-XX com variações de separadores
+    | (\d{14})  # CNPJ contínuo sem formatação
+''', re.VERBOSE)
+
+# Padrão para endereços
+endereco_pattern = re.compile(r'''
+    (RUA|ALAMEDA|TRECHO|AU|AV|Rua|AVENIDA|ROD|RODOVIA|RUR|Ave)  # Prefixos do endereço
+    [\s,.-]+  # Separadores comuns (espaço, vírgula, ponto, hífen)
+    ([\w\s,.-]+)  # Restante do endereço (pode incluir letras, números, espaços, vírgulas, pontos, hífens)
+''', re.VERBOSE | re.IGNORECASE)
+
+# Palavras do cabeçalho da nota que o OCR emenda no fim do endereço
+# ("... Recife CNPJ:", "... RS DANFE NFC-e")
+cabecalho_pattern = re.compile(r'''
+    (?<!\w)
+    (CNPJ | CPF | DANFE | NFC-?e | NF-?e | I\.?E\.? | INSCRI[CÇ][AÃ]O\s+ESTADUAL
+     | DOCUMENTO\s+AUXILIAR | CUPOM\s+FISCAL | EXTRATO)
+    (?!\w)
+''', re.VERBOSE | re.IGNORECASE)
+
+# UF no fim do endereço ("..., Caxias do Sul, RS", "... Recife - PE")
+uf_final_pattern = re.compile(
+    r'[\s,/-](AC|AL|AM|AP|BA|CE|DF|ES|GO|MA|MG|MS|MT|PA|PB|PE|PI|PR|RJ|RN|RO|RR|RS|SC|SE|SP|TO)\.?$'
+)
+
+# Padrão para CPF (ex.: 123.456.789-09, 123 456 789 09, 12345678909)
+cpf_pattern = re.compile(r'''
+    (?<!\S)  # Verifica se não há um caractere não-espaço antes (ou seja, espaço ou início do texto)
+    (
+        \d{3}[\.\s-]?\d{3}[\.\s-]?\d{3}[\.\s-]?\d{2}  # CPF formatado (123.456.789-09, 123 456 789 09, etc.)
+        | \d{11}  # CPF sem formatação (19044690868)
+        | nao\s*identificado  # "nao identificado"
+        | não\s*informado  # "não informado"
+        | NAO\s*IDENTIFICADO  # "NAO IDENTIFICADO"
+    )
+    (?!\S)  # Verifica se não há um caractere não-espaço depois (ou seja, espaço ou fim do texto)
+''', re.VERBOSE | re.IGNORECASE)
+
+# Padrão para data de emissão no formato DD/MM/AAAA
+date_pattern = re.compile(r'\d{2}/\d{2}/\d{4}')
+
+# Números de 9 dígitos que começam com 000 (formatados ou não)
+nota_pattern_nove_digitos = re.compile(r'''
+    (
+        000[\.\s-]?\d{3}[\.\s-]?\d{3}  # Números formatados (000.650.509, 000 650 509, etc.)
+        | 000\d{6}  # Números não formatados (000000139)
+    )
+    (?!\S)  # Lookahead negativo para espaços ou fim do texto
+''', re.VERBOSE)
+
+# Números de 6 dígitos isolados
+nota_pattern_seis_digitos = re.compile(r'''
+    (?<!\d)  # Lookbehind negativo: garante que não há um dígito antes
+    (\d{6})  # Captura exatamente 6 dígitos
+    (?!\d)   # Lookahead negativo: garante que não há um dígito depois
+''', re.VERBOSE)
+
+# Série da nota fiscal
+serie_pattern = re.compile(r'''
+    (Serie | Série | serie | série)\s*  # Palavra "Serie" (pode ter espaços após)
+    [:\-]?\s*  # Separador opcional (dois pontos ou hífen, seguido de espaços opcionais)
+    (\d{1,3})  # Captura números com 1 a 3 dígitos
+''', re.VERBOSE | re.IGNORECASE)
+
+# Valor total (considerando diversas variações)
+valor_pattern = re.compile(r'''
+    (?:Total|Valor\s+Total|TOTAL)  # Prefixos (Total, Valor Total)
+    \s*  # Espaços opcionais
+    [:\-]?\s*  # Separadores opcionais (dois pontos, hífen, espaços)
+    (?:R\$|RS)?\s*  # Símbolo monetário opcional (R$, RS)
+    (\d{1,3}(?:[\s,.]?\d{3})*(?:[.,]\d{2}))  # Valor monetário (com formatação variada)
+''', re.VERBOSE | re.IGNORECASE)
+
+# Forma de pagamento por palavras-chave (a primeira encontrada vence)
+pagamento_pattern = re.compile(
+    r'\b(dinheiro|pix|d[ée]bito|cr[ée]dito|cart[ãa]o)\b', re.IGNORECASE
+)
+PAGAMENTOS = {
+    'dinheiro': 'Dinheiro',
+    'pix': 'Pix',
+    'debito': 'Débito',
+    'débito': 'Débito',
+    'credito': 'Crédito',
+    'crédito': 'Crédito',
+    'cartao': 'Cartão',
+    'cartão': 'Cartão',
+}
+
+consumidor_nao_identificado_pattern = re.compile(r'n[aã]o\s*(identificado|informado)', re.IGNORECASE)
+cpf_keyword_pattern = re.compile(r'\b(CPF|CNPJ/CPF|CONSUMIDOR)\b', re.IGNORECASE)
+valor_monetario_pattern = re.compile(r'\d{1,3}(?:[\s,.]?\d{3})*[.,]\d{2}')
+
+
+def only_digits(valor):
+    return re.sub(r'\D', '', valor or '')
+
+
+# Motor de extração ------------------------------------------------------------
+#
+# Para não varrer o texto uma vez por campo com regex case-insensitive, o texto
+# é convertido uma única vez em uma "forma" em bytes (latin-1): minúsculas,
+# todo dígito vira '0' e todo espaço vira ' ', precedida de um espaço. Cada
+# caractere continua na mesma posição, então as regras viram buscas por
+# prefixos literais nessa forma, que param no primeiro resultado; o valor é
+# sempre recortado do texto original. Textos com caracteres fora do latin-1
+# usam diretamente os padrões acima, com o mesmo resultado.
+
+def _build_shape_table():
+    tabela = bytearray(range(256))
+    for codigo in range(256):
+        caractere = chr(codigo)
+        if caractere.isdecimal():
+            tabela[codigo] = ord('0')
+        elif caractere.isspace():
+            tabela[codigo] = ord(' ')
+        else:
+            tabela[codigo] = ord(caractere.lower())
+    return bytes(tabela)
+
+_SHAPE_TABLE = _build_shape_table()
+
+# Bytes do latin-1 que o \w (Unicode) aceita, para usar em padrões de bytes
+_WORD = re.escape(bytes(c for c in range(256) if re.match(r'\w', chr(c))).decode('latin-1')).encode('latin-1')
+
+_nome_anchor = re.compile(
+    rb' (?:(?:ltda|lida|ltds|eireli|- me)(?![' + _WORD + rb'])|s\.a\.(?=[' + _WORD + rb']))'
+)
+_cnpj_shape = re.compile(rb'00[. _]?000[. _]?000[. _/]?0000[. _-]?00')
+_endereco_shape = re.compile(
+    rb'(?:rua|alameda|trecho|au|av|rua|avenida|rod|rodovia|rur|ave)[ ,.-]+[' + _WORD + rb' ,.-]+'
+)
+_cpf_shapes = (
+    re.compile(rb' 000[. -]?000[. -]?000[. -]?00(?![^ ])'),
+    re.compile(rb' nao *identificado(?![^ ])'),
+    re.compile(' não *informado(?![^ ])'.encode('latin-1')),
+)
+_nota_seis_shape = re.compile(rb'000000+')
+_serie_shape = re.compile('(?:serie|série) *[:\\-]? *(0{1,3})'.encode('latin-1'))
+_valor_shape = re.compile(rb'total *[:\-]? *(?:r\$|rs)? *(0{1,3}(?:[ ,.]?000)*(?:[.,]00))')
+_pagamento_shape = re.compile(
+    b'(?<![' + _WORD + b'])(dinheiro|pix|d[e\xe9]bito|cr[e\xe9]dito|cart[a\xe3]o)(?![' + _WORD + b'])'
+)
+
+
+def _shape(text):
+    forma = text.encode('latin-1', 'replace')
+    if forma.count(b'?') != text.count('?'):
+        return None
+    return b' ' + forma.translate(_SHAPE_TABLE)
+
+
+def _match_fields(text, forma):
+    """Localiza cada campo e devolve {campo: (inicio, fim)} no texto original."""
+    if forma is None:
+        return _match_fields_slow(text)
+
+    spans = {}
+    # A forma tem um espaço a mais no início: posição na forma - 1 = posição no texto
+    if _nome_anchor.search(forma):
+        match = nome_pattern.search(text)
+        if match:
+            spans["nome_emissor"] = match.span()
+
+    match = _cnpj_shape.search(forma)
+    if match:
+        spans["CNPJ_emissor"] = (match.start() - 1, match.end() - 1)
+
+    match = _endereco_shape.search(forma)
+    if match:
+        spans["endereco_emissor"] = (match.start() - 1, match.end() - 1)
+
+    inicio_cpf = None
+    for padrao in _cpf_shapes:
+        match = padrao.search(forma)
+        if match and (inicio_cpf is None or match.start() < inicio_cpf[0]):
+            inicio_cpf = (match.start(), match.end() - 1)
+    if inicio_cpf:
+        spans["CNPJ_CPF_consumidor"] = inicio_cpf
+
+    inicio = forma.find(b'00/00/0000')
+    if inicio != -1:
+        spans["data_emissao"] = (inicio - 1, inicio + 9)
+
+    match = nota_pattern_nove_digitos.search(text)
+    if match:
+        spans["numero_nota_nove"] = match.span(1)
+    else:
+        for match in _nota_seis_shape.finditer(forma):
+            if match.end() - match.start() == 6:
+                spans["numero_nota_seis"] = (match.start() - 1, match.end() - 1)
+                break
+
+    match = _serie_shape.search(forma)
+    if match:
+        spans["serie_nota_fiscal"] = (match.start(1) - 1, match.end(1) - 1)
+
+    match = _valor_shape.search(forma)
+    if match:
+        spans["valor_total"] = (match.start(1) - 1, match.end(1) - 1)
+
+    return spans
+
+
+def _match_fields_slow(text):
+    spans = {}
+    padroes = (
+        ("nome_emissor", nome_pattern, 0),
+        ("CNPJ_emissor", cnpj_pattern, 0),
+        ("endereco_emissor", endereco_pattern, 0),
+        ("CNPJ_CPF_consumidor", cpf_pattern, 0),
+        ("data_emissao", date_pattern, 0),
+        ("serie_nota_fiscal", serie_pattern, 2),
+        ("valor_total", valor_pattern, 1),
+    )
+    for campo, padrao, grupo in padroes:
+        match = padrao.search(text)
+        if match:
+            spans[campo] = match.span(grupo)
+
+    match = nota_pattern_nove_digitos.search(text)
+    if match:
+        spans["numero_nota_nove"] = match.span(1)
+    else:
+        match = nota_pattern_seis_digitos.search(text)
+        if match:
+            spans["numero_nota_seis"] = match.span(1)
+    return spans
+
+
+def _invoice_info_from_spans(text, spans):
+    def recorte(campo):
+        span = spans.get(campo)
+        return text[span[0]:span[1]] if span else None
+
+    numero_nota = recorte("numero_nota_seis")
+    if "numero_nota_nove" in spans:
+        numero_nota = recorte("numero_nota_nove").replace(".", "").replace(" ", "").replace("-", "")
+
+    endereco = recorte("endereco_emissor")
+    return {
+        "nome_emissor": recorte("nome_emissor"),
+        "CNPJ_emissor": recorte("CNPJ_emissor"),
+        "endereco_emissor": endereco[:70].strip() if endereco else None,
+        "CNPJ_CPF_consumidor": recorte("CNPJ_CPF_consumidor"),
+        "data_emissao": recorte("data_emissao"),
+        "numero_nota_fiscal": numero_nota,
+        "serie_nota_fiscal": recorte("serie_nota_fiscal"),
+        "valor_total": recorte("valor_total"),
+        "forma_pgto": "Dinheiro" if "dinheiro" in text.lower() else "Cartão",
+    }
+
+
+def extract_invoice_info_regex(text):
+    """Mesmo resultado de others/extract_regex.py:extract_invoice_info_spacy, sem spaCy."""
+    return _invoice_info_from_spans(text, _match_fields(text, _shape(text)))
+
+
+def extract_invoice_info_regex_batch(texts):
+    return [extract_invoice_info_regex(text) for text in texts]
+
+
+def extract_rule_fields(text):
+    """Campos encontrados pelas regras, para a extração em camadas do app.
+
+    Difere de extract_invoice_info_regex na forma de pagamento, que vem da
+    primeira palavra-chave encontrada (ou None), e no nome e número da nota,
+    que saem sem espaços e sem formatação.
+    """
+    forma = _shape(text)
+    info = _invoice_info_from_spans(text, _match_fields(text, forma))
+    if info["nome_emissor"]:
+        info["nome_emissor"] = info["nome_emissor"].strip()
+    if info["numero_nota_fiscal"]:
+        info["numero_nota_fiscal"] = only_digits(info["numero_nota_fiscal"])
+    if info["endereco_emissor"]:
+        cabecalho = cabecalho_pattern.search(info["endereco_emissor"])
+        if cabecalho:
+            info["endereco_emissor"] = info["endereco_emissor"][:cabecalho.start()].rstrip(' ,.:;-')
+
+    if forma is not None:
+        match = _pagamento_shape.search(forma)
+        pagamento = match and text[match.start(1) - 1:match.end(1) - 1]
+    else:
+        match = pagamento_pattern.search(text)
+        pagamento = match and match.group(1)
+    info["forma_pgto"] = PAGAMENTOS[pagamento.lower()] if pagamento else None
+    return info
+
+
+# Validadores -----------------------------------------------------------------
+
+def _check_digits(digitos, pesos):
+    soma = sum(int(d) * p for d, p in zip(digitos, pesos))
+    resto = soma % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+def valid_cnpj(valor):
+    digitos = only_digits(valor)
+    if len(digitos) != 14 or digitos == digitos[0] * 14:
+        return False
+    pesos = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    dv1 = _check_digits(digitos[:12], pesos)
+    dv2 = _check_digits(digitos[:12] + dv1, [6] + pesos)
+    return digitos[12:] == dv1 + dv2
+
+
+def valid_cpf(valor):
+    digitos = only_digits(valor)
+    if len(digitos) != 11 or digitos == digitos[0] * 11:
+        return False
+    dv1 = _check_digits(digitos[:9], range(10, 1, -1))
+    dv2 = _check_digits(digitos[:9] + dv1, range(11, 1, -1))
+    return digitos[9:] == dv1 + dv2
+
+
+def valid_date(valor):
+    match = re.fullmatch(r'(\d{2})[/-](\d{2})[/-](\d{4})', (valor or '').strip())
+    if not match:
+        return False
+    dia, mes, ano = (int(parte) for parte in match.groups())
+    try:
+        data = date(ano, mes, dia)
+    except ValueError:
+        return False
+    return 2000 <= data.year <= date.today().year + 1
+
+
+def valid_address(valor):
+    """Endereço sem restos do cabeçalho, com logradouro ou número e com a localidade.
+
+    A localidade é o bairro/cidade depois do primeiro número ou a UF no fim;
+    "Rua X 49" sozinho fica pendente, assim como um recorte que termina em
+    "CNPJ" ou "DANFE".
+    """
+    valor = valor.strip()
+    if not 10 <= len(valor) <= 120 or cabecalho_pattern.search(valor):
+        return False
+    numero = re.search(r'\d', valor)
+    if not endereco_pattern.match(valor) and numero is None:
+        return False
+    if uf_final_pattern.search(valor):
+        return True
+    return numero is not None and re.search(r'[^\W\d_]{2,}', valor[numero.end():]) is not None
+
+
+def valid_money(valor):
+    return bool(valor_monetario_pattern.fullmatch((valor or '').strip()))
+
+
+VALIDADORES = {
+    "nome_emissor": lambda valor: 3 <= len(valor) <= 80 and any(c.isalpha() for c in valor),
+    "CNPJ_emissor": valid_cnpj,
+    "endereco_emissor": valid_address,
+    "CNPJ_CPF_consumidor": lambda valor: valid_cpf(valor) or valid_cnpj(valor),
+    "data_emissao": valid_date,
+    "numero_nota_fiscal": lambda valor: only_digits(valor) == valor and 1 <= len(valor) <= 9,
+    "serie_nota_fiscal": lambda valor: valor.isdigit() and len(valor) <= 3,
+    "valor_total": valid_money,
+    "forma_pgto": lambda valor: valor in PAGAMENTOS.values(),
+}
+
+
+def validate_field(campo, valor):
+    if valor is None:
+        return False
+    return VALIDADORES[campo](str(valor))
+
+
+def validate_rule_fields(text, info):
+    """Separa os campos encontrados pelas regras em válidos e pendentes.
+
+    O consumidor é opcional: sem CPF válido, o campo só fica pendente quando
+    o texto menciona CPF/consumidor e não diz que ele não foi identificado.
+    """
+    validos = {}
+    pendentes = []
+    for campo, valor in info.items():
+        if validate_field(campo, valor):
+            validos[campo] = valor
+        elif campo == "CNPJ_CPF_consumidor" and (
+            consumidor_nao_identificado_pattern.search(text)
+            or not cpf_keyword_pattern.search(text)
+        ):
+            validos[campo] = None
+        else:
+            pendentes.append(campo)
+    return validos, pendentes
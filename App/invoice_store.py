@@ -0,0 +1,313 @@
+"""Armazenamento local das notas extraídas (SQLite em modo WAL).
+
+Cada resultado novo de `process_file` vira uma linha da tabela `notas`, com
+os campos de busca normalizados em colunas indexadas:
+- `cnpj_emissor`: só os dígitos;
+- `data_emissao`: AAAA-MM-DD ('' quando a data não é válida), para que as
+  faixas de datas sejam faixas do índice;
+- `valor_total`: em centavos, para faixas e somas exatas;
+- `forma_pgto`.
+`informacoes_nota` e `origem_campos` ficam em JSON, como foram devolvidos.
+
+As gravações não acontecem na requisição: `add` entrega a nota a um
+MicroBatcher, e a thread dele grava os lotes em uma única transação. No modo
+WAL as consultas (uma conexão por thread) não esperam pelas gravações.
+
+A paginação é por cursor (keyset) sobre (data_emissao, id), a mesma ordem
+dos índices: cada página é uma busca no índice a partir da última linha da
+página anterior, sem OFFSET, e custa o mesmo na primeira e na milésima página.
+Consultas só por faixa de valor seguem a ordem de (valor_total, id), para
+percorrer o índice do valor em vez de varrer as datas.
+"""
+import atexit
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from batching import MicroBatcher
+from cache import app_path
+from invoice_rules import only_digits, valid_date, valid_money
+from metrics import registry
+
+# Caminhos relativos partem de App/, qualquer que seja o diretório de trabalho
+INVOICE_DB = app_path(os.getenv('INVOICE_DB', os.path.join('.cache', 'notas.db')))
+INVOICE_DB_BATCH = int(os.getenv('INVOICE_DB_BATCH', 500))
+INVOICE_DB_WAIT = float(os.getenv('INVOICE_DB_WAIT', 1.0))
+
+LIMITE_PAGINA = 100
+LIMITE_PAGINA_MAXIMO = 1000
+
+STORE_ROWS = registry.counter('invoice_store_rows_total', 'Notas entregues ao armazenamento local, por resultado da gravação', ('resultado',))
+STORE_SECONDS = registry.histogram('invoice_store_write_seconds', 'Tempo de gravação de cada lote de notas no SQLite')
+QUERY_SECONDS = registry.histogram('invoice_store_query_seconds', 'Tempo das consultas às notas armazenadas', ('tipo',))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    arquivo TEXT,
+    processado_em TEXT NOT NULL,
+    cnpj_emissor TEXT,
+    data_emissao TEXT NOT NULL DEFAULT '',
+    forma_pgto TEXT,
+    valor_total INTEGER,
+    informacoes_nota TEXT NOT NULL,
+    origem_campos TEXT,
+    UNIQUE (digest, backend)
+);
+CREATE INDEX IF NOT EXISTS notas_cnpj_data ON notas (cnpj_emissor, data_emissao, id);
+CREATE INDEX IF NOT EXISTS notas_data ON notas (data_emissao, id);
+CREATE INDEX IF NOT EXISTS notas_pgto_data ON notas (forma_pgto, data_emissao, id);
+CREATE INDEX IF NOT EXISTS notas_valor ON notas (valor_total);
+"""
+
+UPSERT = """
+INSERT INTO notas (digest, backend, arquivo, processado_em, cnpj_emissor, data_emissao,
+                   forma_pgto, valor_total, informacoes_nota, origem_campos)
+VALUES (:digest, :backend, :arquivo, :processado_em, :cnpj_emissor, :data_emissao,
+        :forma_pgto, :valor_total, :informacoes_nota, :origem_campos)
+ON CONFLICT (digest, backend) DO UPDATE SET
+    arquivo = excluded.arquivo,
+    processado_em = excluded.processado_em,
+    cnpj_emissor = excluded.cnpj_emissor,
+    data_emissao = excluded.data_emissao,
+    forma_pgto = excluded.forma_pgto,
+    valor_total = excluded.valor_total,
+    informacoes_nota = excluded.informacoes_nota,
+    origem_campos = excluded.origem_campos
+"""
+
+# Agrupamentos aceitos pelo resumo
+GRUPOS = {
+    "cnpj": "cnpj_emissor",
+    "forma_pgto": "forma_pgto",
+    "mes": "substr(data_emissao, 1, 7)",
+    "dia": "data_emissao",
+}
+
+
+def iso_date(valor):
+    """DD/MM/AAAA (da nota) ou AAAA-MM-DD -> AAAA-MM-DD; None se inválida."""
+    valor = (valor or '').strip()
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        pass
+    if not valid_date(valor):
+        return None
+    dia, mes, ano = valor.replace('-', '/').split('/')
+    return f"{ano}-{mes}-{dia}"
+
+
+def cents(valor):
+    """"1.234,56" -> 123456; None se não for um valor monetário."""
+    valor = (valor or '').replace('R$', '').strip()
+    if not valid_money(valor):
+        return None
+    return int(only_digits(valor))
+
+
+def encode_cursor(chave, id_nota):
+    return base64.urlsafe_b64encode(json.dumps([chave, id_nota]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        chave, id_nota = json.loads(texto)
+        return chave, int(id_nota)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+def build_filters(cnpj=None, inicio=None, fim=None, forma_pgto=None, valor_min=None, valor_max=None):
+    """Cláusulas WHERE e parâmetros dos filtros; datas em AAAA-MM-DD e
+    valores em centavos."""
+    clausulas, parametros = [], []
+    if cnpj:
+        clausulas.append("cnpj_emissor = ?")
+        parametros.append(only_digits(cnpj))
+    # Notas sem data ('') ficam fora de qualquer faixa de datas
+    if inicio or fim:
+        clausulas.append("data_emissao >= ?")
+        parametros.append(inicio or '0000-00-00')
+    if fim:
+        clausulas.append("data_emissao <= ?")
+        parametros.append(fim)
+    if forma_pgto:
+        clausulas.append("forma_pgto = ?")
+        parametros.append(forma_pgto)
+    if valor_min is not None:
+        clausulas.append("valor_total >= ?")
+        parametros.append(valor_min)
+    if valor_max is not None:
+        clausulas.append("valor_total <= ?")
+        parametros.append(valor_max)
+    return clausulas, parametros
+
+
+class InvoiceStore:
+    """Notas extraídas em um arquivo SQLite, com gravação em lotes."""
+
+    def __init__(self, path, batch_size=INVOICE_DB_BATCH, max_wait=INVOICE_DB_WAIT):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conexao = self._connect()
+        try:
+            conexao.executescript(SCHEMA)
+        finally:
+            conexao.close()
+        self._writer = None
+        self._local = threading.local()
+        self._ultimo = None
+        self._batcher = MicroBatcher(
+            self._write_batch, max_batch_size=batch_size, max_wait=max_wait, name='invoice-store',
+        )
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conexao = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    def _reader(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = self._local.conexao = self._connect()
+            conexao.execute("PRAGMA query_only=ON")
+            conexao.row_factory = sqlite3.Row
+        return conexao
+
+    def add(self, digest, backend, arquivo, resultado):
+        """Enfileira a gravação de um resultado de process_file; não bloqueia."""
+        info = resultado["informacoes_nota"]
+        cnpj = only_digits(info.get("CNPJ_emissor"))
+        self._ultimo = self._batcher.submit({
+            "digest": digest,
+            "backend": backend,
+            "arquivo": arquivo,
+            "processado_em": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "cnpj_emissor": cnpj or None,
+            "data_emissao": iso_date(info.get("data_emissao")) or '',
+            "forma_pgto": info.get("forma_pgto"),
+            "valor_total": cents(info.get("valor_total")),
+            "informacoes_nota": json.dumps(info, ensure_ascii=False),
+            "origem_campos": json.dumps(resultado.get("origem_campos"), ensure_ascii=False),
+        })
+        return self._ultimo
+
+    def flush(self, timeout=30):
+        """Espera as gravações já enfileiradas (os lotes são gravados em ordem)."""
+        ultimo = self._ultimo
+        if ultimo is None:
+            return
+        try:
+            ultimo.result(timeout=timeout)
+        except Exception as e:
+            logging.warning(f"Gravações pendentes no armazenamento de notas: {e}")
+
+    # Roda na thread do MicroBatcher: uma só conexão de escrita
+    def _write_batch(self, linhas):
+        if self._writer is None:
+            self._writer = self._connect()
+        try:
+            with STORE_SECONDS.time(), self._writer:
+                self._writer.executemany(UPSERT, linhas)
+        except sqlite3.Error as e:
+            logging.error(f"Erro ao gravar {len(linhas)} notas em {self.path}: {e}")
+            STORE_ROWS.labels("falha").inc(len(linhas))
+            raise
+        STORE_ROWS.labels("gravada").inc(len(linhas))
+        return [True] * len(linhas)
+
+    def search(self, cursor=None, limit=LIMITE_PAGINA, **filtros):
+        """Página de notas em ordem de (data_emissao, id), ou (valor_total, id)
+        nas consultas só por valor, e o cursor da próxima (None na última)."""
+        clausulas, parametros = build_filters(**filtros)
+        so_valor = not any(filtros.get(campo) for campo in ("cnpj", "inicio", "fim", "forma_pgto"))
+        if so_valor and (filtros.get("valor_min") is not None or filtros.get("valor_max") is not None):
+            ordem = "valor_total"
+        else:
+            ordem = "data_emissao"
+        if cursor:
+            clausulas.append(f"({ordem}, id) > (?, ?)")
+            parametros.extend(decode_cursor(cursor))
+        limit = max(1, min(int(limit), LIMITE_PAGINA_MAXIMO))
+        where = f"WHERE {' AND '.join(clausulas)}" if clausulas else ""
+        sql = f"""
+            SELECT id, arquivo, backend, processado_em, {ordem} AS chave, informacoes_nota, origem_campos
+            FROM notas {where}
+            ORDER BY {ordem}, id
+            LIMIT ?
+        """
+        with QUERY_SECONDS.labels("busca").time():
+            linhas = self._reader().execute(sql, [*parametros, limit + 1]).fetchall()
+
+        proximo = None
+        if len(linhas) > limit:
+            linhas = linhas[:limit]
+            proximo = encode_cursor(linhas[-1]["chave"], linhas[-1]["id"])
+        return {
+            "notas": [
+                {
+                    "id": linha["id"],
+                    "arquivo": linha["arquivo"],
+                    "backend": linha["backend"],
+                    "processado_em": linha["processado_em"],
+                    "informacoes_nota": json.loads(linha["informacoes_nota"]),
+                    "origem_campos": json.loads(linha["origem_campos"] or 'null'),
+                }
+                for linha in linhas
+            ],
+            "proximo_cursor": proximo,
+        }
+
+    def summary(self, agrupar=None, **filtros):
+        """Quantidade e soma/média/mínimo/máximo do valor total (em reais),
+        no total ou por grupo (cnpj, forma_pgto, mes, dia)."""
+        if agrupar is not None and agrupar not in GRUPOS:
+            raise ValueError(f"Agrupamento desconhecido: {agrupar} (use {', '.join(GRUPOS)})")
+        clausulas, parametros = build_filters(**filtros)
+        where = f"WHERE {' AND '.join(clausulas)}" if clausulas else ""
+        grupo = GRUPOS[agrupar] if agrupar else "NULL"
+        sql = f"""
+            SELECT {grupo} AS grupo, COUNT(*) AS notas, COUNT(valor_total) AS com_valor,
+                   SUM(valor_total) AS soma, MIN(valor_total) AS minimo, MAX(valor_total) AS maximo
+            FROM notas {where}
+            {f"GROUP BY {grupo} ORDER BY {grupo}" if agrupar else ""}
+        """
+        with QUERY_SECONDS.labels("resumo").time():
+            linhas = self._reader().execute(sql, parametros).fetchall()
+
+        def reais(centavos):
+            return None if centavos is None else round(centavos / 100, 2)
+
+        grupos = [
+            {
+                **({"grupo": linha["grupo"]} if agrupar else {}),
+                "notas": linha["notas"],
+                "valor_total": reais(linha["soma"] or 0),
+                "valor_medio": reais(linha["soma"] / linha["com_valor"]) if linha["com_valor"] else None,
+                "valor_minimo": reais(linha["minimo"]),
+                "valor_maximo": reais(linha["maximo"]),
+            }
+            for linha in linhas
+        ]
+        return grupos if agrupar else grupos[0]
+
+
+def store_from_env():
+    # INVOICE_DB vazio desativa o armazenamento
+    if not INVOICE_DB:
+        return None
+    try:
+        return InvoiceStore(INVOICE_DB)
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Armazenamento de notas indisponível em {INVOICE_DB}: {e}")
+        return None
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, total):
+        self.id = uuid.uuid4().hex
+        self.status = "pendente"
+        self.total = total
+        self.concluidos = 0
+        self.erros = 0
+        self.resultados = [None] * total
+        self.criado_em = time.time()
+        self.finalizado_em = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "concluidos": self.concluidos,
+            "erros": self.erros,
+        }
+
+
+class JobManager:
+    """Fila de jobs de processamento de notas executados em segundo plano.
+
+    `runner` recebe a lista de arquivos (nome, conteúdo), mais as opções
+    passadas a `submit`, e devolve pares (indice, resultado) à medida que
+    cada arquivo termina. Jobs finalizados ficam disponíveis para consulta
+    por `ttl` segundos.
+    """
+
+    def __init__(self, runner, max_workers=4, ttl=3600):
+        self.runner = runner
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+
+    def submit(self, arquivos, **opcoes):
+        job = Job(len(arquivos))
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, arquivos, opcoes)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, arquivos, opcoes):
+        job.status = "processando"
+        try:
+            for indice, resultado in self.runner(arquivos, **opcoes):
+                job.resultados[indice] = resultado
+                if "erro" in resultado:
+                    job.erros += 1
+                job.concluidos += 1
+            job.status = "concluido"
+        except Exception as e:
+            logging.error(f"Erro no job {job.id}: {e}")
+            job.status = "falhou"
+        finally:
+            job.finalizado_em = time.time()
+
+    def _purge(self):
+        limite = time.time() - self.ttl
+        expirados = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finalizado_em is not None and job.finalizado_em < limite
+        ]
+        for job_id in expirados:
+            del self._jobs[job_id]
@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+
+# Limites padrão dos histogramas de latência, em segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escape(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escape(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra is not None:
+        pares.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class _Metric:
+    """Base das métricas: uma série por combinação de valores dos rótulos."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._series[()] = self._new_series()
+
+    def labels(self, *valores):
+        serie = self._series.get(valores)
+        if serie is None:
+            if len(valores) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera os rótulos {self.labelnames}")
+            with self._lock:
+                serie = self._series.setdefault(valores, self._new_series())
+        return serie
+
+    def render(self):
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for valores, serie in series:
+            linhas.extend(serie.render(self.name, self.labelnames, valores))
+        return linhas
+
+
+class _CounterSeries:
+    __slots__ = ('_valor', '_lock')
+
+    def __init__(self):
+        self._valor = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, quantidade=1):
+        with self._lock:
+            self._valor += quantidade
+
+    def render(self, nome, labelnames, valores):
+        return [f"{nome}{_format_labels(labelnames, valores)} {_format_value(self._valor)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, quantidade=1):
+        self._series[()].inc(quantidade)
+
+
+class _Timer:
+    __slots__ = ('_serie', '_inicio')
+
+    def __init__(self, serie):
+        self._serie = serie
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._serie.observe(time.perf_counter() - self._inicio)
+        return False
+
+
+class _HistogramSeries:
+    __slots__ = ('_limites', '_contagens', '_soma', '_total', '_lock')
+
+    def __init__(self, limites):
+        self._limites = limites
+        self._contagens = [0] * len(limites)
+        self._soma = 0.0
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def observe(self, valor):
+        posicao = bisect.bisect_left(self._limites, valor)
+        with self._lock:
+            if posicao < len(self._contagens):
+                self._contagens[posicao] += 1
+            self._soma += valor
+            self._total += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, nome, labelnames, valores):
+        with self._lock:
+            contagens, soma, total = list(self._contagens), self._soma, self._total
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self._limites, contagens):
+            acumulado += contagem
+            rotulos = _format_labels(labelnames, valores, ('le', _format_value(limite)))
+            linhas.append(f"{nome}_bucket{rotulos} {acumulado}")
+        rotulos = _format_labels(labelnames, valores, ('le', '+Inf'))
+        linhas.append(f"{nome}_bucket{rotulos} {total}")
+        linhas.append(f"{nome}_sum{_format_labels(labelnames, valores)} {_format_value(soma)}")
+        linhas.append(f"{nome}_count{_format_labels(labelnames, valores)} {total}")
+        return linhas
+
+
+class Histogram(_Metric):
+    """Histograma com limites fixos; cada observação custa uma busca binária."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, valor):
+        self._series[()].observe(valor)
+
+    def time(self):
+        return self._series[()].time()
+
+
+class Registry:
+    def __init__(self):
+        self._metricas = []
+
+    def register(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Todas as métricas no formato texto de exposição do Prometheus."""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.render())
+        return "\n".join(linhas) + "\n"
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = Registry()
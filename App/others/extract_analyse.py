@@ -1,37 +1,51 @@
 from flask import Flask, request, jsonify
-import boto3
 import os
+import sys
 
-app = Flask(__name__)
+# Envio e leitura do Textract compartilhados com o app principal (App/uploads.py, App/textract_blocks.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from uploads import prepare_document
+from textract_blocks import parse_blocks
+from aws_clients import create_client
 
 # Configurações do AWS
-s3_client = boto3.client('s3')
-textract_client = boto3.client('textract')
-
-def upload_to_s3(file_path, bucket_name, object_name):
+# Clientes da AWS criados no primeiro uso: o app principal importa este
+# módulo como backend de extração e não precisa deles
+s3_client = None
+textract_client = None
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        s3_client = create_client('s3')
+    return s3_client
+
+def get_textract_client():
+    global textract_client
+    if textract_client is None:
+        textract_client = create_client('textract')
+    return textract_client
+
+#imagens pequenas vão em bytes direto ao Textract; as maiores seguem em streaming para o S3
+def upload_document(file, bucket_name, object_name):
     try:
-        s3_client.upload_file(file_path, bucket_name, object_name)
-        return True
+        return prepare_document(get_s3_client(), file, bucket_name, object_name)
     except Exception as e:
         print(f"Erro ao enviar arquivo para o S3: {e}")
-        return False
+        return None
 
-def analyze_expense(bucket_name, object_name):
+def analyze_expense(document):
     try:
-        response = textract_client.analyze_expense(
-            Document={'S3Object': {'Bucket': bucket_name, 'Name': object_name}}
-        )
+        response = get_textract_client().analyze_expense(Document=document)
         
-        text = ""
+        text_parts = []
         detection_list = []
         summary_detection_list = []
         unnecessary_types = ['ITEM', 'QUANTITY', 'PRODUCT_CODE']
 
         for item in response['ExpenseDocuments']:
-            # Extrair texto bruto
-            for block in item.get('Blocks', []):
-                if 'Text' in block:
-                    text += block['Text'] + ' '
+            # Extrair texto bruto (linhas do documento, sem repetir as palavras)
+            text_parts.append(parse_blocks(item.get('Blocks', [])).joined_text())
 
             # Processar itens da fatura
             for line_item_group in item.get('LineItemGroups', []):
@@ -59,7 +73,7 @@ def analyze_expense(bucket_name, object_name):
                     summary_detection_list.append(entry)
 
         return {
-            'extractedText': text.strip(),
+            'extractedText': ' '.join(part for part in text_parts if part),
             'extractedTextSummary': summary_detection_list,
             'extractedTextInfo': detection_list
         }
@@ -68,7 +82,6 @@ def analyze_expense(bucket_name, object_name):
         print(f"Erro ao analisar despesa: {e}")
         return None
 
-@app.route('/api/v1/invoice', methods=['POST'])
 def process_invoice():
     files = request.files.getlist('file')
     if not files:
@@ -83,23 +96,14 @@ def process_invoice():
             results.append({"error": "Nome inválido", "filePath": ""})
             continue
 
-        file_path = f"temp_{file_name}"
-        try:
-            file.save(file_path)
-        except Exception as e:
-            print(f"Erro ao salvar temporário: {e}")
-            results.append({"error": "Erro interno", "filePath": file_name})
-            continue
-
-        # Upload para S3
-        if not upload_to_s3(file_path, bucket_name, file_name):
+        # Upload para S3 (apenas quando necessário)
+        document = upload_document(file, bucket_name, file_name)
+        if document is None:
             results.append({"error": "Falha no upload", "filePath": file_name})
-            os.remove(file_path)
             continue
 
         # Processar análise
-        analysis = analyze_expense(bucket_name, file_name)
-        os.remove(file_path)
+        analysis = analyze_expense(document)
 
         if not analysis:
             results.append({"error": "Falha na análise", "filePath": file_name})
@@ -113,5 +117,11 @@ def process_invoice():
 
     return jsonify(results)
 
+# App Flask deste extrator, criado só quando ele roda sozinho
+def create_app():
+    app = Flask(__name__)
+    app.add_url_rule('/api/v1/invoice', view_func=process_invoice, methods=['POST'])
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -1,31 +1,62 @@
 import json
+import os
 import re
+import sys
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
-from nltk.tag import pos_tag
+from nltk.tag import PerceptronTagger
 
-nltk.download("stopwords")
-nltk.download("punkt")
-nltk.download('punkt_tab')
-nltk.download("averaged_perceptron_tagger")
-nltk.download('averaged_perceptron_tagger_eng')
+# Carga sob demanda compartilhada com o app principal (App/backends.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import Backend
+
+# Recursos do NLTK: baixados no primeiro uso e apenas se ainda não estiverem instalados
+NLTK_RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+}
+
+def download_nltk_data():
+    for recurso, caminho in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(caminho)
+        except LookupError:
+            nltk.download(recurso, quiet=True)
+
+nltk_data = Backend("nltk_data", download_nltk_data)
+
+CUSTOM_STOPWORDS = {'valor', 'r$', 'item', 'un', 'kg', 'ml', 'cx', 'pt', 'codigo', 'descricao'}
+
+# Stopwords e tagger carregados uma única vez por processo (e não a cada nota;
+# pos_tag cria um PerceptronTagger novo, lendo o modelo do disco, a cada chamada)
+def load_stopwords():
+    nltk_data.load()
+    return set(stopwords.words("portuguese")) | CUSTOM_STOPWORDS
+
+def load_tagger():
+    nltk_data.load()
+    return PerceptronTagger()
+
+stopwords_backend = Backend("nltk_stopwords", load_stopwords)
+tagger_backend = Backend("nltk_tagger", load_tagger)
 
 def preprocess_text(text):
     text = re.sub(r"\s+", " ", text).strip()
     return re.sub(r"[^\w\s.,/-]", "", text)
 
 def tokenize_and_tag(text):
+    stop_words = stopwords_backend.load()
     tokens = word_tokenize(text, language="portuguese")
-    stop_words = set(stopwords.words("portuguese"))
-    custom_stopwords = {'valor', 'r$', 'item', 'un', 'kg', 'ml', 'cx', 'pt', 'codigo', 'descricao'}
     filtered_tokens = [
         t for t in tokens 
-        if t.lower() not in stop_words and 
-           t.lower() not in custom_stopwords and
+        if t.lower() not in stop_words and
            (len(t) > 1 or t.isdigit())
     ]
-    return pos_tag(filtered_tokens)
+    return tagger_backend.load().tag(filtered_tokens)
 
 def extract_emissor_info(tokens):
     cnpj_pattern = r"\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}"
@@ -134,6 +165,7 @@ def process_nota_fiscal(text):
     tokens = tokenize_and_tag(text)
     
     nome_emissor, endereco = extract_emissor_info(tokens)
+    numero_nota, serie_nota = extract_numeros_nota(tokens)
     
     return {
         "nome_emissor": nome_emissor,
@@ -141,8 +173,8 @@ def process_nota_fiscal(text):
         "endereco_emissor": endereco,
         "CNPJ_CPF_consumidor": next((t[0] for t in tokens if re.match(r"\d{3}\.\d{3}\.\d{3}-\d{2}", t[0])), None),
         "data_emissao": extract_data_emissao(tokens),
-        "numero_nota_fiscal": extract_numeros_nota(tokens)[0],
-        "serie_nota_fiscal": extract_numeros_nota(tokens)[1],
+        "numero_nota_fiscal": numero_nota,
+        "serie_nota_fiscal": serie_nota,
         "valor_total": extract_valores(tokens),
         "forma_pgto": extract_forma_pagamento(tokens),
     }
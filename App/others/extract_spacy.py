@@ -1,44 +1,57 @@
 from flask import Flask, request, jsonify
-import boto3
+import os
+import sys
 import spacy
 from spacy import displacy
 
-app = Flask(__name__)
+# Envio e leitura do Textract compartilhados com o app principal (App/uploads.py, App/textract_blocks.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from uploads import prepare_document
+from textract_blocks import parse_response
+from backends import Backend
+from aws_clients import create_client
 
 # Configurações do AWS
-s3_client = boto3.client('s3')
-textract_client = boto3.client('textract')
-
-# Carregar modelo do Spacy para português
-nlp = spacy.load("pt_core_news_sm")
-
-#carregamento da imagem para o bucket s3
-def upload_to_s3(file_path, bucket_name, object_name):
+# Clientes da AWS criados no primeiro uso: o app principal importa este
+# módulo como backend de extração e não precisa deles
+s3_client = None
+textract_client = None
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        s3_client = create_client('s3')
+    return s3_client
+
+def get_textract_client():
+    global textract_client
+    if textract_client is None:
+        textract_client = create_client('textract')
+    return textract_client
+
+# Modelo do Spacy para português, carregado no primeiro uso
+nlp_backend = Backend("spacy", lambda: spacy.load("pt_core_news_sm"))
+
+#envio da imagem: bytes direto ao Textract se couber, senão streaming para o bucket s3
+def upload_document(file, bucket_name, object_name):
     try:
-        s3_client.upload_file(file_path, bucket_name, object_name)
-        return True
+        return prepare_document(get_s3_client(), file, bucket_name, object_name)
     except Exception as e:
         print(f"Erro ao enviar arquivo para o S3: {e}")
-        return False
+        return None
 
 #extração de texto da imagem com textract
-def extract_text_from_image(bucket_name, object_name):
+def extract_text_from_image(document):
     try:
-        response = textract_client.detect_document_text(
-            Document={'S3Object': {'Bucket': bucket_name, 'Name': object_name}}
-        )
-        text = ""
-        for item in response['Blocks']:
-            if item['BlockType'] == "LINE":
-                text += item['Text'] + "\n"
-        return text
+        response = get_textract_client().detect_document_text(Document=document)
+        return parse_response(response).text()
     except Exception as e:
         print(f"Erro ao extrair texto com Textract: {e}")
         return None
 
 #extração de informações da nota fiscal com spacy e regex
 def extract_invoice_info_spacy(text):
-    doc = nlp(text)
+    doc = nlp_backend.load()(text)
     invoice_info = {
         "nome_emissor": None,
         "CNPJ_emissor": None,
@@ -53,7 +66,6 @@ def extract_invoice_info_spacy(text):
 
     return invoice_info
 
-@app.route('/api/v1/invoice', methods=['POST'])
 def process_invoice():
     files = request.files.getlist('file')
     if not files or len(files) == 0:
@@ -70,18 +82,15 @@ def process_invoice():
             responses.append({"error": "Nome do arquivo inválido"})
             continue
 
-        # Salvar o arquivo temporariamente
-        file_path = f"temp_{file.filename}"
-        file.save(file_path)
-
-        # Enviar para o S3
+        # Enviar para o Textract (e para o S3 apenas quando necessário)
         object_name = file.filename
-        if not upload_to_s3(file_path, bucket_name, object_name):
+        document = upload_document(file, bucket_name, object_name)
+        if document is None:
             responses.append({"error": f"Falha ao enviar o arquivo {file.filename} para o S3"})
             continue
 
         # Extrair texto com Textract
-        extracted_text = extract_text_from_image(bucket_name, object_name)
+        extracted_text = extract_text_from_image(document)
         if not extracted_text:
             responses.append({"error": f"Falha ao extrair texto do arquivo {file.filename}"})
         else:
@@ -94,5 +103,11 @@ def process_invoice():
 
     return jsonify(final)
 
+# App Flask deste extrator, criado só quando ele roda sozinho
+def create_app():
+    app = Flask(__name__)
+    app.add_url_rule('/api/v1/invoice', view_func=process_invoice, methods=['POST'])
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
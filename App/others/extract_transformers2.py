@@ -1,23 +1,54 @@
 from flask import Flask, request, jsonify
-import boto3
-from transformers import pipeline
 import logging
+import os
+import sys
 
-app = Flask(__name__)
+# Leitura do Textract compartilhada com o app principal (App/textract_blocks.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from textract_blocks import parse_response
+from backends import Backend
+from qa_encoding import build_qa_engine
+from qa_models import load_qa_pipeline
+from aws_clients import create_client
 
 # Configurações do AWS
-s3_client = boto3.client('s3')
-textract_client = boto3.client('textract')
+# Cliente do Textract criado no primeiro uso: o app principal importa este
+# módulo como backend de extração e não precisa dele
+textract_client = None
+
+def get_textract_client():
+    global textract_client
+    if textract_client is None:
+        textract_client = create_client('textract')
+    return textract_client
 
 # Configurar logging para melhor depuração
 logging.basicConfig(level=logging.INFO)
 
-# Carregar modelo DeepSeek com pipeline de question-answering
-qa_pipe = pipeline(
-    "question-answering",
-    model="pierreguillou/bert-large-cased-squad-v1.1-portuguese",
-    device="cuda"  # Certifique-se de que a GPU esteja disponível ou ajuste para "cpu"
-)
+# Modelo com pipeline de question-answering, carregado no primeiro uso.
+# QA_DEVICE escolhe o dispositivo: "cpu" (padrão) ou "cuda" quando houver GPU, e
+# QA_INFERENCE o modo de inferência ("fp32" ou "int8", veja App/qa_models.py)
+QA_MODEL = "pierreguillou/bert-large-cased-squad-v1.1-portuguese"
+QA_DEVICE = os.getenv('QA_DEVICE', 'cpu')
+
+qa_backend = Backend("bert_large", lambda: load_qa_pipeline(QA_MODEL, QA_DEVICE))
+
+# Pergunta feita ao modelo para cada campo da nota
+QUESTIONS = {
+    "nome_emissor": "Qual o nome do emissor? geralmente esse nome esta associado a razão social, LTDA, S/A, ME, EIRELI, etc",
+    "CNPJ_emissor": "Qual o CNPJ do emissor? ele possui 14 dígitos formatados (12.345.678/0001-12) ou não formatados (12345678000112) podendo conter espaços ou simbolos entre os numeros",
+    "endereco_emissor": "Qual o endereço do emissor? em texto vem acompanhado de Rua, Alameda, Avenida, Rodovia ou abreviados como R., Av., Al., etc",
+    "CNPJ_CPF_consumidor": "Qual o CPF do consumidor? ele possui 11 dígitos formatados (123.456.789-00) ou não formatados (12345678900) podendo conter espaços ou simbolos entre os numeros. no texto ele encontra-se junto de 'consumidor' ou 'CPF' e se não encontrar retorne null",
+    "data_emissao": "Qual a data de emissão? ela possui o formato DD/MM/AAAA ou DD-MM-AAAA",
+    "numero_nota_fiscal": "Qual o número da nota fiscal? geralmente são números inteiros de nove dígitos (000000123 que começam com 000 formatados ou não) ou seis dígitos isolados acompanhados do SAT",
+    "serie_nota_fiscal": "Qual a série da nota fiscal? geralmente são números inteiros 1,2,3 ou de três dígitos (101, 002, 003, etc) vindo logo após série no texto",
+    "valor_total": "Qual o valor total? o valor total refere-se ao valor total da nota fiscal, podendo ser formatado com vírgula ou ponto (R$ 1.000,00 ou R$ 1000.00) e acompanhado de R$ sendo o maior valor da nota",
+    "forma_pgto": "Qual a forma de pagamento? geralmente é dinheiro ou cartão",
+}
+
+# O texto da nota é codificado uma vez para todas as perguntas e notas de
+# requisições simultâneas são respondidas em lotes (veja App/qa_encoding.py)
+qa_batcher = Backend("bert_large_batcher", lambda: build_qa_engine(qa_backend.load(), QUESTIONS))
 
 # Função para formatar prompts específicos (opcional, mas pode ajudar a orientar melhor o modelo)
 def format_prompt(context, question):
@@ -34,50 +65,29 @@ def format_prompt(context, question):
 # Função para extrair o texto da imagem com Textract
 def extract_text_from_image(bucket_name, object_name):
     try:
-        response = textract_client.detect_document_text(
+        response = get_textract_client().detect_document_text(
             Document={'S3Object': {'Bucket': bucket_name, 'Name': object_name}}
         )
-        text = ""
-        for item in response.get('Blocks', []):
-            if item.get('BlockType') == "LINE":
-                text += item.get('Text', '') + "\n"
-        return text
+        return parse_response(response).text()
     except Exception as e:
         logging.error(f"Erro ao extrair texto com Textract: {e}")
         return None
 
 # Função para extrair informações da nota fiscal utilizando Transformers
 def extract_invoice_info(text):
-    questions = [
-        "Qual o nome do emissor? geralmente esse nome esta associado a razão social, LTDA, S/A, ME, EIRELI, etc",
-        "Qual o CNPJ do emissor? ele possui 14 dígitos formatados (12.345.678/0001-12) ou não formatados (12345678000112) podendo conter espaços ou simbolos entre os numeros", 
-        "Qual o endereço do emissor? em texto vem acompanhado de Rua, Alameda, Avenida, Rodovia ou abreviados como R., Av., Al., etc",
-        "Qual o CPF do consumidor? ele possui 11 dígitos formatados (123.456.789-00) ou não formatados (12345678900) podendo conter espaços ou simbolos entre os numeros. no texto ele encontra-se junto de 'consumidor' ou 'CPF' e se não encontrar retorne null",
-        "Qual a data de emissão? ela possui o formato DD/MM/AAAA ou DD-MM-AAAA",
-        "Qual o número da nota fiscal? geralmente são números inteiros de nove dígitos (000000123 que começam com 000 formatados ou não) ou seis dígitos isolados acompanhados do SAT",	
-        "Qual a série da nota fiscal? geralmente são números inteiros 1,2,3 ou de três dígitos (101, 002, 003, etc) vindo logo após série no texto",
-        "Qual o valor total? o valor total refere-se ao valor total da nota fiscal, podendo ser formatado com vírgula ou ponto (R$ 1.000,00 ou R$ 1000.00) e acompanhado de R$ sendo o maior valor da nota",
-        "Qual a forma de pagamento? geralmente é dinheiro ou cartão"
-    ]
-
-    keys = [
-        "nome_emissor", "CNPJ_emissor", "endereco_emissor",
-        "CNPJ_CPF_consumidor", "data_emissao", "numero_nota_fiscal",
-        "serie_nota_fiscal", "valor_total", "forma_pgto"
-    ]
-
-    # Criar inputs para batch
-    inputs = [{"question": question, "context": text} for question in questions]
-
-    # Rodar todas de uma vez
-    respostas = qa_pipe(inputs)
+    # As perguntas entram no lote compartilhado com as demais requisições
+    respostas = qa_batcher.load().answer(list(QUESTIONS.values()), text)
 
     # Montar o dicionário de resposta
-    invoice_data = {key: resposta.get("answer", "").strip() for key, resposta in zip(keys, respostas)}
+    invoice_data = {key: resposta.get("answer", "").strip() for key, resposta in zip(QUESTIONS, respostas)}
 
     return invoice_data
 
-@app.route('/api/v1/invoice', methods=['POST'])
+def qa_stats():
+    if not qa_batcher.loaded:
+        return jsonify({"lotes": 0, "itens": 0}), 200
+    return jsonify(qa_batcher.load().stats()), 200
+
 def process_invoice():
     files = request.files.getlist('file')
     if not files:
@@ -116,5 +126,12 @@ def process_invoice():
 
     return jsonify(final_results), 200
 
+# App Flask deste extrator, criado só quando ele roda sozinho
+def create_app():
+    app = Flask(__name__)
+    app.add_url_rule('/api/v1/qa/stats', view_func=qa_stats, methods=['GET'])
+    app.add_url_rule('/api/v1/invoice', view_func=process_invoice, methods=['POST'])
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -1,60 +1,74 @@
 from flask import Flask, request, jsonify
-import boto3
-from transformers import pipeline
+import os
+import sys
 
-app = Flask(__name__)
+# Leitura do Textract compartilhada com o app principal (App/textract_blocks.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from textract_blocks import parse_response
+from backends import Backend
+from qa_encoding import build_qa_engine
+from qa_models import load_qa_pipeline
+from aws_clients import create_client
 
 # Configurações do AWS
-s3_client = boto3.client('s3')
-textract_client = boto3.client('textract')
+# Cliente do Textract criado no primeiro uso: o app principal importa este
+# módulo como backend de extração e não precisa dele
+textract_client = None
 
-# Carregar modelo do Transformers para Q&A
-qea = pipeline("question-answering", model="pierreguillou/bert-base-cased-squad-v1.1-portuguese")
+def get_textract_client():
+    global textract_client
+    if textract_client is None:
+        textract_client = create_client('textract')
+    return textract_client
+
+# Modelo do Transformers para Q&A, carregado no primeiro uso. QA_DEVICE escolhe
+# o dispositivo: "cpu" (padrão) ou "cuda" quando houver GPU, e QA_INFERENCE o
+# modo de inferência ("fp32" ou "int8", veja App/qa_models.py)
+QA_MODEL = "pierreguillou/bert-base-cased-squad-v1.1-portuguese"
+QA_DEVICE = os.getenv('QA_DEVICE', 'cpu')
+
+qa_backend = Backend("bert", lambda: load_qa_pipeline(QA_MODEL, QA_DEVICE))
+
+# Pergunta feita ao modelo para cada campo da nota
+QUESTIONS = {
+    "nome_emissor": "Qual o nome do emissor?",
+    "CNPJ_emissor": "Qual o CNPJ do emissor?",
+    "endereco_emissor": "Qual o endereço do emissor?",
+    "CNPJ_CPF_consumidor": "Qual o CPF do consumidor?",
+    "data_emissao": "Qual a data de emissão?",
+    "numero_nota_fiscal": "Qual o número da nota fiscal?",
+    "serie_nota_fiscal": "Qual a série da nota fiscal?",
+    "valor_total": "Qual o valor total?",
+    "forma_pgto": "Qual a forma de pagamento?",
+}
+
+# O texto da nota é codificado uma vez para todas as perguntas e notas de
+# requisições simultâneas são respondidas em lotes (veja App/qa_encoding.py)
+qa_batcher = Backend("bert_batcher", lambda: build_qa_engine(qa_backend.load(), QUESTIONS))
 
 # Função para extrair o texto da imagem com Textract
 def extract_text_from_image(bucket_name, object_name):
     try:
-        response = textract_client.detect_document_text(
+        response = get_textract_client().detect_document_text(
             Document={'S3Object': {'Bucket': bucket_name, 'Name': object_name}}
         )
-        text = ""
-        for item in response['Blocks']:
-            if item['BlockType'] == "LINE":
-                text += item['Text'] + "\n"
-        return text
+        return parse_response(response).text()
     except Exception as e:
         print(f"Erro ao extrair texto com Textract: {e}")
         return None
 
 # Função para extrair informações da nota fiscal com pipeline de Q&A
 def extract_invoice_info_transf(text):
-    questions = [
-        "Qual o nome do emissor?",
-        "Qual o CNPJ do emissor?",
-        "Qual o endereço do emissor?",
-        "Qual o CPF do consumidor?",
-        "Qual a data de emissão?",
-        "Qual o número da nota fiscal?",
-        "Qual a série da nota fiscal?",
-        "Qual o valor total?",
-        "Qual a forma de pagamento?"
-    ]
-    answers = qea(question=questions, context=text)
-    invoice_info = {
-        "nome_emissor": answers[0]["answer"],
-        "CNPJ_emissor": answers[1]["answer"],
-        "endereco_emissor": answers[2]["answer"],
-        "CNPJ_CPF_consumidor": answers[3]["answer"],
-        "data_emissao": answers[4]["answer"],
-        "numero_nota_fiscal": answers[5]["answer"],
-        "serie_nota_fiscal": answers[6]["answer"],
-        "valor_total": answers[7]["answer"],
-        "forma_pgto": answers[8]["answer"]
-    }
+    answers = qa_batcher.load().answer(list(QUESTIONS.values()), text)
+    invoice_info = {campo: answer["answer"] for campo, answer in zip(QUESTIONS, answers)}
     return invoice_info
 
 
-@app.route('/api/v1/invoice', methods=['POST'])
+def qa_stats():
+    if not qa_batcher.loaded:
+        return jsonify({"lotes": 0, "itens": 0}), 200
+    return jsonify(qa_batcher.load().stats()), 200
+
 def process_invoice():
     files = request.files.getlist('file')
     if not files:
@@ -90,5 +104,12 @@ def process_invoice():
 
     return jsonify(final)
 
+# App Flask deste extrator, criado só quando ele roda sozinho
+def create_app():
+    app = Flask(__name__)
+    app.add_url_rule('/api/v1/qa/stats', view_func=qa_stats, methods=['GET'])
+    app.add_url_rule('/api/v1/invoice', view_func=process_invoice, methods=['POST'])
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
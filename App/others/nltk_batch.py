@@ -0,0 +1,137 @@
+"""Processamento em lote das notas com o extrator NLTK, em streaming.
+
+Lê um JSONL (uma nota por linha, com "arquivo" e "textos_extraidos" ou
+"texto"), distribui as notas entre processos — cada um carrega stopwords e
+tagger uma única vez — e grava os resultados em outro JSONL, na ordem da
+entrada, à medida que ficam prontos. A memória fica limitada a um bloco de
+notas por vez, qualquer que seja o tamanho do arquivo.
+
+A cada bloco gravado, o progresso vai para `<saida>.checkpoint`; rodar o
+mesmo comando depois de uma interrupção retoma do último bloco confirmado.
+
+Uso:
+    python nltk_batch.py resultados_textract.jsonl resultados_processados.jsonl --workers 4
+    python nltk_batch.py --convert resultados_textract.json resultados_textract.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+import extract_nltk
+
+
+def init_worker():
+    # Carrega dados, stopwords e tagger antes da primeira nota do processo
+    extract_nltk.stopwords_backend.load()
+    extract_nltk.tagger_backend.load()
+
+
+def process_line(entrada):
+    numero, linha = entrada
+    try:
+        nota = json.loads(linha)
+        texto = nota.get("texto")
+        if texto is None:
+            texto = ' '.join(nota['textos_extraidos'])
+        resultado = {"arquivo": nota.get("arquivo"), **extract_nltk.process_nota_fiscal(texto)}
+    except Exception as e:
+        resultado = {"linha": numero, "erro": f"Falha no processamento: {str(e)}"}
+    return json.dumps(resultado, ensure_ascii=False) + "\n"
+
+
+def read_checkpoint(caminho):
+    if not os.path.exists(caminho):
+        return {"linhas": 0, "offset_entrada": 0, "offset_saida": 0}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_checkpoint(caminho, checkpoint):
+    tmp = f"{caminho}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, caminho)
+
+
+def read_lines(entrada, primeira_linha):
+    """(numero, linha, offset após a linha) de cada linha não vazia."""
+    numero = primeira_linha
+    while True:
+        linha = entrada.readline()
+        if not linha:
+            return
+        numero += 1
+        if linha.strip():
+            yield numero, linha, entrada.tell()
+
+
+def run(input_file, output_file, workers=None, block_size=None, checkpoint_file=None):
+    workers = workers or os.cpu_count() or 1
+    block_size = block_size or workers * 64
+    checkpoint_file = checkpoint_file or f"{output_file}.checkpoint"
+    checkpoint = read_checkpoint(checkpoint_file)
+    if checkpoint["linhas"]:
+        print(f"Retomando após {checkpoint['linhas']} linhas")
+
+    inicio = time.perf_counter()
+    processadas = 0
+    with open(input_file, 'rb') as entrada, open(output_file, 'ab') as saida, \
+            Pool(workers, initializer=init_worker) as pool:
+        # Descarta o que foi gravado depois do último checkpoint (bloco interrompido)
+        saida.truncate(checkpoint["offset_saida"])
+        saida.seek(checkpoint["offset_saida"])
+        entrada.seek(checkpoint["offset_entrada"])
+        linhas = read_lines(entrada, checkpoint["linhas"])
+
+        while True:
+            bloco = list(islice(linhas, block_size))
+            if not bloco:
+                break
+            tarefas = [(numero, linha) for numero, linha, _ in bloco]
+            for resultado in pool.imap(process_line, tarefas, chunksize=max(1, len(tarefas) // (workers * 4))):
+                saida.write(resultado.encode('utf-8'))
+            saida.flush()
+            os.fsync(saida.fileno())
+
+            numero, _, offset = bloco[-1]
+            checkpoint = {"linhas": numero, "offset_entrada": offset, "offset_saida": saida.tell()}
+            write_checkpoint(checkpoint_file, checkpoint)
+            processadas += len(bloco)
+
+    duracao = time.perf_counter() - inicio
+    print(f"Processamento concluído! {processadas} notas em {duracao:.1f}s; resultados em {output_file}")
+    return processadas
+
+
+def convert_json(input_file, output_file):
+    """Converte o JSON antigo ({arquivo: {"textos_extraidos": [...]}}) em JSONL."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        dados_textract = json.load(f)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for arquivo, conteudo in dados_textract.items():
+            f.write(json.dumps({"arquivo": arquivo, **conteudo}, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Processa notas em lote com o extrator NLTK")
+    parser.add_argument('input_file', help="JSONL de entrada")
+    parser.add_argument('output_file', help="JSONL de saída (acrescentado ao retomar)")
+    parser.add_argument('--workers', type=int, help="processos (padrão: número de CPUs)")
+    parser.add_argument('--block-size', type=int, help="notas por bloco entre checkpoints (padrão: 64 por processo)")
+    parser.add_argument('--checkpoint', help="arquivo de checkpoint (padrão: <saida>.checkpoint)")
+    parser.add_argument('--convert', action='store_true', help="apenas converte o JSON antigo em JSONL")
+    args = parser.parse_args(argv)
+
+    if args.convert:
+        convert_json(args.input_file, args.output_file)
+        return 0
+    run(args.input_file, args.output_file, args.workers, args.block_size, args.checkpoint)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Pré-processamento das fotos de notas antes do envio ao Textract.
+
+Fotos de celular chegam com 4-12 MB; o Textract lê o cupom tão bem quanto
+em uma imagem bem menor. As etapas, todas locais (Pillow e NumPy):
+- aplica a orientação do EXIF, já que o Textract lê os pixels como estão;
+- recorta a região do papel (claro) quando ele ocupa só parte da foto;
+- converte para tons de cinza;
+- reduz a largura do papel para PREPROCESS_DPI, supondo a bobina de
+  PREPROCESS_PAPER_MM milímetros (80 mm nos cupons de NFC-e);
+- grava em JPEG dentro de PREPROCESS_MAX_BYTES, baixando a qualidade e, se
+  preciso, a resolução.
+
+A imagem processada só é usada quando fica menor que a original. PDFs e
+arquivos que o Pillow não abre seguem sem alteração.
+benchmarks/compare_preprocess.py mede bytes e acerto do OCR em relação à
+imagem original.
+"""
+import io
+import logging
+import os
+
+PREPROCESS_IMAGES = os.getenv('PREPROCESS_IMAGES', '0') == '1'
+PREPROCESS_CROP = os.getenv('PREPROCESS_CROP', '1') != '0'
+PREPROCESS_GRAYSCALE = os.getenv('PREPROCESS_GRAYSCALE', '1') != '0'
+PREPROCESS_DPI = int(os.getenv('PREPROCESS_DPI', 300))
+PREPROCESS_PAPER_MM = float(os.getenv('PREPROCESS_PAPER_MM', 80))
+PREPROCESS_MAX_BYTES = int(os.getenv('PREPROCESS_MAX_BYTES', 1024 * 1024))
+PREPROCESS_QUALITY = int(os.getenv('PREPROCESS_QUALITY', 85))
+
+# Abaixo disso a redução para caber no limite de bytes para: o texto deixa de ser legível
+MIN_QUALITY = 40
+MIN_WIDTH = 400
+
+
+def settings_key():
+    """Identifica a configuração em uso (entra nas chaves de cache do OCR)."""
+    if not PREPROCESS_IMAGES:
+        return ''
+    return (
+        f"pp{int(PREPROCESS_CROP)}{int(PREPROCESS_GRAYSCALE)}-{PREPROCESS_DPI}-"
+        f"{PREPROCESS_PAPER_MM:g}-{PREPROCESS_MAX_BYTES}-{PREPROCESS_QUALITY}"
+    )
+
+
+def otsu_threshold(pixels):
+    """Limiar de Otsu de uma matriz uint8 (tons de cinza)."""
+    import numpy as np
+
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    omega = np.cumsum(hist) / pixels.size
+    mu = np.cumsum(hist * np.arange(256)) / pixels.size
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variancia = (mu[-1] * omega - mu) ** 2 / (omega * (1.0 - omega))
+    return int(np.nanargmax(variancia))
+
+
+def find_paper_box(cinza, min_area=0.15, max_area=0.9, margem=0.02):
+    """Caixa (esquerda, topo, direita, base) do papel na foto, ou None.
+
+    Trabalha em uma miniatura: as linhas e colunas com boa parte dos pixels
+    acima do limiar de Otsu delimitam a região clara. Sem contraste entre
+    papel e fundo, ou com o papel ocupando quase toda a imagem, não recorta.
+    """
+    import numpy as np
+
+    miniatura = cinza.copy()
+    miniatura.thumbnail((256, 256))
+    pixels = np.asarray(miniatura, dtype=np.uint8)
+    claro = pixels > otsu_threshold(pixels)
+
+    colunas = claro.mean(axis=0)
+    linhas = claro.mean(axis=1)
+    xs = np.flatnonzero(colunas > 0.5 * colunas.max())
+    ys = np.flatnonzero(linhas > 0.5 * linhas.max())
+    if not len(xs) or not len(ys):
+        return None
+
+    altura, largura = pixels.shape
+    area = (xs[-1] - xs[0] + 1) * (ys[-1] - ys[0] + 1) / (largura * altura)
+    if not min_area <= area <= max_area:
+        return None
+
+    escala_x = cinza.width / largura
+    escala_y = cinza.height / altura
+    folga_x = margem * cinza.width
+    folga_y = margem * cinza.height
+    return (
+        max(0, int(xs[0] * escala_x - folga_x)),
+        max(0, int(ys[0] * escala_y - folga_y)),
+        min(cinza.width, int((xs[-1] + 1) * escala_x + folga_x)),
+        min(cinza.height, int((ys[-1] + 1) * escala_y + folga_y)),
+    )
+
+
+def encode_jpeg(imagem, max_bytes, quality=PREPROCESS_QUALITY):
+    """JPEG de até `max_bytes`: reduz a qualidade e depois a resolução."""
+    from PIL import Image
+
+    while True:
+        buffer = io.BytesIO()
+        imagem.save(buffer, 'JPEG', quality=quality, optimize=True)
+        dados = buffer.getvalue()
+        if len(dados) <= max_bytes:
+            return dados, imagem
+        if quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 10)
+        elif imagem.width * 0.85 >= MIN_WIDTH:
+            imagem = imagem.resize((int(imagem.width * 0.85), int(imagem.height * 0.85)), Image.LANCZOS)
+        else:
+            return dados, imagem
+
+
+def preprocess_image(conteudo, crop=PREPROCESS_CROP, grayscale=PREPROCESS_GRAYSCALE, dpi=PREPROCESS_DPI,
+                     paper_mm=PREPROCESS_PAPER_MM, max_bytes=PREPROCESS_MAX_BYTES, quality=PREPROCESS_QUALITY):
+    """Devolve (bytes a enviar ao Textract, resumo das etapas aplicadas)."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    resumo = {"bytes_original": len(conteudo), "bytes_enviados": len(conteudo), "processada": False}
+    try:
+        imagem = Image.open(io.BytesIO(conteudo))
+        if imagem.format not in ('JPEG', 'PNG', 'WEBP', 'BMP', 'TIFF', 'MPO', 'HEIF'):
+            return conteudo, resumo
+        resumo["dimensoes_original"] = imagem.size
+        imagem = ImageOps.exif_transpose(imagem)
+    except UnidentifiedImageError:
+        return conteudo, resumo
+    except Exception as e:
+        logging.warning(f"Pré-processamento ignorado, imagem ilegível: {e}")
+        return conteudo, resumo
+
+    cinza = imagem.convert('L')
+    caixa = find_paper_box(cinza) if crop else None
+    if caixa is not None:
+        imagem = imagem.crop(caixa)
+        cinza = cinza.crop(caixa)
+    resumo["recorte"] = caixa
+    imagem = cinza if grayscale else imagem.convert('RGB')
+
+    # Largura do papel na resolução alvo; fotos menores que isso não são ampliadas
+    largura_alvo = int(dpi * paper_mm / 25.4)
+    if imagem.width > largura_alvo:
+        altura_alvo = round(imagem.height * largura_alvo / imagem.width)
+        imagem = imagem.resize((largura_alvo, altura_alvo), Image.LANCZOS)
+
+    dados, imagem = encode_jpeg(imagem, max_bytes, quality)
+    if len(dados) >= len(conteudo):
+        return conteudo, resumo
+
+    resumo.update({"bytes_enviados": len(dados), "processada": True, "dimensoes": imagem.size})
+    return dados, resumo
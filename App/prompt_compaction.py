@@ -0,0 +1,135 @@
+"""Compactação do texto da nota antes do prompt do Gemini.
+
+O texto do OCR traz a lista de itens, avisos legais (tributos aproximados,
+endereço de consulta, "NFC-e não permite aproveitamento de crédito") e
+separadores repetidos, que não ajudam a achar os campos do cabeçalho e
+custam tokens. A compactação, sobre o texto já em uma linha:
+1. remove os avisos conhecidos e endereços web;
+2. remove a região dos itens (do cabeçalho da tabela até "Qtd. total de
+   itens" ou o valor total);
+3. reduz sequências de caracteres repetidos e espaços;
+4. em textos longos, mantém só o início da nota (nome e endereço do emissor)
+   e janelas em volta das palavras-âncora dos campos pedidos (CNPJ, Série,
+   Total, Pagamento, CPF, datas...).
+
+benchmarks/compare_compaction.py mede tokens e acerto com e sem compactação.
+"""
+import os
+import re
+
+PROMPT_COMPACTION = os.getenv('PROMPT_COMPACTION', '0') == '1'
+# Textos até esse tamanho (já sem itens e avisos) vão inteiros, sem janelas
+PROMPT_COMPACT_MIN_CHARS = int(os.getenv('PROMPT_COMPACT_MIN_CHARS', 400))
+
+_I = re.IGNORECASE
+
+BOILERPLATE = [re.compile(padrao, _I) for padrao in (
+    r'https?://\S+|www\.\S+',
+    r'documento auxiliar d[ae] nota fiscal (?:de consumidor )?eletr[oô]nica(?: para consumidor final)?',
+    r'nfc-e n[aã]o permite aproveitamento de cr[eé]dito de icms',
+    r'(?:nfc-e )?emitida em ambiente de (?:teste|homologa[cç][aã]o)\s*-?\s*sem valor fiscal',
+    r'valor aproximado dos tributos.{0,80}?(?:r\$\s*)?\d+,\d{2}(?:\s*\(\d+,\d+%\))?(?:\s*-?\s*fonte:?\s*ibpt)?',
+    r'tributos totais incidentes.{0,60}?\d+,\d{2}',
+    r'\(?conforme lei fed(?:eral)?\.? ?12\.741/2012\)?',
+    r'consulte pela chave de acesso em',
+    r'consulta via leitor de qr ?code',
+    r'informa[cç][oõ]es complementares',
+    r'via (?:do )?(?:consumidor|estabelecimento)',
+    r'obrigad[oa]\W*(?:volte sempre\W*)?',
+    r'pdv\b.{0,40}?vers[aã]o [\d.]+',
+    r'\b(?:inscri[cç][aã]o estadual|ie)\s*:?\s*\d[\d./-]*',
+    r'protocolo de autoriza[cç][aã]o\s*:?\s*\d{15}',
+)]
+
+# Tabela de itens: do cabeçalho até o total de itens (ou o valor total)
+ITEMS_START = re.compile(
+    r'(?:###\s*)?(?:\bitem\b|\bi?c[oó]d(?:igo)?\b)[\s|]+.{0,60}?\b(?:desc(?:ri[cç][aã]o)?|ean)\b.{0,80}?\bvl\.?\s*(?:total|item)\b(?:\s*r\$)?',
+    _I,
+)
+ITEMS_END = re.compile(r'\bqtd[e.]*\s*total\s*de\s*itens|\b(?:valor|vl\.?)\s*total\b|\bsubtotal\b', _I)
+
+# Caracteres não alfanuméricos repetidos (----, ====, ....) e espaços seguidos
+REPEATED = re.compile(r'([^\w\s])\1{2,}')
+SPACES = re.compile(r'\s{2,}')
+
+DATE = r'\b\d{2}[/-]\d{2}[/-]\d{4}\b'
+FIELD_ANCHORS = {
+    "nome_emissor": None,
+    "CNPJ_emissor": r'\bcnpj\b',
+    "endereco_emissor": r'\b(?:rua|r\.|av\.?|avenida|alameda|rodovia|rod\.|travessa|estrada|pra[cç]a|cep)\s',
+    "CNPJ_CPF_consumidor": r'\bcpf\b|\bconsumidor\b',
+    "data_emissao": DATE + r'|\bemiss[aã]o\b',
+    "numero_nota_fiscal": r'\bn[uú]mero\b|\bn[º°o]\s*[:.]|\bextrato\b|\bcoo\b',
+    "serie_nota_fiscal": r'\bs[eé]rie\b',
+    "valor_total": r'\b(?:valor|vl\.?)\s*total\b|\btotal\s*(?:r\$|a pagar)',
+    "forma_pgto": r'\bforma\s*(?:de\s*)?pag|\bpagamento\b|\bdinheiro\b|\bcart[aã]o\b|\bcr[eé]dito\b|\bd[eé]bito\b|\bpix\b|\bvale\b',
+}
+# Campos que ficam no início da nota, antes do primeiro cabeçalho fiscal
+HEADER_FIELDS = ("nome_emissor", "endereco_emissor")
+HEADER_END = re.compile(r'\bdanfe\b|\bcupom fiscal\b|\bextrato\b|\bnfc-e\b', _I)
+HEADER_MAX_CHARS = 250
+
+WINDOW_BEFORE = 30
+WINDOW_AFTER = 80
+SEPARATOR = ' ... '
+
+
+def remove_items(text):
+    inicio = ITEMS_START.search(text)
+    if not inicio:
+        return text
+    fim = ITEMS_END.search(text, inicio.end())
+    if not fim:
+        return text
+    return text[:inicio.start()] + ' ' + text[fim.start():]
+
+
+def clean_text(text):
+    """Passos 1-3: sem avisos, itens, repetições e espaços extras."""
+    for padrao in BOILERPLATE:
+        text = padrao.sub(' ', text)
+    text = remove_items(text)
+    text = REPEATED.sub(r'\1', text)
+    return SPACES.sub(' ', text).strip()
+
+
+def _expand(text, inicio, fim):
+    # Estende a janela até o fim das palavras das pontas
+    while inicio > 0 and not text[inicio - 1].isspace():
+        inicio -= 1
+    while fim < len(text) and not text[fim].isspace():
+        fim += 1
+    return inicio, fim
+
+
+def anchor_windows(text, campos):
+    janelas = []
+    if any(campo in HEADER_FIELDS for campo in campos):
+        cabecalho = HEADER_END.search(text, 0, HEADER_MAX_CHARS)
+        janelas.append((0, cabecalho.start() if cabecalho and cabecalho.start() > 0 else min(len(text), HEADER_MAX_CHARS)))
+    for campo in campos:
+        padrao = FIELD_ANCHORS.get(campo)
+        if not padrao:
+            continue
+        for ancora in re.finditer(padrao, text, _I):
+            janelas.append(_expand(text, max(0, ancora.start() - WINDOW_BEFORE), min(len(text), ancora.end() + WINDOW_AFTER)))
+
+    unidas = []
+    for inicio, fim in sorted(janelas):
+        if unidas and inicio <= unidas[-1][1] + 1:
+            unidas[-1][1] = max(unidas[-1][1], fim)
+        else:
+            unidas.append([inicio, fim])
+    return unidas
+
+
+def compact_text(text, campos=None, min_chars=PROMPT_COMPACT_MIN_CHARS):
+    """Texto compactado para o prompt dos campos pedidos (todos, por padrão)."""
+    campos = campos or tuple(FIELD_ANCHORS)
+    limpo = clean_text(text)
+    if len(limpo) <= min_chars:
+        return limpo
+    janelas = anchor_windows(limpo, campos)
+    if not janelas:
+        return limpo
+    return SEPARATOR.join(limpo[inicio:fim].strip() for inicio, fim in janelas)
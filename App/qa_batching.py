@@ -0,0 +1,44 @@
+import os
+
+from batching import MicroBatcher
+
+# Limites do lote de perguntas enviadas juntas ao modelo de question-answering
+QA_BATCH_SIZE = int(os.getenv('QA_BATCH_SIZE', 32))
+QA_BATCH_WAIT = float(os.getenv('QA_BATCH_WAIT', 0.01))
+
+
+class QABatcher:
+    """Agrupa pares pergunta/contexto de requisições simultâneas em um só lote.
+
+    Cada nota envia suas perguntas individualmente; o MicroBatcher junta as
+    que chegam dentro de `max_wait` segundos (até `max_batch_size`) e o
+    pipeline roda o lote inteiro com `batch_size` igual ao tamanho do lote, no
+    dispositivo com que foi criado.
+    """
+
+    def __init__(self, qa_pipeline, max_batch_size=QA_BATCH_SIZE, max_wait=QA_BATCH_WAIT, name='qa-batcher'):
+        self.qa_pipeline = qa_pipeline
+        self._batcher = MicroBatcher(
+            self._run,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            name=name,
+        )
+
+    def _run(self, itens):
+        respostas = self.qa_pipeline(itens, batch_size=len(itens))
+        # Com uma única entrada o pipeline devolve o dicionário, sem lista
+        if isinstance(respostas, dict):
+            respostas = [respostas]
+        return respostas
+
+    def answer(self, questions, context):
+        """Respostas às perguntas sobre um mesmo contexto, na ordem das perguntas."""
+        futuros = [
+            self._batcher.submit({"question": question, "context": context})
+            for question in questions
+        ]
+        return [futuro.result() for futuro in futuros]
+
+    def stats(self):
+        return self._batcher.stats()
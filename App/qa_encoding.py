@@ -0,0 +1,207 @@
+"""Question-answering com o contexto codificado uma única vez por nota.
+
+O pipeline do Transformers tokeniza e divide em janelas o mesmo texto da nota
+para cada uma das perguntas. Aqui o texto é tokenizado e dividido em janelas
+uma vez, as perguntas são tokenizadas na carga do modelo e cada par
+(pergunta, janela) vira uma linha de um único lote para o modelo. Janelas que
+não têm nenhuma palavra-âncora do campo ("cnpj", "série", "total", ...) são
+descartadas antes da inferência; se nenhuma janela tiver âncora, todas são
+avaliadas.
+
+QA_ENCODE_CONTEXT=0 volta ao pipeline original (qa_batching.QABatcher).
+"""
+import os
+import threading
+
+from batching import MicroBatcher
+from qa_batching import QA_BATCH_SIZE, QA_BATCH_WAIT, QABatcher
+
+QA_ENCODE_CONTEXT = os.getenv('QA_ENCODE_CONTEXT', '1') != '0'
+
+# Palavras que indicam que a resposta do campo pode estar na janela (texto em
+# minúsculas, com e sem acento). None: todas as janelas podem ter a resposta
+FIELD_ANCHORS = {
+    "nome_emissor": None,
+    "CNPJ_emissor": ("cnpj",),
+    "endereco_emissor": ("rua", "r.", "av", "alameda", "al.", "rodovia", "rod.", "travessa", "endereço", "endereco", "cep"),
+    "CNPJ_CPF_consumidor": ("cpf", "consumidor"),
+    "data_emissao": ("emissão", "emissao", "data"),
+    "numero_nota_fiscal": ("número", "numero", "nº", "n°", "nfc-e", "nf-e", "nfce", "extrato", "sat", "cupom"),
+    "serie_nota_fiscal": ("série", "serie"),
+    "valor_total": ("total", "valor", "r$"),
+    "forma_pgto": ("pagamento", "pgto", "dinheiro", "cartão", "cartao", "débito", "debito", "crédito", "credito", "pix"),
+}
+
+
+class EncodedQA:
+    """Responde perguntas fixas sobre vários contextos com um lote por chamada.
+
+    `questions` mapeia cada pergunta para suas âncoras (ou None). Os
+    parâmetros de janela seguem os padrões do pipeline de question-answering
+    (384 tokens por entrada, 128 de sobreposição, respostas de até 15 tokens).
+    """
+
+    def __init__(self, model, tokenizer, questions, max_length=384, doc_stride=128,
+                 max_answer_len=15, max_pairs=32, device=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.max_answer_len = max_answer_len
+        self.max_pairs = max_pairs
+        self.device = device if device is not None else model.device
+        self.anchors = dict(questions)
+        self._questions = {question: self._encode_question(question) for question in questions}
+        self._lock = threading.Lock()
+        self.janelas_total = 0
+        self.janelas_avaliadas = 0
+
+        # Janelas de tamanho fixo, dimensionadas pela maior pergunta:
+        # [CLS] pergunta [SEP] janela [SEP]
+        maior_pergunta = max((len(ids) for ids in self._questions.values()), default=0)
+        self.window = max_length - maior_pergunta - 3
+        if self.window < 32:
+            raise ValueError(f"Perguntas longas demais para entradas de {max_length} tokens")
+        self.step = self.window - min(doc_stride, self.window // 2)
+
+    @classmethod
+    def from_pipeline(cls, qa_pipeline, questions, **kwargs):
+        return cls(qa_pipeline.model, qa_pipeline.tokenizer, questions, device=qa_pipeline.device, **kwargs)
+
+    def _encode_question(self, question):
+        return self.tokenizer(question, add_special_tokens=False)["input_ids"]
+
+    def _windows(self, ids):
+        inicio = 0
+        while True:
+            yield inicio, min(inicio + self.window, len(ids))
+            if inicio + self.window >= len(ids):
+                break
+            inicio += self.step
+
+    def _select(self, question, janelas, texto_minusculo, offsets):
+        ancoras = self.anchors.get(question)
+        if not ancoras:
+            return janelas
+        escolhidas = [
+            (inicio, fim) for inicio, fim in janelas
+            if any(ancora in texto_minusculo[offsets[inicio][0]:offsets[fim - 1][1]] for ancora in ancoras)
+        ]
+        return escolhidas or janelas
+
+    def answer_many(self, itens):
+        """Para cada (perguntas, contexto), as respostas na ordem das perguntas."""
+        import torch
+
+        pares = []  # (item, posição da pergunta, ids da pergunta, início, fim)
+        contextos = []
+        janelas_total = 0
+        for indice, (questions, context) in enumerate(itens):
+            codificado = self.tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+            ids, offsets = codificado["input_ids"], codificado["offset_mapping"]
+            contextos.append((context, ids, offsets))
+            janelas = list(self._windows(ids)) if ids else []
+            texto_minusculo = context.lower()
+            for posicao, question in enumerate(questions):
+                if question not in self._questions:
+                    self._questions[question] = self._encode_question(question)
+                janelas_total += len(janelas)
+                for inicio, fim in self._select(question, janelas, texto_minusculo, offsets):
+                    pares.append((indice, posicao, self._questions[question], inicio, fim))
+
+        melhores = {}
+        for lote in range(0, len(pares), self.max_pairs):
+            trecho = pares[lote:lote + self.max_pairs]
+            entradas = self._build_inputs(trecho, contextos)
+            with torch.no_grad():
+                saida = self.model(**entradas)
+            for linha, par in enumerate(trecho):
+                resposta = self._decode(par, contextos, saida.start_logits[linha], saida.end_logits[linha])
+                chave = (par[0], par[1])
+                if chave not in melhores or resposta["score"] > melhores[chave]["score"]:
+                    melhores[chave] = resposta
+
+        with self._lock:
+            self.janelas_total += janelas_total
+            self.janelas_avaliadas += len(pares)
+
+        vazia = {"answer": "", "score": 0.0, "start": 0, "end": 0}
+        return [
+            [melhores.get((indice, posicao), vazia) for posicao in range(len(questions))]
+            for indice, (questions, _) in enumerate(itens)
+        ]
+
+    def _build_inputs(self, pares, contextos):
+        import torch
+
+        tokenizer = self.tokenizer
+        sequencias, tipos = [], []
+        for indice, _, pergunta, inicio, fim in pares:
+            janela = contextos[indice][1][inicio:fim]
+            sequencias.append([tokenizer.cls_token_id, *pergunta, tokenizer.sep_token_id, *janela, tokenizer.sep_token_id])
+            tipos.append([0] * (len(pergunta) + 2) + [1] * (len(janela) + 1))
+
+        tamanho = max(len(sequencia) for sequencia in sequencias)
+        pad = tokenizer.pad_token_id
+        entradas = {
+            "input_ids": torch.tensor([s + [pad] * (tamanho - len(s)) for s in sequencias]),
+            "attention_mask": torch.tensor([[1] * len(s) + [0] * (tamanho - len(s)) for s in sequencias]),
+        }
+        if "token_type_ids" in tokenizer.model_input_names:
+            entradas["token_type_ids"] = torch.tensor([t + [0] * (tamanho - len(t)) for t in tipos])
+        return {nome: tensor.to(self.device) for nome, tensor in entradas.items()}
+
+    def _decode(self, par, contextos, start_logits, end_logits):
+        import torch
+
+        indice, _, pergunta, inicio, fim = par
+        context, _, offsets = contextos[indice]
+        # Apenas os tokens da janela podem ser resposta; probabilidades como no pipeline
+        primeiro = len(pergunta) + 2
+        p_inicio = torch.softmax(start_logits[primeiro:primeiro + fim - inicio].float(), dim=-1)
+        p_fim = torch.softmax(end_logits[primeiro:primeiro + fim - inicio].float(), dim=-1)
+        scores = torch.triu(torch.outer(p_inicio, p_fim))
+        scores = torch.tril(scores, diagonal=self.max_answer_len - 1)
+        melhor = int(torch.argmax(scores))
+        i, j = divmod(melhor, scores.shape[1])
+        comeco, final = offsets[inicio + i][0], offsets[inicio + j][1]
+        return {"answer": context[comeco:final], "score": float(scores[i, j]), "start": comeco, "end": final}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "janelas_total": self.janelas_total,
+                "janelas_avaliadas": self.janelas_avaliadas,
+                "janelas_descartadas": self.janelas_total - self.janelas_avaliadas,
+            }
+
+
+class EncodedQABatcher:
+    """MicroBatcher de notas na frente do EncodedQA: notas de requisições
+    simultâneas entram no mesmo lote de inferência."""
+
+    def __init__(self, encoded, max_batch_size=QA_BATCH_SIZE, max_wait=QA_BATCH_WAIT, name='qa-batcher'):
+        self.encoded = encoded
+        # Cada nota gera ao menos uma linha por pergunta; o tamanho do lote
+        # é contado em pares pergunta/contexto, como no pipeline
+        self._batcher = MicroBatcher(
+            encoded.answer_many,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            max_batch_cost=max_batch_size,
+            cost=lambda item: len(item[0]),
+            name=name,
+        )
+
+    def answer(self, questions, context):
+        return self._batcher.submit((tuple(questions), context)).result()
+
+    def stats(self):
+        return {**self._batcher.stats(), **self.encoded.stats()}
+
+
+def build_qa_engine(qa_pipeline, fields):
+    """Motor de question-answering dos extratores: `fields` mapeia campo -> pergunta."""
+    if not QA_ENCODE_CONTEXT:
+        return QABatcher(qa_pipeline)
+    questions = {pergunta: FIELD_ANCHORS.get(campo) for campo, pergunta in fields.items()}
+    return EncodedQABatcher(EncodedQA.from_pipeline(qa_pipeline, questions))
@@ -0,0 +1,80 @@
+"""Carga dos modelos de question-answering dos extratores com Transformers.
+
+QA_INFERENCE escolhe o modo de inferência:
+- "fp32": o modelo original, como publicado;
+- "int8": quantização dinâmica das camadas lineares (torch), só na CPU. Os
+  pesos do modelo convertido (state_dict) são guardados em QA_MODEL_CACHE e
+  reaproveitados nas próximas cargas, sem passar de novo pelos pesos em fp32:
+  a estrutura vem da configuração do modelo, é quantizada vazia e recebe os
+  pesos lidos com weights_only=True, sem executar código do arquivo.
+
+A diferença de latência, memória e acerto por campo entre os modos é medida
+por benchmarks/compare_qa.py.
+"""
+import logging
+import os
+
+from cache import app_path
+
+QA_INFERENCE = os.getenv('QA_INFERENCE', 'fp32')
+# Caminhos relativos partem de App/, qualquer que seja o diretório de trabalho
+QA_MODEL_CACHE = app_path(os.getenv('QA_MODEL_CACHE', os.path.join('.cache', 'qa')))
+QA_INFERENCE_MODES = ('fp32', 'int8')
+
+
+def artifact_path(model_name, mode, cache_dir=QA_MODEL_CACHE):
+    import torch
+    # A versão do torch entra no nome: o formato serializado dos módulos
+    # quantizados não é garantido entre versões
+    nome = model_name.strip('/').replace('/', '--')
+    return os.path.join(cache_dir, f"{nome}.{mode}-pesos.torch-{torch.__version__}.pt")
+
+
+def quantize_model(model):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_int8_model(model_name, cache_dir=QA_MODEL_CACHE):
+    import torch
+    from transformers import AutoConfig, AutoModelForQuestionAnswering
+
+    caminho = artifact_path(model_name, 'int8', cache_dir)
+    if os.path.exists(caminho):
+        try:
+            model = AutoModelForQuestionAnswering.from_config(AutoConfig.from_pretrained(model_name))
+            model.eval()
+            quantizado = quantize_model(model)
+            quantizado.load_state_dict(torch.load(caminho, weights_only=True))
+            return quantizado
+        except Exception as e:
+            logging.warning(f"Modelo convertido inválido em {caminho}, convertendo de novo: {e}")
+
+    model = AutoModelForQuestionAnswering.from_pretrained(model_name)
+    model.eval()
+    quantizado = quantize_model(model)
+
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    torch.save(quantizado.state_dict(), tmp)
+    os.replace(tmp, caminho)
+    logging.info(f"Modelo int8 de {model_name} salvo em {caminho}")
+    return quantizado
+
+
+def load_qa_pipeline(model_name, device='cpu', mode=QA_INFERENCE, cache_dir=QA_MODEL_CACHE):
+    """Pipeline de question-answering no modo de inferência pedido."""
+    from transformers import AutoTokenizer, pipeline
+
+    if mode not in QA_INFERENCE_MODES:
+        raise ValueError(f"QA_INFERENCE inválido: {mode} (opções: {', '.join(QA_INFERENCE_MODES)})")
+    if mode == 'int8' and str(device) != 'cpu':
+        logging.warning(f"Quantização int8 disponível apenas na CPU; usando fp32 em {device}")
+        mode = 'fp32'
+
+    if mode == 'fp32':
+        return pipeline("question-answering", model=model_name, device=device)
+
+    model = load_int8_model(model_name, cache_dir)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return pipeline("question-answering", model=model, tokenizer=tokenizer, device='cpu')
@@ -0,0 +1,34 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Limita a taxa de chamadas a `rate` por segundo, com rajadas de até `burst`.
+
+    `acquire()` bloqueia até haver ficha disponível e devolve quanto tempo,
+    em segundos, a chamada esperou.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate deve ser maior que zero")
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._fichas = self.capacity
+        self._atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, agora):
+        self._fichas = min(self.capacity, self._fichas + (agora - self._atualizado_em) * self.rate)
+        self._atualizado_em = agora
+
+    def acquire(self, fichas=1):
+        inicio = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._fichas >= fichas:
+                    self._fichas -= fichas
+                    return time.monotonic() - inicio
+                falta = (fichas - self._fichas) / self.rate
+            time.sleep(falta)
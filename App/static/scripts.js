@@ -20,7 +20,9 @@ async function process_invoice() {
     }
   
     try {
-      const response = await fetch('/api/v1/invoice', {
+      // Recebe o resultado de cada arquivo assim que ele termina (NDJSON),
+      // em vez de esperar o lote inteiro
+      const response = await fetch('/api/v1/invoice?stream=ndjson', {
         method: 'POST',
         body: formData
       });
@@ -28,8 +30,17 @@ async function process_invoice() {
         output.innerText = "Erro ao processar a imagem: " + response.statusText;
         return;
       }
-      const data = await response.json();
-      output.innerText = JSON.stringify(data, null, 2);
+      const total = fileInput.files.length;
+      const resultados = [];
+      output.innerText = `Processando... 0/${total}`;
+      await read_ndjson(response, registro => {
+        if (registro.tipo === 'resumo') {
+          render_results(output, resultados, total, registro);
+        } else {
+          resultados.push(registro);
+          render_results(output, resultados, total);
+        }
+      });
     } catch (error) {
       output.innerText = "Erro na requisição: " + error;
     } finally {
@@ -37,4 +48,36 @@ async function process_invoice() {
       button.disabled = false;
       button.style.opacity = 1;
     }
-  }
\ No newline at end of file
+  }
+
+// Lê a resposta em streaming e chama `callback` para cada linha JSON completa
+async function read_ndjson(response, callback) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { value, done } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const linhas = buffer.split('\n');
+      buffer = linhas.pop();
+      for (const linha of linhas) {
+        if (linha.trim()) {
+          callback(JSON.parse(linha));
+        }
+      }
+      if (done) {
+        if (buffer.trim()) {
+          callback(JSON.parse(buffer));
+        }
+        return;
+      }
+    }
+  }
+
+// Mostra os resultados recebidos até agora, na ordem em que chegaram
+function render_results(output, resultados, total, resumo) {
+    const cabecalho = resumo
+      ? `Concluído em ${resumo.segundos.toFixed(1)}s: ${resumo.sucesso} com sucesso, ${resumo.nulo} sem campos extraídos, ${resumo.erro} com erro`
+      : `Processando... ${resultados.length}/${total}`;
+    output.innerText = cabecalho + "\n\n" + JSON.stringify(resultados, null, 2);
+  }
@@ -0,0 +1,140 @@
+"""Modelo compacto do resultado do Textract (linhas e palavras).
+
+Os blocos da resposta são percorridos uma única vez; cada linha e palavra
+guarda apenas texto, confiança e caixa delimitadora (coordenadas relativas à
+página, como o Textract devolve).
+"""
+
+
+class Word:
+    __slots__ = ('text', 'confidence', 'left', 'top', 'width', 'height')
+
+    def __init__(self, text, confidence, left, top, width, height):
+        self.text = text
+        self.confidence = confidence
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+
+class Line:
+    __slots__ = ('text', 'confidence', 'left', 'top', 'width', 'height', 'words')
+
+    def __init__(self, text, confidence, left, top, width, height, words=()):
+        self.text = text
+        self.confidence = confidence
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.words = words
+
+
+class TextractDocument:
+    __slots__ = ('lines',)
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def text(self):
+        """Texto das linhas, uma por linha (mesmo formato usado até aqui)."""
+        if not self.lines:
+            return ""
+        return "\n".join(line.text for line in self.lines) + "\n"
+
+    def joined_text(self, separator=' '):
+        return separator.join(line.text for line in self.lines)
+
+    def line_texts(self):
+        return [line.text for line in self.lines]
+
+    def high_confidence_text(self, min_confidence=90.0, separator=' '):
+        """Apenas as palavras com confiança mínima, mantendo a ordem das linhas."""
+        return separator.join(
+            word.text
+            for line in self.lines
+            for word in line.words
+            if word.confidence >= min_confidence
+        )
+
+
+def _bounding_box(block):
+    caixa = block.get('Geometry', {}).get('BoundingBox', {})
+    return (
+        caixa.get('Left', 0.0), caixa.get('Top', 0.0),
+        caixa.get('Width', 0.0), caixa.get('Height', 0.0),
+    )
+
+
+def parse_blocks(blocks):
+    """Converte a lista `Blocks` do Textract em um TextractDocument."""
+    palavras = {}
+    linhas = []
+    for block in blocks or ():
+        tipo = block.get('BlockType')
+        if tipo == 'WORD':
+            palavras[block.get('Id')] = Word(block.get('Text', ''), block.get('Confidence', 0.0), *_bounding_box(block))
+        elif tipo == 'LINE':
+            filhos = ()
+            for relacao in block.get('Relationships', ()):
+                if relacao.get('Type') == 'CHILD':
+                    filhos = relacao.get('Ids', ())
+                    break
+            linhas.append((
+                Line(block.get('Text', ''), block.get('Confidence', 0.0), *_bounding_box(block)),
+                filhos,
+            ))
+
+    # Resolve as palavras de cada linha (no Textract elas costumam vir depois das linhas)
+    for line, filhos in linhas:
+        line.words = tuple(palavras[id_] for id_ in filhos if id_ in palavras)
+    return TextractDocument([line for line, _ in linhas])
+
+
+def parse_response(response):
+    return parse_blocks(response.get('Blocks', ()))
+
+
+class ExpenseDocument:
+    """Resultado do AnalyzeExpense: texto das linhas e campos resumidos.
+
+    Os campos resumidos ficam como dicionários simples ({"tipo", "rotulo",
+    "valor", "confianca"}) para poderem ir ao cache junto com o texto.
+    """
+    __slots__ = ('document', 'summary_fields')
+
+    def __init__(self, document, summary_fields):
+        self.document = document
+        self.summary_fields = summary_fields
+
+    def text(self):
+        return self.document.text()
+
+
+def parse_expense_response(response):
+    """Converte a resposta do AnalyzeExpense (todas as páginas) em um ExpenseDocument.
+
+    A confiança de cada campo é a menor entre a do tipo e a do valor: um
+    valor lido com clareza no tipo errado não deve passar pelo limite.
+    """
+    linhas = []
+    campos = []
+    for documento in response.get('ExpenseDocuments', ()):
+        linhas.extend(parse_blocks(documento.get('Blocks', ())).lines)
+        for campo in documento.get('SummaryFields', ()):
+            tipo = campo.get('Type', {})
+            valor = campo.get('ValueDetection', {})
+            texto = (valor.get('Text') or '').strip()
+            if not texto:
+                continue
+            campos.append({
+                "tipo": tipo.get('Text', ''),
+                "rotulo": (campo.get('LabelDetection', {}).get('Text') or '').strip() or None,
+                "valor": texto,
+                "confianca": min(tipo.get('Confidence', 0.0), valor.get('Confidence', 0.0)),
+            })
+    return ExpenseDocument(TextractDocument(linhas), campos)
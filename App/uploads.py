@@ -0,0 +1,73 @@
+import io
+import logging
+import os
+import uuid
+
+from boto3.s3.transfer import TransferConfig
+
+# O Textract aceita imagens de até 5 MB enviadas diretamente em bytes; acima
+# disso o arquivo precisa estar no S3
+TEXTRACT_INLINE_LIMIT = int(os.getenv('TEXTRACT_INLINE_LIMIT', 5 * 1024 * 1024))
+
+# Envio em partes (multipart) para arquivos grandes, direto do stream recebido
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)),
+    multipart_chunksize=int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024)),
+    max_concurrency=int(os.getenv('S3_MAX_CONCURRENCY', 4)),
+)
+
+
+def stream_size(stream):
+    """Tamanho restante do stream, sem lê-lo; None se não for possível saber."""
+    try:
+        posicao = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        tamanho = stream.tell() - posicao
+        stream.seek(posicao)
+        return tamanho
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def upload_key(digest, filename):
+    """Nome do objeto no S3 para um envio: o hash do conteúdo mais um sufixo
+    único, para que dois envios simultâneos (mesmo com o mesmo nome de
+    arquivo ou conteúdo) não sobrescrevam nem apaguem o objeto um do outro."""
+    extensao = os.path.splitext(filename or '')[1].lower()
+    return f"uploads/{digest}-{uuid.uuid4().hex[:12]}{extensao}"
+
+
+def release_document(s3_client, document):
+    """Apaga do S3 o objeto criado por prepare_document, depois do OCR."""
+    objeto = document.get('S3Object')
+    if not objeto:
+        return
+    try:
+        s3_client.delete_object(Bucket=objeto['Bucket'], Key=objeto['Name'])
+    except Exception as e:
+        logging.warning(f"Falha ao apagar {objeto['Name']} do S3: {e}")
+
+
+def upload_stream(s3_client, stream, bucket_name, object_name):
+    s3_client.upload_fileobj(stream, bucket_name, object_name, Config=TRANSFER_CONFIG)
+
+
+def prepare_document(s3_client, arquivo, bucket_name, object_name, inline_limit=TEXTRACT_INLINE_LIMIT):
+    """Monta o parâmetro `Document` do Textract para um arquivo enviado.
+
+    `arquivo` pode ser bytes ou um objeto de arquivo (como o FileStorage do
+    Flask). Arquivos até `inline_limit` vão em `Bytes`, sem passar pelo S3;
+    os maiores são enviados ao S3 em streaming, sem arquivo temporário em
+    disco, e referenciados por `S3Object`. Erros de envio são propagados.
+    """
+    if isinstance(arquivo, (bytes, bytearray)):
+        if len(arquivo) <= inline_limit:
+            return {'Bytes': bytes(arquivo)}
+        arquivo = io.BytesIO(arquivo)
+    else:
+        tamanho = stream_size(arquivo)
+        if tamanho is not None and tamanho <= inline_limit:
+            return {'Bytes': arquivo.read()}
+
+    upload_stream(s3_client, arquivo, bucket_name, object_name)
+    return {'S3Object': {'Bucket': bucket_name, 'Name': object_name}}